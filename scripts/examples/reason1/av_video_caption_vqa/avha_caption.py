@@ -56,6 +56,7 @@ from typing import Any, Optional
 
 from misc_utils import (
     get_list_of_files,
+    iterate_batches_with_timing_info,
     iterate_with_timing_info,
     read_text_file,
     run_sharded_computation,
@@ -66,6 +67,8 @@ from model_reason import LocalModel
 
 SCRIPT_DIR = Path(__file__).parent
 SEPARATOR = "-" * 20
+# Number of model batches pulled from the work queue at once when batching.
+BATCHES_PER_CALL = 4
 
 
 def open_model(model_path: str, gpu_id):
@@ -86,6 +89,7 @@ def process_videos(
     user_prompt: str,
     force_reprocess: bool = False,
     gpu_id: Optional[int] = None,
+    batch_size: int = 1,
 ):
     """Process a list of videos, and record the results.
 
@@ -97,6 +101,8 @@ def process_videos(
         user_prompt: User prompt for the model.
         force_reprocess: If true, overwrite previously computed results.
         gpu_id: The GPU on which this process is running.
+        batch_size: The number of videos per model call.  Above 1, videos are
+            loaded in the background and run through the model in batches.
 
     Returns:
        The number of processed videos.
@@ -107,12 +113,9 @@ def process_videos(
     model = open_model(model_path, gpu_id)
     model.set_system_prompt(system_prompt)
 
-    def process_video_fn(video_filename: str) -> bool:
-        # Process a single video.
-        video_path = video_dir / video_filename
-        output_path = output_dir / (video_filename + ".json")
-
+    def needs_processing(video_filename: str) -> bool:
         # Skip if already processed (unless force flag is set)
+        output_path = output_dir / (video_filename + ".json")
         if output_path.exists():
             if not force_reprocess:
                 print(f"{prefix_str}Skipping {video_filename} (already processed).")
@@ -121,15 +124,52 @@ def process_videos(
                 print(f"{prefix_str}Force re-processing {video_filename}.")
         else:
             print(f"{prefix_str}Processing {video_filename}...")
+        return True
+
+    def process_video_fn(video_filename: str) -> bool:
+        # Process a single video.
+        if not needs_processing(video_filename):
+            return False
 
+        video_path = video_dir / video_filename
+        output_path = output_dir / (video_filename + ".json")
         result = model.generate(user_prompt, video_path=video_path)
         print(f"{prefix_str}Writing result to {output_path}.")
         write_text_file(result, output_path)
         return True
 
-    totalp = iterate_with_timing_info(
-        video_list, process_video_fn, prefix_str=f"GPU {gpu_id}: "
-    )
+    def process_batch_fn(video_filenames: list[str]) -> list[Any]:
+        # Run the model on the videos which need processing, in batches, and
+        # write one output per video.
+        outcomes = [needs_processing(f) for f in video_filenames]
+        positions = [i for i, needed in enumerate(outcomes) if needed]
+        results = model.generate_batch(
+            [user_prompt] * len(positions),
+            [video_dir / video_filenames[i] for i in positions],
+            batch_size=batch_size,
+        )
+        for i, result in zip(positions, results):
+            if result is None:
+                outcomes[i] = RuntimeError(f"No model output for {video_filenames[i]}.")
+                continue
+            output_path = output_dir / (video_filenames[i] + ".json")
+            print(f"{prefix_str}Writing result to {output_path}.")
+            write_text_file(result, output_path)
+        return outcomes
+
+    if batch_size <= 1:
+        totalp = iterate_with_timing_info(
+            video_list, process_video_fn, prefix_str=f"GPU {gpu_id}: "
+        )
+    else:
+        # Pull several batches at once, to keep the loader busy while the
+        # model runs.
+        totalp = iterate_batches_with_timing_info(
+            video_list,
+            process_batch_fn,
+            batch_size * BATCHES_PER_CALL,
+            prefix_str=f"GPU {gpu_id}: ",
+        )
     return totalp
 
 
@@ -142,6 +182,7 @@ def process_fn(video_list: list[str], other_args: list[Any], shard_id: int) -> i
         system_prompt,
         user_prompt,
         force_reprocess,
+        batch_size,
     ) = other_args
 
     return process_videos(
@@ -153,6 +194,7 @@ def process_fn(video_list: list[str], other_args: list[Any], shard_id: int) -> i
         user_prompt=user_prompt,
         force_reprocess=force_reprocess,
         gpu_id=shard_id,
+        batch_size=batch_size,
     )
 
 
@@ -229,6 +271,13 @@ def main():
         help="Number of GPUs to use for parallel processing.",
     )
 
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Number of videos per model call on each GPU.",
+    )
+
     parser.add_argument(
         "--force",
         action="store_true",
@@ -288,6 +337,7 @@ def main():
         system_prompt,
         user_prompt,
         force_reprocess,
+        args.batch_size,
     )
     num_processed_results = run_sharded_computation(
         process_fn,
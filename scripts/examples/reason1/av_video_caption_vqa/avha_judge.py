@@ -24,7 +24,11 @@
 # ///
 
 import argparse
+import hashlib
 import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, Optional
 
@@ -96,6 +100,53 @@ def get_model():
     return model
 
 
+class JudgeCache:
+    """Append-only on-disk cache of judge responses, shared across runs.
+
+    Responses are keyed by (question, human answer, LLM answer, judge model),
+    so re-judging only queries the model for pairs that changed.  Several
+    shards may append to the same file.
+    """
+
+    def __init__(self, cache_file: Optional[Path]):
+        self.cache_file = cache_file
+        self.responses = {}
+        self.lock = threading.Lock()
+        if cache_file is None:
+            return
+
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        if cache_file.exists():
+            with open(cache_file, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.responses[entry["key"]] = entry["response"]
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        continue  # e.g. a line torn by a crash
+        print(f"Loaded {len(self.responses)} cached judge responses.")
+
+    @staticmethod
+    def make_key(question, answer, llm_output, judge_model: str) -> str:
+        """Return the cache key of a judge query."""
+        key_data = json.dumps(
+            [question, answer, llm_output, judge_model], sort_keys=True
+        )
+        return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            return self.responses.get(key)
+
+    def put(self, key: str, response: str):
+        with self.lock:
+            self.responses[key] = response
+            if self.cache_file is not None:
+                # One write per line, so that concurrent appends do not interleave.
+                with open(self.cache_file, "a") as f:
+                    f.write(json.dumps({"key": key, "response": response}) + "\n")
+
+
 def run_inference(model, question, answer, llm_output):
     """Prompt the model with a question, and return the response."""
     if model is None:
@@ -111,6 +162,21 @@ def run_inference(model, question, answer, llm_output):
     return response
 
 
+def run_cached_inference(
+    model, cache: Optional[JudgeCache], question, answer, llm_output
+):
+    """Like run_inference, but reuse previous responses from the cache."""
+    if model is None or cache is None:
+        return run_inference(model, question, answer, llm_output)
+
+    key = JudgeCache.make_key(question, answer, llm_output, model.model_name)
+    response = cache.get(key)
+    if response is None:
+        response = run_inference(model, question, answer, llm_output)
+        cache.put(key, response)
+    return response
+
+
 def extract_score(answer: str) -> Optional[int]:
     """Extract a score from the LLM response."""
     score = extract_tagged_text(answer, "answer", fallback="[1-5]")
@@ -157,18 +223,65 @@ def process_outputs(
     questions,
     force_reprocess: bool,
     shard_id: int,
+    cache: Optional[JudgeCache] = None,
+    max_concurrency: int = 8,
 ):
-    """Process the output for a single video, and record the results."""
+    """Process the output for a list of videos, and record the results.
+
+    The questions of up to max_concurrency videos are sent to the judge
+    concurrently, with at most max_concurrency requests in flight.
+    """
 
     all_scores = {k: [] for k in questions}
     num_json_failures = 0
+    num_judge_failures = 0  # videos with questions the judge failed to answer
     prefix = f"s{shard_id}: "
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    # Videos whose questions are being judged: (score_path, answer_scores, judged),
+    # where judged[k] = (future, human answer, LLM answer) for questions sent to the model.
+    pending_videos = deque()
 
     def update_all_scores(answer_scores):
         nonlocal all_scores
         for k in questions:
             all_scores[k].append(answer_scores[k])
 
+    def finish_oldest_video():
+        # Wait for the judge responses of the oldest pending video, and record them.
+        # This runs while a later video is being processed, so judge failures
+        # are recorded for the video they belong to instead of being raised.
+        nonlocal num_judge_failures
+        score_path, answer_scores, judged = pending_videos.popleft()
+        num_failed = 0
+        for k, (future, human_answer, llm_answer) in judged.items():
+            try:
+                result = future.result()
+                score = extract_score(result)
+            except Exception as e:
+                print(f"{prefix}Question {k}: judge failed for {score_path}: {e}")
+                result = f"Judge failed: {e}"
+                score = None
+                num_failed += 1
+            print(f"{prefix}Question {k}: {score}")
+            answer_scores[k] = {
+                "llm_answer": llm_answer,
+                "human_answer": human_answer,
+                "result": result,
+                "score": score,
+            }
+
+        if num_failed:
+            # Don't write the scores, so that the video is judged again next run.
+            print(f"{prefix}Not writing {score_path}: {num_failed} questions failed.")
+            num_judge_failures += 1
+        else:
+            # Write scores to json file.
+            print(f"{prefix}Writing scores to {score_path}.")
+            write_json_file(answer_scores, score_path)
+
+        # Keep a table of all results and scores.
+        update_all_scores(answer_scores)
+
     def process_output_fn(output_filename: str) -> bool:
         nonlocal num_json_failures
         nonlocal prefix
@@ -199,24 +312,20 @@ def process_outputs(
         gt_answer = read_json_file(answer_path)
 
         answer_scores = {}
+        judged = {}
         for k, question in questions.items():
             if k in gt_answer and k in llm_output:
                 print(f"{prefix}Question {k}: ...")
-                result = run_inference(
+                future = executor.submit(
+                    run_cached_inference,
                     model,
+                    cache,
                     question=question,
                     answer=gt_answer[k],
                     llm_output=llm_output[k],
                 )
-                # print(f"{prefix} Result = {result}")
-                score = extract_score(result)
-                print(f"{prefix}Question {k}: {score}")
-                answer_scores[k] = {
-                    "llm_answer": llm_output[k],
-                    "human_answer": gt_answer[k],
-                    "result": result,
-                    "score": score,
-                }
+                judged[k] = (future, gt_answer[k], llm_output[k])
+                answer_scores[k] = None  # Filled in once judged.
             elif k not in llm_output:
                 answer_scores[k] = {
                     "result": "No answer from LLM.",
@@ -228,20 +337,22 @@ def process_outputs(
                     "score": None,
                 }
 
-        # Write scores to json file.
-        print(f"{prefix}Writing scores to {score_path}.")
-        write_json_file(answer_scores, score_path)
-
-        # Keep a table of all results and scores.
-        update_all_scores(answer_scores)
-        # current_summary = compute_summary(all_scores)
-        # print(f"{prefix}current summary: {json.dumps(current_summary, indent=2)}")
+        # Keep enough videos in flight to use all concurrent requests.
+        pending_videos.append((score_path, answer_scores, judged))
+        while len(pending_videos) > max_concurrency:
+            finish_oldest_video()
         return True
 
-    totalp = iterate_with_timing_info(
-        output_file_list, process_output_fn, prefix_str=prefix
-    )
+    try:
+        totalp = iterate_with_timing_info(
+            output_file_list, process_output_fn, prefix_str=prefix
+        )
+        while pending_videos:
+            finish_oldest_video()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
     print(f"{prefix}Number of JSON failures: {num_json_failures}")
+    print(f"{prefix}Number of videos with judge failures: {num_judge_failures}")
     print(f"{prefix}Processed {totalp} outputs.")
     print(f"{prefix}Finished.  Collected scores:")
     for k, ss in all_scores.items():
@@ -252,10 +363,20 @@ def process_outputs(
 
 def process_fn(eval_list: list, other_args: list, shard_id: int):
     """Pickleable function which wraps process_outputs."""
-    (output_dir, answer_dir, score_dir, questions, dryrun, force_reprocess) = other_args
+    (
+        output_dir,
+        answer_dir,
+        score_dir,
+        questions,
+        dryrun,
+        force_reprocess,
+        cache_file,
+        max_concurrency,
+    ) = other_args
 
     try:
         model = get_model() if not dryrun else None
+        cache = JudgeCache(cache_file) if cache_file is not None else None
         scores = process_outputs(
             model,
             eval_list,
@@ -265,6 +386,8 @@ def process_fn(eval_list: list, other_args: list, shard_id: int):
             questions=questions,
             force_reprocess=force_reprocess,
             shard_id=shard_id,
+            cache=cache,
+            max_concurrency=max_concurrency,
         )
     except Exception as e:
         print(f"Shard {shard_id} failed with exception {e}")
@@ -314,6 +437,25 @@ def main():
         help="Number of shards to use for parallel processing.",
     )
 
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of concurrent judge requests per shard.",
+    )
+
+    parser.add_argument(
+        "--cache-file",
+        default="./cache/judge_cache.jsonl",
+        help="File caching judge responses across runs.",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write cached judge responses.",
+    )
+
     parser.add_argument(
         "--dryrun", action="store_true", help="Do a dry run (not running the model)."
     )
@@ -353,6 +495,15 @@ def main():
     print(f"Loading scoring questions from {question_file}")
     questions = read_json_file(question_file)
 
+    # Resolve file path to the judge response cache.
+    if args.no_cache:
+        cache_file = None
+    else:
+        cache_file = Path(args.cache_file)
+        if not cache_file.is_absolute():
+            cache_file = SCRIPT_DIR / cache_file
+        print(f"Judge cache file set to: {cache_file}")
+
     # Handle dry run.
     if args.dryrun:
         print("Dry run -- no model.")
@@ -364,6 +515,8 @@ def main():
         questions,
         args.dryrun,
         args.force,
+        cache_file,
+        args.max_concurrency,
     )
 
     def join_results_fn(result_list: list):
@@ -16,10 +16,13 @@
 """Miscellaneous utility functions."""
 
 import json
+import math
+import multiprocessing
 import os
+import queue
 import re
 import time
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import deque
 from pathlib import Path
 from typing import Any, Optional
 
@@ -122,7 +125,9 @@ def iterate_with_timing_info(item_list, process_fn, prefix_str: str = "") -> int
     """Iterate over the items in item_list, while tracking elapsed and predicted times.
 
     Args:
-        item_list: A list of items to process.
+        item_list: A list of items to process, or a ShardWorkQueue.  Items that
+            raise an exception while pulled from a ShardWorkQueue are reported
+            to it, so that they can be retried on another worker.
 
         process_fn: A function to run on each item.  f(item) -> bool
             Returns true if the item was processed successfully;
@@ -138,12 +143,21 @@ def iterate_with_timing_info(item_list, process_fn, prefix_str: str = "") -> int
     total_num = len(item_list)
     total_processed = 0  # number of videos that we've run the model on
     total_elapsed_time = 0.0
+    is_work_queue = isinstance(item_list, ShardWorkQueue)
 
     for i, item in enumerate(item_list):
         start_time = time.time()
 
         print(f"{prefix_str}Processing {i}/{total_num}.")
-        success = process_fn(item)
+        if is_work_queue:
+            try:
+                success = process_fn(item)
+            except Exception as e:
+                print(f"{prefix_str}Failed to process item {item}: {e}")
+                item_list.task_failed(e)
+                continue
+        else:
+            success = process_fn(item)
         if not success:
             continue  # Don't record timing for failed or skipped items.
 
@@ -160,7 +174,98 @@ def iterate_with_timing_info(item_list, process_fn, prefix_str: str = "") -> int
         )
 
         # Calculate remaining time.
-        remaining_items = total_num - i - 1
+        if is_work_queue:
+            remaining_items = item_list.num_remaining
+        else:
+            remaining_items = total_num - i - 1
+        time_remaining = average_elapsed_time * remaining_items / 3600
+        print(
+            f"{prefix_str}Remaining: {remaining_items}; remaining time: {time_remaining:.2f} hours."
+        )
+
+    print(f"{prefix_str}Processed {total_processed} items.")
+    return total_processed
+
+
+def iterate_batches_with_timing_info(
+    item_list, process_batch_fn, batch_size: int, prefix_str: str = ""
+) -> int:
+    """Like iterate_with_timing_info, but process the items in batches.
+
+    Args:
+        item_list: A list of items to process, or a ShardWorkQueue.  Batches
+            are pulled from a ShardWorkQueue as a whole, and every item of the
+            batch is reported to it once the batch has been processed.
+
+        process_batch_fn: A function to run on each batch of items.
+            f(items) -> list of outcomes, one per item.  The outcome of an item
+            is true if it was processed successfully, false if it was skipped,
+            or the exception which made it fail.  If the function raises an
+            exception, every item of the batch failed.
+
+        batch_size: The maximum number of items per batch.
+
+        prefix_str: A string to prefix log messages.
+
+    Returns:
+        The number of items processed, ignoring skipped and failed items.
+    """
+
+    total_num = len(item_list)
+    total_processed = 0  # number of items that we've run the model on
+    total_seen = 0
+    total_elapsed_time = 0.0
+    is_work_queue = isinstance(item_list, ShardWorkQueue)
+
+    if is_work_queue:
+        batches = item_list.batches(batch_size)
+    else:
+        batches = (
+            item_list[i : i + batch_size] for i in range(0, total_num, batch_size)
+        )
+
+    for batch in batches:
+        start_time = time.time()
+
+        print(
+            f"{prefix_str}Processing {total_seen}-{total_seen + len(batch)}/{total_num}."
+        )
+        total_seen += len(batch)
+        try:
+            outcomes = process_batch_fn(batch)
+        except Exception as e:
+            outcomes = [e] * len(batch)
+
+        num_processed = 0
+        for position, (item, outcome) in enumerate(zip(batch, outcomes)):
+            if isinstance(outcome, Exception):
+                print(f"{prefix_str}Failed to process item {item}: {outcome}")
+                if is_work_queue:
+                    item_list.task_failed(outcome, position)
+                continue
+            if is_work_queue:
+                item_list.task_done(position)
+            if outcome:
+                num_processed += 1
+        if num_processed == 0:
+            continue  # Don't record timing for failed or skipped batches.
+
+        # Calculate and display processing times
+        elapsed_time = time.time() - start_time
+        total_processed += num_processed
+        total_elapsed_time += elapsed_time
+        average_elapsed_time = total_elapsed_time / total_processed
+        print(
+            f"{prefix_str}Elapsed time: {elapsed_time:.2f} secs for {num_processed} items;"
+            f" total time: {total_elapsed_time:.2f} secs;"
+            f" average time: {average_elapsed_time:.2f} secs/item"
+        )
+
+        # Calculate remaining time.
+        if is_work_queue:
+            remaining_items = item_list.num_remaining
+        else:
+            remaining_items = total_num - total_seen
         time_remaining = average_elapsed_time * remaining_items / 3600
         print(
             f"{prefix_str}Remaining: {remaining_items}; remaining time: {time_remaining:.2f} hours."
@@ -210,25 +315,125 @@ def split_data_into_shards(input_data: list, num_shards: int) -> list[list]:
     return buckets
 
 
+class ShardWorkQueue:
+    """The inputs of one worker in run_sharded_computation.
+
+    Items are pulled from a dispatcher shared by all workers, one at a time or
+    in batches, so a worker that finishes early takes over work that would
+    otherwise wait for a slow one.  Pulling the next item or batch reports the
+    items in flight which were not reported yet as done.
+    """
+
+    def __init__(self, worker_id: int, total: int, inbox, events):
+        self.worker_id = worker_id
+        self.total = total
+        self.num_remaining = total
+        self._inbox = inbox
+        self._events = events
+        self._in_flight = []  # indices of the items in flight, None once reported
+        self._start_time = None  # time at which the items in flight were received
+
+    def __len__(self) -> int:
+        return self.total
+
+    def __iter__(self):
+        for batch in self.batches(1):
+            yield batch[0]
+
+    def batches(self, batch_size: int):
+        """Iterate over lists of up to batch_size items."""
+        while True:
+            self.task_done()
+            self._events.put(("request", self.worker_id, batch_size))
+            task = self._inbox.get()
+            if task is None:
+                return
+            tasks, num_pending, num_workers = task
+            self.num_remaining = math.ceil(num_pending / num_workers)
+            self._in_flight = [index for index, _ in tasks]
+            self._start_time = time.time()
+            yield [item for _, item in tasks]
+
+    def _report(self, position: Optional[int], make_event):
+        # Report the items in flight, or only the one at `position`.
+        if not self._in_flight:
+            return
+        positions = range(len(self._in_flight)) if position is None else [position]
+        # Items of a batch are processed together, so they share its time.
+        elapsed = (time.time() - self._start_time) / max(len(self._in_flight), 1)
+        for p in positions:
+            index = self._in_flight[p]
+            if index is not None:
+                self._events.put(make_event(index, elapsed))
+                self._in_flight[p] = None
+
+    def task_done(self, position: Optional[int] = None):
+        """Report the items in flight as processed.
+
+        Args:
+            position: If given, only report the item at this position in the
+                current batch.
+        """
+        self._report(
+            position, lambda index, elapsed: ("done", self.worker_id, index, elapsed)
+        )
+
+    def task_failed(self, error: Exception, position: Optional[int] = None):
+        """Report the items in flight as failed, so that another worker retries them.
+
+        Args:
+            error: The exception raised while processing the items.
+            position: If given, only report the item at this position in the
+                current batch.
+        """
+        self._report(
+            position,
+            lambda index, elapsed: ("failed", self.worker_id, index, repr(error)),
+        )
+
+
+def _run_shard_worker(computation_fn, other_args, worker_id, total, inbox, events):
+    """Worker process of run_sharded_computation."""
+    work_queue = ShardWorkQueue(worker_id, total, inbox, events)
+    try:
+        result = computation_fn(work_queue, other_args, shard_id=worker_id)
+    except Exception as e:
+        print(f"Shard {worker_id} encountered error: {e}")
+        work_queue.task_failed(e)
+        events.put(("exit", worker_id, None, repr(e)))
+        return
+    # computation_fn may stop iterating before the queue is exhausted
+    work_queue.task_done()
+    events.put(("exit", worker_id, result, None))
+
+
 def run_sharded_computation(
     computation_fn,
     result_join_fn,
     input_data: list[Any],
     other_args: list[Any],
     num_shards: int,
+    max_retries: int = 2,
 ) -> Any:
     """Run multiple copies of computation_fn in parallel, and join the results.
 
+    Each copy runs in a persistent worker process, and pulls its inputs one at
+    a time or in small batches from a shared work queue (see ShardWorkQueue),
+    so that workers stay busy even if the cost of items varies widely.  Items which fail on one
+    worker are retried on another one.
+
     Args:
         computation_fn:  A function which takes a list of inputs, and returns a result.
             f(input_list, other_args, shard_id: int) -> result.
+            When running in parallel, input_list is a ShardWorkQueue.
 
         result_join_fn:  A function to combine results.
             f(list_of_results) -> result
 
-        input_data: A list of inputs, which will be sharded into smaller lists.
+        input_data: A list of inputs, which will be distributed across the workers.
         other_args: Additional arguments to pass as 'other_args' to computation_fn.
         num_shards: The number of parallel processes.
+        max_retries: The number of times a failed item is retried on other workers.
 
     Returns:
         The result of running computations in parallel, and joining the results.
@@ -238,23 +443,144 @@ def run_sharded_computation(
         result = computation_fn(input_data, other_args, shard_id=0)
         return result
 
-    # Otherwise divide work across multiple shards
-    sharded_inputs = split_data_into_shards(input_data, num_shards)
+    # Otherwise distribute work dynamically across multiple workers
+    print(f"Total number of items: {len(input_data)}")
+    total = len(input_data)
+    pending = deque(range(total))  # indices of items waiting for a worker
+    attempts = [0] * total
+    excluded = [set() for _ in range(total)]  # workers on which an item failed
+    in_flight = {i: set() for i in range(num_shards)}  # worker id -> indices
+    waiting = deque()  # workers waiting for an item they are allowed to take
+    requested = {}  # worker id -> number of items it asked for
+    failed_items = {}  # index -> last error, for items which exhausted retries
     shard_results = [None for i in range(0, num_shards)]
 
-    with ProcessPoolExecutor(max_workers=num_shards) as executor:
-        future_to_shard_id = {
-            executor.submit(computation_fn, sh_inputs, other_args, shard_id=i): i
-            for (i, sh_inputs) in enumerate(sharded_inputs)
-        }
-        for future in as_completed(future_to_shard_id):
-            shard_id = future_to_shard_id[future]
-            try:
-                sh_result = future.result()
-                print(f"Shard {shard_id} completed processing of outputs.")
-                shard_results[shard_id] = sh_result
-            except Exception as e:
-                print(f"Shard {shard_id} encountered error: {e}")
+    stats = {
+        i: {"done": 0, "failed": 0, "busy": 0.0, "start": time.time(), "end": None}
+        for i in range(num_shards)
+    }
+
+    ctx = multiprocessing.get_context()
+    events = ctx.Queue()
+    inboxes = [ctx.Queue() for _ in range(num_shards)]
+    workers = {
+        i: ctx.Process(
+            target=_run_shard_worker,
+            args=(computation_fn, other_args, i, total, inboxes[i], events),
+        )
+        for i in range(num_shards)
+    }
+    for worker in workers.values():
+        worker.start()
+    alive = set(workers)
+
+    def give_up(index, error):
+        print(f"Giving up on item {input_data[index]}: {error}")
+        failed_items[index] = error
+
+    def requeue(index, worker_id, error):
+        # Retry a failed item on another worker, if possible.
+        attempts[index] += 1
+        excluded[index].add(worker_id)
+        if attempts[index] > max_retries:
+            give_up(index, error)
+        else:
+            print(
+                f"Retrying item {input_data[index]} on another worker "
+                f"(attempt {attempts[index] + 1})."
+            )
+            pending.appendleft(index)
+
+    def dispatch():
+        # Hand out pending items to waiting workers, and stop idle workers once
+        # no work can be left for them.
+        for index in list(pending):
+            if alive <= excluded[index]:
+                pending.remove(index)
+                give_up(index, "failed on all workers")
+        for _ in range(len(waiting)):
+            worker_id = waiting.popleft()
+            indices = [j for j in pending if worker_id not in excluded[j]]
+            indices = indices[: requested[worker_id]]
+            if indices:
+                for index in indices:
+                    pending.remove(index)
+                in_flight[worker_id].update(indices)
+                inboxes[worker_id].put(
+                    (
+                        [(index, input_data[index]) for index in indices],
+                        len(pending),
+                        len(alive),
+                    )
+                )
+            elif pending or any(in_flight.values()):
+                # An item in flight may still fail and need this worker.
+                waiting.append(worker_id)
+            else:
+                inboxes[worker_id].put(None)
+
+    def worker_exited(worker_id):
+        alive.discard(worker_id)
+        stats[worker_id]["end"] = time.time()
+        if worker_id in waiting:
+            waiting.remove(worker_id)
+        # requeue puts items at the front, so this keeps them in order.
+        for index in sorted(in_flight[worker_id], reverse=True):
+            requeue(index, worker_id, "worker exited")
+        in_flight[worker_id].clear()
+
+    while alive:
+        try:
+            event = events.get(timeout=1.0)
+        except queue.Empty:
+            # Detect workers which died without reporting, e.g. killed by the OS.
+            for worker_id in list(alive):
+                if not workers[worker_id].is_alive():
+                    print(f"Shard {worker_id} exited unexpectedly.")
+                    worker_exited(worker_id)
+            dispatch()
+            continue
+
+        kind, worker_id = event[0], event[1]
+        if kind == "request":
+            _, _, requested[worker_id] = event
+            waiting.append(worker_id)
+        elif kind == "done":
+            _, _, index, elapsed = event
+            in_flight[worker_id].discard(index)
+            stats[worker_id]["done"] += 1
+            stats[worker_id]["busy"] += elapsed
+        elif kind == "failed":
+            _, _, index, error = event
+            in_flight[worker_id].discard(index)
+            stats[worker_id]["failed"] += 1
+            requeue(index, worker_id, error)
+        elif kind == "exit":
+            _, _, result, error = event
+            if error is None:
+                print(f"Shard {worker_id} completed processing of outputs.")
+                shard_results[worker_id] = result
+            worker_exited(worker_id)
+        dispatch()
+
+    for worker in workers.values():
+        worker.join()
+
+    # Items which could not be handed to any worker
+    for index in pending:
+        give_up(index, "no worker left")
+
+    print("Per-worker throughput:")
+    for worker_id, st in stats.items():
+        wall_time = (st["end"] or time.time()) - st["start"]
+        rate = 60.0 * st["done"] / wall_time if wall_time > 0 else 0.0
+        utilization = st["busy"] / wall_time if wall_time > 0 else 0.0
+        print(
+            f"  Shard {worker_id}: {st['done']} items, {st['failed']} failures, "
+            f"{rate:.2f} items/min, {utilization:.0%} busy."
+        )
+    if failed_items:
+        print(f"{len(failed_items)} items failed on every attempt.")
 
     print("All shards have finished.  Joining results:")
     final_result = result_join_fn(shard_results)
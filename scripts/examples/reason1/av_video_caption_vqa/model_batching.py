@@ -0,0 +1,118 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Batched generation shared by the local model wrappers."""
+
+import queue
+import threading
+from typing import Any, Optional
+
+
+class BatchGenerationMixin:
+    """Adds generate_batch to a local model wrapper.
+
+    The wrapper must provide `model` and `gpu_id` attributes, a `generate`
+    method, and the two steps of a query: `_prepare_inputs(prompt, video_path)`
+    builds the inputs of one query and loads its video, and
+    `_generate_prepared(prepared)` runs the model on a batch of them.
+    """
+
+    def generate_batch(
+        self,
+        prompts: list[str],
+        video_paths: list[Any],
+        batch_size: int = 4,
+        bucket_batches: int = 2,
+    ) -> list[Optional[str]]:
+        """Query the model with several prompts and videos, in batches.
+
+        Videos are loaded by a background thread while the model runs on the
+        previous batch.  Every `batch_size * bucket_batches` loaded videos are
+        sorted by size before being split into batches, so that videos of
+        similar length are padded together.
+
+        Args:
+            prompts: The user prompts, one per video.
+            video_paths: The paths to the videos.
+            batch_size: The number of videos per call to model.generate.
+            bucket_batches: The number of batches sorted by length together.
+
+        Returns:
+            The model responses, in the same order as the inputs.  The response
+            is None if the video could not be loaded, or if the model failed on
+            its batch.
+        """
+
+        gpu_id = str(self.gpu_id) if self.gpu_id is not None else ""
+        if self.model is None:
+            # dry run for testing purposes
+            return [self.generate(p, v) for p, v in zip(prompts, video_paths)]
+
+        results = [None] * len(prompts)
+        bucket_size = batch_size * bucket_batches
+        prepared_queue = queue.Queue(maxsize=bucket_size)
+        stop = threading.Event()
+
+        def prepare_all():
+            # Load the videos in order, and hand them over to the main thread.
+            for index, (prompt, video_path) in enumerate(zip(prompts, video_paths)):
+                if stop.is_set():
+                    break
+                print(f"Processing video {video_path} on GPU {gpu_id}")
+                try:
+                    prepared = self._prepare_inputs(prompt, video_path)
+                except Exception as e:
+                    print(f"Failed to load video {video_path}: {e}")
+                    prepared = None
+                prepared_queue.put((index, prepared))
+            prepared_queue.put(None)
+
+        prefetch_thread = threading.Thread(target=prepare_all, daemon=True)
+        prefetch_thread.start()
+        try:
+            done = False
+            while not done:
+                # Collect a bucket of loaded videos.
+                bucket = []
+                while len(bucket) < bucket_size:
+                    item = prepared_queue.get()
+                    if item is None:
+                        done = True
+                        break
+                    if item[1] is not None:
+                        bucket.append(item)
+
+                # Batch videos of similar size together.
+                bucket.sort(key=lambda item: item[1]["size"])
+                for b in range(0, len(bucket), batch_size):
+                    batch = bucket[b : b + batch_size]
+                    try:
+                        outputs = self._generate_prepared([p for _, p in batch])
+                    except Exception as e:
+                        print(f"Failed to run the model on GPU {gpu_id}: {e}")
+                        continue
+                    for (index, _), output in zip(batch, outputs):
+                        results[index] = output
+        finally:
+            stop.set()
+            # Unblock the loader thread if it is waiting for space in the queue.
+            while prefetch_thread.is_alive():
+                try:
+                    prepared_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            prefetch_thread.join()
+
+        return results
@@ -16,10 +16,56 @@
 """Convenient wrapper class to run ChatGPT5 via API call."""
 
 import os
+import random
+import threading
 import time
 import uuid
 
-from openai import OpenAI
+from openai import OpenAI, RateLimitError
+
+
+class AdaptiveBackoff:
+    """Request pacing shared by all threads using a model.
+
+    Rate-limit errors double a shared delay, and pause all requests for that
+    long (or for the server's retry-after hint); successful requests halve it.
+    """
+
+    def __init__(self, initial_delay: float = 1.0, max_delay: float = 60.0):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self.resume_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Block until requests may be sent."""
+        while True:
+            with self.lock:
+                remaining = self.resume_time - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def on_rate_limit(self, retry_after: float = 0.0):
+        """Back off after a rate-limit error."""
+        with self.lock:
+            self.delay = min(self.max_delay, max(self.initial_delay, 2 * self.delay))
+            pause = max(retry_after, self.delay * random.uniform(0.5, 1.0))
+            self.resume_time = max(self.resume_time, time.monotonic() + pause)
+
+    def on_success(self):
+        """Speed up again after a successful request."""
+        with self.lock:
+            self.delay = self.delay / 2 if self.delay > self.initial_delay else 0.0
+
+
+def get_retry_after(error: RateLimitError) -> float:
+    """Return the retry-after hint of a rate-limit error in seconds, or 0."""
+    try:
+        return float(error.response.headers.get("retry-after", 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
 
 
 class OpenAIModel:
@@ -29,7 +75,7 @@ class OpenAIModel:
     this simple interface.
     """
 
-    def __init__(self):
+    def __init__(self, model_name: str = "gpt-5", max_retries: int = 60):
         # Get the bearer token from the OPENAI_API_KEY environment variable.
         bearer_token = os.getenv("OPENAI_API_KEY")
         if not bearer_token:
@@ -47,16 +93,19 @@ class OpenAIModel:
         )
         self.system_prompt = ""
         self.client = client
+        self.model_name = model_name
+        self.max_retries = max_retries
+        # Shared by all threads calling generate() concurrently.
+        self.backoff = AdaptiveBackoff()
 
     def set_system_prompt(self, s: str):
         """Set the system prompt to use for requests."""
         self.system_prompt = s
 
     def generate(self, prompt: str) -> str:
-        """Query the model."""
+        """Query the model.  Safe to call from several threads at once."""
 
         print("Querying LLM...")
-        time.sleep(0.1)  # Keep us under the query limit.
         messages = []
         if self.system_prompt:
             messages.append(
@@ -76,20 +125,30 @@ class OpenAIModel:
         retry_count = 0
         response = None
         while response is None:
+            self.backoff.wait()
             try:
                 response = self.client.chat.completions.create(
-                    model="gpt-5",
+                    model=self.model_name,
                     messages=messages,
                 )
+                self.backoff.on_success()
                 break
+            except RateLimitError as e:
+                print(f"ERROR: Call to model was rate limited: {e}")
+                if retry_count >= self.max_retries:
+                    raise
+                retry_count += 1
+                self.backoff.on_rate_limit(get_retry_after(e))
+                print(f"Retrying... count = {retry_count}.")
             except Exception as e:
                 print(f"ERROR: Call to model failed with exception {e}")
                 print(f"{prompt=}")
-                if retry_count > 60:
+                if retry_count >= self.max_retries:
                     raise
                 retry_count += 1
                 print(f"Retrying... count = {retry_count}.")
-                time.sleep(10)
+                # Exponential backoff with jitter, up to 10 seconds.
+                time.sleep(random.uniform(0, min(10.0, 0.5 * 2**retry_count)))
 
         response_text = response.choices[0].message.content
         return response_text
@@ -20,15 +20,18 @@ from typing import Any, Optional
 import qwen_vl_utils
 import torch
 import transformers
+from model_batching import BatchGenerationMixin
 
 FPS = 2
 # Max pixels per frame for Qwen models
 # Default patch size is 28 x 28 -- maintain 16:9 aspect ratio.
 # +1 to account for floating point error.
 MAX_PIXELS = (16 * 9 * 32 * 32) + 1
+# Response returned in dry run mode.
+DRYRUN_RESPONSE = '```json\n{\n  "weather": "meatballs"\n}\n```'
 
 
-class LocalModelQwen3:
+class LocalModelQwen3(BatchGenerationMixin):
     """A thin wrapper class around a local instance of the Qwen3 model.
 
     Other models can be used by overriding this simple API.
@@ -78,6 +81,8 @@ class LocalModelQwen3:
             # )
             # The processor is a transformers.Qwen2_5_VLProcessor
             self.processor = transformers.AutoProcessor.from_pretrained(model_path)
+            # Batched generation needs the prompts padded on the left.
+            self.processor.tokenizer.padding_side = "left"
             print(f"Model loaded successfully on GPU {gpu_id}")
         except Exception as e:
             print(f"Error loading model on GPU {gpu_id}: {e}")
@@ -100,12 +105,19 @@ class LocalModelQwen3:
 
         gpu_id = str(self.gpu_id) if self.gpu_id is not None else ""
         if video_path is not None:
-            video_path = str(video_path)  # Convert to string... may be a Path object.
             print(f"Processing video {video_path} on GPU {gpu_id}")
 
         if self.model is None:
             # dry run for testing purposes
-            return '```json\n{\n  "weather": "meatballs"\n}\n```'
+            return DRYRUN_RESPONSE
+
+        return self._generate_prepared([self._prepare_inputs(prompt, video_path)])[0]
+
+    def _prepare_inputs(self, prompt: str, video_path: Any) -> dict[str, Any]:
+        """Build the text prompt and load the video for one query."""
+
+        if video_path is not None:
+            video_path = str(video_path)  # Convert to string... may be a Path object.
 
         content = []
         # Add video path if available.
@@ -160,14 +172,38 @@ class LocalModelQwen3:
         # print(f"{video_kwargs=}")
         # print(f"{video_metadata=}")
 
+        return {
+            "text": text_prompt,
+            "images": image_inputs or [],
+            "videos": video_inputs or [],
+            "video_metadata": video_metadata or [],
+            "video_kwargs": video_kwargs,
+            # Number of pixels across all frames, a proxy for the number of tokens.
+            "size": sum(v.numel() for v in (video_inputs or [])),
+        }
+
+    def _generate_prepared(self, prepared: list[dict[str, Any]]) -> list[str]:
+        """Run the model on a batch of prepared inputs."""
+
+        images = [image for p in prepared for image in p["images"]]
+        videos = [video for p in prepared for video in p["videos"]]
+        video_metadata = [m for p in prepared for m in p["video_metadata"]]
+        # Per-video kwargs (e.g. fps) are lists, concatenate them across the batch.
+        video_kwargs = {}
+        for p in prepared:
+            for k, v in p["video_kwargs"].items():
+                if isinstance(v, list):
+                    video_kwargs.setdefault(k, []).extend(v)
+                else:
+                    video_kwargs.setdefault(k, v)
+
         # Process the prompt (tokenize, combine with videos).
         inputs = self.processor(
-            text=[text_prompt],
-            images=image_inputs,
-            videos=video_inputs,
-            video_metadata=video_metadata,
-            # do_resize=False,
-            # padding=True,
+            text=[p["text"] for p in prepared],
+            images=images or None,
+            videos=videos or None,
+            video_metadata=video_metadata or None,
+            padding=True,
             return_tensors="pt",
             **video_kwargs,
         )
@@ -194,5 +230,4 @@ class LocalModelQwen3:
             skip_special_tokens=True,
             clean_up_tokenization_spaces=False,
         )
-        result_text = output_text[0].strip()
-        return result_text
+        return [text.strip() for text in output_text]
@@ -0,0 +1,198 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import json
+import logging as log
+import os
+import sqlite3
+import time
+
+# File name of the task queue in the results directory
+TASK_QUEUE_FNAME = "task_queue.sqlite"
+
+_CREATE_GROUPS_TABLE = """
+CREATE TABLE IF NOT EXISTS task_groups (
+    group_key TEXT PRIMARY KEY,
+    task_ids TEXT NOT NULL,
+    cost REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+class LeaseTaskQueue:
+    """
+    Queue of task groups shared by the evaluation workers through a SQLite file.
+
+    Workers lease groups of tasks for a limited time and mark them done once their
+    results are stored. The leases of a worker that crashes or is preempted expire
+    and its groups are handed out again, while groups that are done are skipped
+    when a run is resumed. A group whose lease expired `max_attempts` times is
+    abandoned so that it cannot take down every worker in turn.
+
+    The file must be on a filesystem with working file locks, e.g. a local disk
+    shared by all workers of a node.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3, timeout: float = 600.0):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_attempts = max_attempts
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self._conn.execute(_CREATE_GROUPS_TABLE)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Runs a write transaction that holds the database lock from the start."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def is_populated(self) -> bool:
+        return (
+            self._conn.execute("SELECT 1 FROM task_groups LIMIT 1").fetchone()
+            is not None
+        )
+
+    def populate(self, groups: list[tuple[str, list[str], float]]):
+        """
+        Adds task groups to the queue. Groups that already exist are left unchanged,
+        so every worker may populate the queue with the same groups.
+
+        Args:
+            groups: A list of (group key, task IDs, estimated cost) tuples.
+        """
+        with self._transaction():
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO task_groups (group_key, task_ids, cost) "
+                "VALUES (?, ?, ?)",
+                [
+                    (group_key, json.dumps(task_ids), cost)
+                    for group_key, task_ids, cost in groups
+                ],
+            )
+
+    def lease(
+        self, owner: str, max_cost: float, lease_seconds: float
+    ) -> list[tuple[str, list[str]]]:
+        """
+        Leases task groups with a total estimated cost of up to `max_cost`.
+
+        The most expensive available groups are handed out first and smaller
+        groups fill up the rest of the budget, so that all workers finish at about
+        the same time. At least one group is leased if any is available, even if
+        it exceeds the budget on its own.
+
+        Args:
+            owner: The ID of the leasing worker.
+            max_cost: The cost budget of the lease.
+            lease_seconds: Time after which the groups are handed out again unless
+                           they are completed or the lease is renewed.
+
+        Returns:
+            A list of (group key, task IDs) tuples, empty if no group is available.
+        """
+        now = time.time()
+        leased = []
+        total_cost = 0.0
+        with self._transaction():
+            rows = self._conn.execute(
+                "SELECT group_key, task_ids, cost FROM task_groups "
+                "WHERE status = 'pending' "
+                "OR (status = 'leased' AND lease_expires < ? AND attempts < ?) "
+                "ORDER BY cost DESC, rowid",
+                (now, self.max_attempts),
+            ).fetchall()
+            for group_key, task_ids, cost in rows:
+                if leased and total_cost + cost > max_cost:
+                    continue
+                leased.append((group_key, json.loads(task_ids)))
+                total_cost += cost
+                if total_cost >= max_cost:
+                    break
+            self._conn.executemany(
+                "UPDATE task_groups SET status = 'leased', owner = ?, "
+                "lease_expires = ?, attempts = attempts + 1 WHERE group_key = ?",
+                [(owner, now + lease_seconds, group_key) for group_key, _ in leased],
+            )
+        return leased
+
+    def renew(self, owner: str, group_keys: list[str], lease_seconds: float) -> int:
+        """
+        Extends the leases of `owner` on the given groups.
+
+        Returns:
+            The number of groups still leased by `owner`.
+        """
+        expires = time.time() + lease_seconds
+        with self._transaction():
+            renewed = self._conn.executemany(
+                "UPDATE task_groups SET lease_expires = ? "
+                "WHERE group_key = ? AND owner = ? AND status = 'leased'",
+                [(expires, group_key, owner) for group_key in group_keys],
+            ).rowcount
+        if renewed < len(group_keys):
+            log.warning(
+                f"Worker {owner} lost the lease on {len(group_keys) - renewed} task groups; "
+                "their results may be stored twice and are deduplicated when merging."
+            )
+        return renewed
+
+    def complete(self, group_keys: list[str]):
+        """Marks task groups as done. Their results must be stored beforehand."""
+        with self._transaction():
+            self._conn.executemany(
+                "UPDATE task_groups SET status = 'done', lease_expires = NULL "
+                "WHERE group_key = ?",
+                [(group_key,) for group_key in group_keys],
+            )
+
+    def num_unfinished(self) -> int:
+        """
+        Counts the groups that are neither done nor abandoned, including groups
+        currently leased by other workers.
+        """
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM task_groups WHERE status = 'pending' "
+            "OR (status = 'leased' AND (lease_expires >= ? OR attempts < ?))",
+            (time.time(), self.max_attempts),
+        ).fetchone()[0]
+
+    def abandoned_task_ids(self) -> list[str]:
+        """Returns the task IDs of the groups abandoned after `max_attempts` leases."""
+        rows = self._conn.execute(
+            "SELECT task_ids FROM task_groups "
+            "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (time.time(), self.max_attempts),
+        ).fetchall()
+        return [task_id for (task_ids,) in rows for task_id in json.loads(task_ids)]
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -22,15 +22,19 @@ The script now includes SOM prompt functionality to add additional context durin
 
 Usage:
     python data_preprocess.py --input_file /path/to/train.json --output_file /path/to/output/train_llava.json --samples_per_category 20000
+    python data_preprocess.py --input_file /path/to/train.json --output_file /path/to/output/train_llava.jsonl --output_format jsonl --single_pass
     python data_preprocess.py --input_file /path/to/train.json --output_file /path/to/output/train_llava.json --som_prompt "Custom SOM prompt text"
 """
 
 import argparse
+import functools
 import json
+import math
 import os
 import random
 import re
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Any, Dict, Iterator, List, Optional
 
@@ -327,6 +331,120 @@ def collect_entries_by_category_streaming(
     return dict(category_entries)
 
 
+class RunningStats:
+    """Streaming count, mean, (population) std, min and max using Welford's algorithm."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+
+class ReservoirSampler:
+    """Uniform random sample of a stream, keeping at most `capacity` items (Algorithm R)."""
+
+    def __init__(self, capacity: Optional[int]):
+        self.capacity = capacity
+        self.items = []
+        self.seen = 0
+
+    def add(self, item: Any) -> None:
+        self.seen += 1
+        if self.capacity is None or len(self.items) < self.capacity:
+            self.items.append(item)
+        else:
+            index = random.randrange(self.seen)
+            if index < self.capacity:
+                self.items[index] = item
+
+
+def sample_entries_by_category_streaming(
+    file_path: str,
+    target_categories: Optional[List[str]] = None,
+    samples_per_category: Optional[int] = None,
+) -> tuple[Dict[str, Any], Dict[str, List[Dict[str, Any]]]]:
+    """Compute category statistics and sample entries per category in a single pass.
+
+    Each category keeps a reservoir of `samples_per_category` entries, so the
+    sample is uniform over the whole file and memory is bounded by the sample
+    size.  Statistics of numerical answers are accumulated on the fly.
+
+    Returns:
+        The category statistics, in the format of analyze_data_distribution_streaming,
+        and the sampled entries of each category (all entries if samples_per_category is None)
+    """
+    print("Analyzing and sampling data in a single streaming pass...")
+
+    category_counts = defaultdict(int)
+    category_answer_stats = defaultdict(RunningStats)
+    category_samples = defaultdict(lambda: ReservoirSampler(samples_per_category))
+    total_entries = 0
+
+    for entry in load_json_streaming(file_path):
+        total_entries += 1
+
+        category = entry.get("category", "unknown")
+
+        # Filter by target categories if specified
+        if target_categories is not None and category not in target_categories:
+            continue
+
+        category_counts[category] += 1
+        category_samples[category].add(entry)
+
+        normalized_answer = entry.get("normalized_answer")
+        if normalized_answer is not None:
+            try:
+                # Convert to float if possible
+                category_answer_stats[category].update(float(normalized_answer))
+            except (ValueError, TypeError):
+                pass
+
+    print(f"Analyzed {total_entries} total entries")
+
+    # Calculate statistics for each category
+    category_stats = {}
+    for category, count in category_counts.items():
+        answer_stats = category_answer_stats.get(category)
+        if answer_stats is not None and answer_stats.count:
+            category_stats[category] = {
+                "count": count,
+                "answer_count": answer_stats.count,
+                "min_answer": answer_stats.min,
+                "max_answer": answer_stats.max,
+                "mean_answer": answer_stats.mean,
+                "std_answer": answer_stats.std,
+            }
+        else:
+            category_stats[category] = {
+                "count": count,
+                "answer_count": 0,
+                "min_answer": None,
+                "max_answer": None,
+                "mean_answer": None,
+                "std_answer": None,
+            }
+
+    category_entries = {
+        category: sampler.items for category, sampler in category_samples.items()
+    }
+    return category_stats, category_entries
+
+
 def sample_randomly(
     entries: List[Dict[str, Any]], target_size: int
 ) -> List[Dict[str, Any]]:
@@ -528,6 +646,69 @@ def plot_distributions(data: List[Dict], output_file: str):
                 print(f"    Total categorical answers: {len(answers)}")
 
 
+def convert_and_save_entries(
+    entries: List[Dict[str, Any]],
+    output_file: str,
+    output_format: str = "json",
+    replace_masks: bool = True,
+    is_train: bool = False,
+    som_prompt: str = DEFAULT_SOM_PROMPT,
+    num_workers: int = 1,
+) -> tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Convert entries to LLaVA format in a process pool, writing them out as they are converted.
+
+    The output matches saving the whole list with save_annotations_to_jsonl or
+    json.dump(..., indent=2), without holding all converted entries in memory.
+
+    Returns:
+        The category and normalized answer of every saved entry, for statistics
+        and plots, and the first saved entry
+    """
+    convert_fn = functools.partial(
+        convert_to_llava_format,
+        replace_masks=replace_masks,
+        is_train=is_train,
+        som_prompt=som_prompt,
+    )
+    chunksize = max(1, min(1000, len(entries) // (4 * num_workers) or 1))
+    summaries = []
+    first_entry = None
+
+    with open(output_file, "w") as f:
+        if output_format.lower() != "jsonl":
+            f.write("[")
+
+        def write_entries(llava_entries):
+            nonlocal first_entry
+            for idx, llava_entry in enumerate(llava_entries):
+                if output_format.lower() == "jsonl":
+                    f.write(json.dumps(llava_entry) + "\n")
+                else:
+                    entry_text = json.dumps(llava_entry, indent=2).replace("\n", "\n  ")
+                    f.write(("," if idx else "") + "\n  " + entry_text)
+                summaries.append(
+                    {
+                        "category": llava_entry["category"],
+                        "normalized_answer": llava_entry["normalized_answer"],
+                    }
+                )
+                if idx == 0:
+                    # Keep the first entry for verification
+                    first_entry = llava_entry
+
+        if num_workers > 1:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                write_entries(executor.map(convert_fn, entries, chunksize=chunksize))
+        else:
+            write_entries(map(convert_fn, entries))
+
+        if output_format.lower() != "jsonl":
+            f.write("\n]" if entries else "]")
+
+    return summaries, first_entry
+
+
 def save_annotations_to_jsonl(
     annotations: List[Dict[str, Any]], output_file: str
 ) -> None:
@@ -548,8 +729,15 @@ def preprocess_warehouse_data(
     no_sampling: bool = False,
     output_format: str = "json",
     som_prompt: str = DEFAULT_SOM_PROMPT,
+    single_pass: bool = False,
+    num_workers: int = 1,
 ) -> None:
-    """Main function to preprocess warehouse data with optional sampling."""
+    """Main function to preprocess warehouse data with optional sampling.
+
+    With single_pass, the input is streamed once: statistics are accumulated on
+    the fly and each category is reservoir-sampled, instead of a second pass
+    collecting the first entries of every category.
+    """
 
     # Set random seed for reproducibility
     random.seed(random_seed)
@@ -568,8 +756,16 @@ def preprocess_warehouse_data(
         print("Processing validation file - no sampling will be applied")
         samples_per_category = None
 
-    # First pass: Analyze data distribution using streaming
-    category_stats = analyze_data_distribution_streaming(input_file, target_categories)
+    if single_pass:
+        # Single pass: Analyze data distribution and sample entries at once
+        category_stats, category_entries = sample_entries_by_category_streaming(
+            input_file, target_categories, samples_per_category
+        )
+    else:
+        # First pass: Analyze data distribution using streaming
+        category_stats = analyze_data_distribution_streaming(
+            input_file, target_categories
+        )
 
     print("\nCategory statistics:")
     for category, stats in category_stats.items():
@@ -598,20 +794,28 @@ def preprocess_warehouse_data(
         print(f"\nFiltering to categories: {sorted(valid_categories)}")
         target_categories = list(valid_categories)
 
-    # Second pass: Collect entries by category using streaming
-    if is_val_file:
-        # For validation files, collect all entries without sampling
-        max_entries_per_category = None
+    if single_pass:
+        if target_categories is not None:
+            category_entries = {
+                category: entries
+                for category, entries in category_entries.items()
+                if category in target_categories
+            }
     else:
-        # For training files, collect extra for sampling
-        max_entries_per_category = samples_per_category * 2
+        # Second pass: Collect entries by category using streaming
+        if is_val_file:
+            # For validation files, collect all entries without sampling
+            max_entries_per_category = None
+        else:
+            # For training files, collect extra for sampling
+            max_entries_per_category = samples_per_category * 2
 
-    category_entries = collect_entries_by_category_streaming(
-        input_file, target_categories, max_entries_per_category
-    )
+        category_entries = collect_entries_by_category_streaming(
+            input_file, target_categories, max_entries_per_category
+        )
 
-    # Process entries and convert to LLaVA format
-    all_processed_entries = []
+    # Sample entries, and convert them to LLaVA format below
+    all_sampled_entries = []
 
     if is_val_file:
         print("\nProcessing all entries without sampling...")
@@ -626,13 +830,7 @@ def preprocess_warehouse_data(
 
         if is_val_file:
             # Process all entries for validation
-            processed_entries = []
-            for entry in entries:
-                llava_entry = convert_to_llava_format(
-                    entry, replace_masks, is_train, som_prompt
-                )
-                processed_entries.append(llava_entry)
-            print(f"  Processed entries: {len(processed_entries)}")
+            sampled_entries = entries
         else:
             # Sample for training
             if len(entries) < samples_per_category:
@@ -646,29 +844,24 @@ def preprocess_warehouse_data(
 
             print(f"  Sampled entries: {len(sampled_entries)}")
 
-            # Convert to LLaVA format
-            processed_entries = []
-            for entry in sampled_entries:
-                llava_entry = convert_to_llava_format(
-                    entry, replace_masks, is_train, som_prompt
-                )
-                processed_entries.append(llava_entry)
-
-            print(f"  Processed entries: {len(processed_entries)}")
-
-        all_processed_entries.extend(processed_entries)
+        all_sampled_entries.extend(sampled_entries)
+    del category_entries
 
     # Shuffle the final dataset
-    random.shuffle(all_processed_entries)
-
-    # Save the processed data to the exact output_file path
-    print(f"\nSaving {len(all_processed_entries)} entries to {output_file}")
-
-    if output_format.lower() == "jsonl":
-        save_annotations_to_jsonl(all_processed_entries, output_file)
-    else:
-        with open(output_file, "w") as f:
-            json.dump(all_processed_entries, f, indent=2)
+    random.shuffle(all_sampled_entries)
+
+    # Convert and save the processed data to the exact output_file path
+    print(f"\nSaving {len(all_sampled_entries)} entries to {output_file}")
+    all_processed_entries, sample_entry = convert_and_save_entries(
+        all_sampled_entries,
+        output_file,
+        output_format=output_format,
+        replace_masks=replace_masks,
+        is_train=is_train,
+        som_prompt=som_prompt,
+        num_workers=num_workers,
+    )
+    del all_sampled_entries
 
     # Print final statistics
     print("\nFinal processing statistics:")
@@ -682,6 +875,8 @@ def preprocess_warehouse_data(
     print(f"\nTotal processed entries: {len(all_processed_entries)}")
     if is_val_file:
         print("Processing mode: validation (no sampling)")
+    elif single_pass:
+        print("Sampling strategy used: random (single-pass reservoir)")
     else:
         print("Sampling strategy used: random")
     print(f"Saved to: {output_file}")
@@ -693,8 +888,7 @@ def preprocess_warehouse_data(
         print("Distribution plots generated successfully!")
 
     # Create a sample entry for verification
-    if all_processed_entries:
-        sample_entry = all_processed_entries[0]
+    if sample_entry is not None:
         output_dir = os.path.dirname(output_file)
         sample_path = os.path.join(output_dir, "sample_processed_entry.json")
         with open(sample_path, "w") as f:
@@ -758,6 +952,17 @@ def main():
         default=DEFAULT_SOM_PROMPT,
         help="SOM prompt to prepend to queries",
     )
+    parser.add_argument(
+        "--single_pass",
+        action="store_true",
+        help="Stream the input once, reservoir-sampling each category",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes converting entries to LLaVA format",
+    )
 
     args = parser.parse_args()
 
@@ -772,6 +977,8 @@ def main():
         no_sampling=args.no_sampling,
         output_format=args.output_format,
         som_prompt=args.som_prompt,
+        single_pass=args.single_pass,
+        num_workers=args.num_workers,
     )
 
 
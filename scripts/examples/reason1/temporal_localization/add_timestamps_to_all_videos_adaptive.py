@@ -19,6 +19,11 @@ Script to add timestamps to all video files in a folder at 30 fps with 2 decimal
 
 This script processes all MP4 files in the input directory and adds timestamps
 with a single centered timestamp at the bottom of each frame.
+
+Each video is decoded once. The timestamp strip of every FPS coefficient is
+composed from a pre-rasterized glyph atlas, and the frames are piped straight
+into one ffmpeg H.264 encoder per coefficient. Videos are processed in parallel
+by a pool of worker processes.
 """
 
 import argparse
@@ -26,6 +31,7 @@ import glob
 import os
 import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 # Add the cosmos_reason1_utils to the path
@@ -41,11 +47,14 @@ import numpy as np
 
 # Import the overlay functionality
 from cosmos_reason1_utils.vision import OverlayConfig
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageColor, ImageDraw, ImageFont
 
 # FPS_COEFFS = {4: 1.07, 8: 1.5, 12: 1.85, 16: 2.13}
 FPS_COEFFS = {8: 1.5}
 
+# Characters of the "{seconds:.2f}s" timestamps, rasterized once per font size
+TIMESTAMP_CHARS = "0123456789.s"
+
 
 @functools.cache
 def _get_overlay_font_path(family: str) -> str:
@@ -53,180 +62,244 @@ def _get_overlay_font_path(family: str) -> str:
     return fm.findfont(fm.FontProperties(family=family))
 
 
-def convert_to_h264(input_path: str, output_path: str = None) -> str:
-    """Convert video to H.264 codec using ffmpeg."""
-    if output_path is None:
-        # Create output path with _h264 suffix
-        base_name = os.path.splitext(input_path)[0]
-        output_path = f"{base_name}_h264.mp4"
-
-    try:
-        # FFmpeg command to convert to H.264
-        cmd = [
-            "ffmpeg",
-            "-i",
-            input_path,
-            "-c:v",
-            "libx264",  # Use H.264 codec
-            "-preset",
-            "medium",  # Encoding preset (fast, medium, slow)
-            "-crf",
-            "23",  # Constant Rate Factor (18-28 is good)
-            "-y",  # Overwrite output file
-            output_path,
-        ]
-
-        print(
-            f"🔄 Converting to H.264: {os.path.basename(input_path)} → {os.path.basename(output_path)}"
-        )
-        result = subprocess.run(cmd, capture_output=True, text=True)
-
-        if result.returncode == 0:
-            print(f"✅ Successfully converted to H.264: {output_path}")
-            return output_path
-        else:
-            print(f"❌ FFmpeg conversion failed:")
-            print(f"   Error: {result.stderr}")
-            return None
-
-    except FileNotFoundError:
-        print("❌ FFmpeg not found. Please install ffmpeg to convert to H.264.")
-        return None
-    except Exception as e:
-        print(f"❌ Error during FFmpeg conversion: {e}")
-        return None
+def get_output_path(output_dir: str, filename: str, fps_key: int) -> str:
+    """Return the output path of a video for one FPS coefficient."""
+    if len(FPS_COEFFS) == 1:
+        return os.path.join(output_dir, filename)
+    name_without_ext = os.path.splitext(filename)[0]
+    return os.path.join(output_dir, f"{name_without_ext}_fps{fps_key}.mp4")
 
 
-def add_timestamps_to_video(
-    input_video_path: str, output_video_path: str, fps: float = 30.0, coeff: float = 1.0
-):
+class TimestampRenderer:
     """
-    Add timestamps to video frames with single centered timestamp.
+    Renders the timestamp border of a frame from a pre-rasterized glyph atlas.
 
-    Args:
-        input_video_path: Path to input video
-        output_video_path: Path to output video
-        fps: Frames per second (default: 30.0)
-        coeff: Coefficient to multiply border_height and font_size (default: 1.0)
+    The layout matches drawing the text with PIL: the text is centered in its
+    section of the border and vertically centered on its bounding box.
     """
-    # Create output directory if it doesn't exist
-    os.makedirs(os.path.dirname(output_video_path), exist_ok=True)
-
-    # Configuration for overlay text - single centered timestamp
-    # Apply coefficient to border_height and font_size
-    config = OverlayConfig(
-        border_height=int(
-            28 * coeff
-        ),  # Height of black border multiplied by coefficient
-        temporal_path_size=1,  # Single position (centered)
-        font_family="DejaVu Sans Mono",  # Font family
-        font_size=int(20 * coeff),  # Font size multiplied by coefficient
-        font_color="white",  # Text color
-    )
-
-    # Load font
-    font = ImageFont.truetype(
-        _get_overlay_font_path(config.font_family), config.font_size
-    )
-
-    # Open video
-    cap = cv2.VideoCapture(input_video_path)
-
-    # Get video properties
-    original_fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-
-    print(f"  Input video: {width}x{height}, {original_fps} fps, {total_frames} frames")
-    print(
-        f"  Using coefficient: {coeff} (border_height: {config.border_height}, font_size: {config.font_size})"
-    )
-
-    # Calculate new dimensions with border
-    new_height = height + config.border_height
-
-    # Setup video writer
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    out = cv2.VideoWriter(output_video_path, fourcc, fps, (width, new_height))
-
-    frame_count = 0
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        # Convert BGR to RGB
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(frame_rgb)
-
-        # Create new image with black border at the bottom
-        new_image = Image.new("RGB", (width, new_height), color="black")
 
-        # Paste original image at the top
-        new_image.paste(pil_image, (0, 0))
-
-        # Draw text on the black border
-        draw = ImageDraw.Draw(new_image)
-
-        # Calculate timestamp for current frame (seconds since start)
-        total_seconds = frame_count / fps
-        text = f"{total_seconds:.2f}s"
-
-        # Get text dimensions
-        try:
-            # Get text bounding box
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-        except AttributeError:
-            # Fallback for older PIL versions
-            text_width, text_height = draw.textsize(text, font=font)
+    def __init__(self, width: int, coeff: float = 1.0):
+        # Configuration for overlay text - single centered timestamp
+        # Apply coefficient to border_height and font_size
+        self.config = OverlayConfig(
+            border_height=int(
+                28 * coeff
+            ),  # Height of black border multiplied by coefficient
+            temporal_path_size=1,  # Single position (centered)
+            font_family="DejaVu Sans Mono",  # Font family
+            font_size=int(20 * coeff),  # Font size multiplied by coefficient
+            font_color="white",  # Text color
+        )
+        self.width = width
+        self.font = ImageFont.truetype(
+            _get_overlay_font_path(self.config.font_family), self.config.font_size
+        )
 
-        # Define available positions (cycling through horizontal positions)
-        position_idx = frame_count % config.temporal_path_size
-        section_width = width // config.temporal_path_size
+        # Blend the font color over the black border for every glyph coverage value
+        color = np.array(ImageColor.getrgb(self.config.font_color)[:3])
+        coverage = np.arange(256)[:, None]
+        self.color_lut = ((coverage * color[::-1] + 127) // 255).astype(np.uint8)
+
+        self.glyphs = {}
+        for char in TIMESTAMP_CHARS:
+            self._rasterize(char)
+
+    def _rasterize(self, char: str):
+        """Rasterize a glyph as a coverage mask and its bounding box relative to the origin."""
+        left, top, right, bottom = self.font.getbbox(char)
+        mask = Image.new("L", (max(right - left, 1), max(bottom - top, 1)))
+        ImageDraw.Draw(mask).text((-left, -top), char, fill=255, font=self.font)
+        self.glyphs[char] = (np.asarray(mask), (left, top, right, bottom))
+        return self.glyphs[char]
+
+    def render(self, text: str, position_idx: int = 0) -> np.ndarray:
+        """Return the (border_height, width, 3) BGR border showing `text`."""
+        border_height = self.config.border_height
+        glyphs = [self.glyphs.get(char) or self._rasterize(char) for char in text]
+        origins = [round(self.font.getlength(text[:i])) for i in range(len(text))]
+
+        # Bounding box of the whole text, as returned by ImageDraw.textbbox
+        text_left = min(x + bbox[0] for x, (_, bbox) in zip(origins, glyphs))
+        text_top = min(bbox[1] for _, bbox in glyphs)
+        text_right = max(x + bbox[2] for x, (_, bbox) in zip(origins, glyphs))
+        text_bottom = max(bbox[3] for _, bbox in glyphs)
+        text_width = text_right - text_left
+        text_height = text_bottom - text_top
 
         # Calculate x position based on cycling position
+        section_width = self.width // self.config.temporal_path_size
         section_center_x = position_idx * section_width + section_width // 2
         text_x = section_center_x - text_width // 2
 
         # Ensure text doesn't go outside bounds
-        text_x = max(0, min(text_x, width - text_width))
+        text_x = max(0, min(text_x, self.width - text_width))
 
         # Center vertically in the border
-        text_y = height + (config.border_height - text_height) // 2
+        text_y = (border_height - text_height) // 2
+
+        strip = np.zeros((border_height, self.width), dtype=np.uint8)
+        for x, (mask, bbox) in zip(origins, glyphs):
+            x0, y0 = text_x + x + bbox[0], text_y + bbox[1]
+            # Clip the glyph to the border
+            mx0, my0 = max(0, -x0), max(0, -y0)
+            mx1 = min(mask.shape[1], self.width - x0)
+            my1 = min(mask.shape[0], border_height - y0)
+            if mx1 <= mx0 or my1 <= my0:
+                continue
+            region = strip[y0 + my0 : y0 + my1, x0 + mx0 : x0 + mx1]
+            np.maximum(region, mask[my0:my1, mx0:mx1], out=region)
+
+        return self.color_lut[strip]
+
+
+def open_h264_encoder(
+    output_path: str, width: int, height: int, fps: float
+) -> subprocess.Popen:
+    """Start an ffmpeg process encoding raw BGR frames from its stdin to H.264."""
+    cmd = [
+        "ffmpeg",
+        "-loglevel",
+        "error",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "bgr24",
+        "-s",
+        f"{width}x{height}",
+        "-r",
+        str(fps),
+        "-i",
+        "-",
+        "-vf",
+        "pad=ceil(iw/2)*2:ceil(ih/2)*2",  # yuv420p needs even dimensions
+        "-c:v",
+        "libx264",  # Use H.264 codec
+        "-preset",
+        "medium",  # Encoding preset (fast, medium, slow)
+        "-crf",
+        "23",  # Constant Rate Factor (18-28 is good)
+        "-pix_fmt",
+        "yuv420p",
+        "-f",
+        "mp4",
+        "-y",  # Overwrite output file
+        output_path,
+    ]
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
 
-        # Draw the timestamp
-        draw.text((text_x, text_y), text, fill=config.font_color, font=font)
 
-        # Convert back to BGR for OpenCV
-        new_image_bgr = cv2.cvtColor(np.array(new_image), cv2.COLOR_RGB2BGR)
+def add_timestamps_to_video(
+    input_video_path: str, output_video_paths: dict, fps: float = 30.0
+) -> int:
+    """
+    Add timestamps to video frames with single centered timestamp, for several coefficients at once.
 
-        # Write frame
-        out.write(new_image_bgr)
+    Args:
+        input_video_path: Path to input video
+        output_video_paths: Output path for each coefficient multiplying border_height and font_size
+        fps: Frames per second (default: 30.0)
 
-        frame_count += 1
+    Returns:
+        Number of processed frames
+    """
+    # Open video
+    cap = cv2.VideoCapture(input_video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open video: {input_video_path}")
 
-    # Cleanup
-    cap.release()
-    out.release()
+    # Get video properties
+    original_fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    filename = os.path.basename(input_video_path)
 
-    print(f"  ✓ Processed {frame_count} frames with timestamps at {fps} fps")
+    print(f"  {filename}: {width}x{height}, {original_fps} fps, {total_frames} frames")
 
+    # One renderer, output frame buffer and encoder per coefficient.
+    # Encoders write to a temporary file that replaces the output once complete.
+    renderers, frames, encoders = [], [], []
+    frame_count = 0
+    completed = False
+    try:
+        for coeff, output_video_path in output_video_paths.items():
+            os.makedirs(os.path.dirname(output_video_path) or ".", exist_ok=True)
+            renderer = TimestampRenderer(width, coeff)
+            new_height = height + renderer.config.border_height
+            renderers.append(renderer)
+            frames.append(np.empty((new_height, width, 3), dtype=np.uint8))
+            encoders.append(
+                open_h264_encoder(f"{output_video_path}.tmp", width, new_height, fps)
+            )
 
-def process_all_videos(input_dir: str, output_dir: str):
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            # Calculate timestamp for current frame (seconds since start)
+            text = f"{frame_count / fps:.2f}s"
+            for renderer, new_frame, encoder in zip(renderers, frames, encoders):
+                position_idx = frame_count % renderer.config.temporal_path_size
+                new_frame[:height] = frame
+                new_frame[height:] = renderer.render(text, position_idx)
+                encoder.stdin.write(new_frame.data)
+
+            frame_count += 1
+        completed = frame_count > 0
+    except BrokenPipeError:
+        # An encoder exited early, its error is reported below
+        pass
+    finally:
+        cap.release()
+        errors = []
+        for encoder in encoders:
+            try:
+                encoder.stdin.close()
+            except BrokenPipeError:
+                pass
+            stderr = encoder.stderr.read().decode(errors="replace").strip()
+            if encoder.wait() != 0:
+                errors.append(stderr)
+        completed = completed and not errors
+
+        for output_video_path in output_video_paths.values():
+            if completed:
+                os.replace(f"{output_video_path}.tmp", output_video_path)
+            elif os.path.exists(f"{output_video_path}.tmp"):
+                os.remove(f"{output_video_path}.tmp")
+
+    if errors:
+        raise RuntimeError(f"FFmpeg encoding failed: {errors[0]}")
+    if frame_count == 0:
+        raise RuntimeError(f"No frames decoded from {input_video_path}")
+
+    return frame_count
+
+
+def _process_video(input_video: str, output_dir: str) -> tuple:
+    """Add timestamps to one video for all FPS coefficients, in a worker process."""
+    filename = os.path.basename(input_video)
+    output_video_paths = {
+        coeff: get_output_path(output_dir, filename, fps_key)
+        for fps_key, coeff in FPS_COEFFS.items()
+    }
+    frame_count = add_timestamps_to_video(input_video, output_video_paths, fps=30.0)
+    return frame_count, list(output_video_paths.values())
+
+
+def process_all_videos(input_dir: str, output_dir: str, num_workers: int = 1):
     """
     Process all MP4 files in the input directory for each FPS coefficient.
 
     Args:
         input_dir: Directory containing input videos
         output_dir: Directory to save processed videos
+        num_workers: Number of videos processed in parallel (default: 1)
     """
     # Find all MP4 files
     video_pattern = os.path.join(input_dir, "*.mp4")
-    video_files = glob.glob(video_pattern)
+    video_files = [f for f in sorted(glob.glob(video_pattern)) if "h264" not in f]
 
     if not video_files:
         print(f"No MP4 files found in {input_dir}")
@@ -236,54 +309,31 @@ def process_all_videos(input_dir: str, output_dir: str):
     print(f"Input directory: {input_dir}")
     print(f"Output directory: {output_dir}")
     print(f"FPS coefficients: {FPS_COEFFS}")
+    print(f"Workers: {num_workers}")
     print("=" * 60)
 
-    total_videos = len(video_files) * len(FPS_COEFFS)
-    video_count = 0
-
-    # Process each video for each FPS coefficient
-    for fps_key, coeff in FPS_COEFFS.items():
-        print(f"\n=== Processing videos for FPS {fps_key} (coefficient: {coeff}) ===")
-
-        for i, input_video in enumerate(sorted(video_files), 1):
-            if "h264" in input_video:
-                continue
-            filename = os.path.basename(input_video)
-            name_without_ext = os.path.splitext(filename)[0]
-            # output_video = os.path.join(output_dir, f"{name_without_ext}_fps{fps_key}.mp4")
-            output_video = os.path.join(output_dir, filename)
-
-            video_count += 1
-            print(
-                f"[{video_count}/{total_videos}] Processing: {filename} (FPS {fps_key})"
-            )
+    os.makedirs(output_dir, exist_ok=True)
+    num_failed = 0
 
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        futures = {
+            pool.submit(_process_video, input_video, output_dir): input_video
+            for input_video in video_files
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            filename = os.path.basename(futures[future])
             try:
-                add_timestamps_to_video(
-                    input_video, output_video, fps=30.0, coeff=coeff
+                frame_count, output_videos = future.result()
+                print(
+                    f"[{i}/{len(video_files)}] ✓ {filename}: {frame_count} frames → "
+                    f"{', '.join(output_videos)}"
                 )
-                h264_output = convert_to_h264(output_video)
-
-                # Delete the intermediate mp4v file if H.264 conversion was successful
-                if h264_output and os.path.exists(h264_output):
-                    try:
-                        os.remove(output_video)
-                        os.rename(h264_output, output_video)
-                        print(
-                            f"  🗑️  Removed intermediate file: {os.path.basename(output_video)}"
-                        )
-                        print(f"  ✓ Final output: {h264_output}")
-                    except Exception as e:
-                        print(f"  ⚠️  Could not remove intermediate file: {e}")
-                else:
-                    print(
-                        f"  ⚠️  H.264 conversion failed, keeping original: {output_video}"
-                    )
             except Exception as e:
-                print(f"  ✗ Error processing {filename} for FPS {fps_key}: {e}")
-
-            print("-" * 40)
+                num_failed += 1
+                print(f"[{i}/{len(video_files)}] ✗ Error processing {filename}: {e}")
 
+    if num_failed:
+        print(f"{num_failed}/{len(video_files)} videos failed")
     print("All videos processed!")
 
 
@@ -305,6 +355,13 @@ def main():
         required=True,
         help="Output directory to save processed videos with timestamps",
     )
+    parser.add_argument(
+        "-j",
+        "--num-workers",
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help="Number of videos processed in parallel (default: min(4, number of CPUs))",
+    )
 
     args = parser.parse_args()
 
@@ -325,7 +382,7 @@ def main():
         return
 
     try:
-        process_all_videos(input_dir, output_dir)
+        process_all_videos(input_dir, output_dir, args.num_workers)
     except Exception as e:
         print(f"Error processing videos: {e}")
         return
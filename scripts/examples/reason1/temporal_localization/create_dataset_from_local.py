@@ -40,6 +40,7 @@ import json
 import os
 import pickle
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Optional, Union
 
@@ -68,7 +69,7 @@ def load_pickle(pickle_path: Union[str, Path]) -> dict:
 
 
 def check_video(video_path):
-    """Check if video is valid."""
+    """Check if video is valid by decoding it end-to-end."""
     if not os.path.exists(video_path):
         return False
 
@@ -83,6 +84,165 @@ def check_video(video_path):
         return False
 
 
+def probe_video(video_path) -> Optional[bool]:
+    """Cheaply check a video from its container header and index.
+
+    Args:
+        video_path: Path to video file
+
+    Returns:
+        False if the container or its video stream cannot be read, True if the
+        header looks complete, and None if the video is suspicious and needs a
+        full decode to decide
+    """
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-select_streams",
+                "v:0",
+                "-show_entries",
+                "stream=codec_name,width,height,nb_frames,duration:format=duration",
+                "-of",
+                "json",
+                video_path,
+            ],
+            capture_output=True,
+            text=True,
+        )
+    except FileNotFoundError:
+        # No ffprobe available, fall back to decoding
+        return None
+
+    if result.returncode != 0:
+        return False
+
+    try:
+        info = json.loads(result.stdout)
+    except json.JSONDecodeError:
+        return None
+    streams = info.get("streams", [])
+    if not streams:
+        return False
+
+    stream = streams[0]
+    duration = stream.get("duration", info.get("format", {}).get("duration"))
+    if (
+        result.stderr.strip()
+        or not stream.get("codec_name")
+        or not stream.get("width")
+        or not stream.get("height")
+        # Not every container stores the frame count
+        or stream.get("nb_frames") == "0"
+        or not duration
+        or float(duration) <= 0
+    ):
+        return None
+    return True
+
+
+def validate_video(video_path, full_decode: bool = False) -> tuple:
+    """Validate a video with a header probe, decoding it only if suspicious.
+
+    Args:
+        video_path: Path to video file
+        full_decode: Always decode the whole video
+
+    Returns:
+        Tuple of (is valid, validation method: "probe" or "decode")
+    """
+    if not full_decode:
+        valid = probe_video(video_path)
+        if valid is not None:
+            return valid, "probe"
+    return check_video(video_path), "decode"
+
+
+def load_validation_cache(cache_path: Optional[Path]) -> dict:
+    """Load cached validation results, keyed by video path."""
+    if cache_path is None or not cache_path.exists():
+        return {}
+    try:
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_validation_cache(cache_path: Optional[Path], cache: dict):
+    """Atomically write validation results."""
+    if cache_path is None:
+        return
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"[yellow]Could not write validation cache {cache_path}: {e}[/yellow]")
+
+
+def validate_videos(
+    video_paths: List[str],
+    cache_path: Optional[Path] = None,
+    num_workers: int = 8,
+    full_decode: bool = False,
+) -> dict:
+    """Validate videos in parallel, reusing cached results of unchanged files.
+
+    Results are cached by (path, size, mtime), so only new or modified videos
+    are probed again.
+
+    Args:
+        video_paths: Paths of the videos to validate
+        cache_path: JSON file caching the results, or None to disable caching
+        num_workers: Number of videos validated in parallel
+        full_decode: Decode every video instead of probing its header first
+
+    Returns:
+        Mapping of video path to validity
+    """
+    cache = load_validation_cache(cache_path)
+    results = {}
+    pending = {}
+    for video_path in video_paths:
+        stat = os.stat(video_path)
+        key = os.path.abspath(video_path)
+        entry = cache.get(key)
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and (not full_decode or entry["method"] == "decode")
+        ):
+            results[video_path] = entry["valid"]
+        else:
+            pending[video_path] = (key, stat)
+
+    print(f"🔎 Validating {len(pending)} videos ({len(results)} cached results reused)")
+    if pending:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            validated = executor.map(
+                lambda path: validate_video(path, full_decode), pending
+            )
+            for video_path, (valid, method) in tqdm(
+                zip(pending, validated), total=len(pending)
+            ):
+                key, stat = pending[video_path]
+                results[video_path] = valid
+                cache[key] = {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "valid": valid,
+                    "method": method,
+                }
+        save_validation_cache(cache_path, cache)
+
+    return results
+
+
 def find_videos(
     video_dir: Path, extensions: tuple = (".mp4", ".avi", ".mov", ".mkv")
 ) -> List[Path]:
@@ -165,6 +325,33 @@ def main():
         help="Directory containing video files.",
     )
 
+    parser.add_argument(
+        "--validation_cache",
+        type=str,
+        default=None,
+        help="JSON file caching video validation results by (path, size, mtime). "
+        "Defaults to .video_validation_cache.json in --video_dir.",
+    )
+
+    parser.add_argument(
+        "--no_validation_cache",
+        action="store_true",
+        help="Do not read or write the video validation cache.",
+    )
+
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of videos validated in parallel.",
+    )
+
+    parser.add_argument(
+        "--full_decode",
+        action="store_true",
+        help="Decode every video end-to-end instead of only the suspicious ones.",
+    )
+
     args = parser.parse_args()
 
     # Validate input arguments
@@ -197,8 +384,9 @@ def main():
     MAX_VIDEO_SIZE_MB = 5
     MAX_VIDEO_SIZE_BYTES = MAX_VIDEO_SIZE_MB * 1024 * 1024  # 5 MB in bytes
 
-    print("\n🔄 Processing samples...")
-    for demo_name, response in tqdm(responses.items()):
+    # Gather the existing videos, skipping the large ones before validating
+    video_paths = {}
+    for demo_name in responses:
         # Construct video path: remove underscore from demo_name
         # e.g., "coffee_d0_demo_0" -> "coffee_d0_demo0_agentview.mp4"
         video_name = demo_name.replace("demo_", "demo") + "_agentview.mp4"
@@ -207,10 +395,6 @@ def main():
         if not os.path.exists(video_path):
             continue
 
-        if not check_video(video_path):
-            failed_count += 1
-            continue
-
         # Check video file size
         video_size_bytes = os.path.getsize(video_path)
         video_size_mb = video_size_bytes / (1024 * 1024)
@@ -222,6 +406,31 @@ def main():
             skipped_large_videos += 1
             continue
 
+        video_paths[demo_name] = video_path
+
+    if args.no_validation_cache:
+        cache_path = None
+    elif args.validation_cache is not None:
+        cache_path = Path(args.validation_cache)
+    else:
+        cache_path = Path(args.video_dir) / ".video_validation_cache.json"
+    video_valid = validate_videos(
+        list(video_paths.values()),
+        cache_path=cache_path,
+        num_workers=args.num_workers,
+        full_decode=args.full_decode,
+    )
+
+    print("\n🔄 Processing samples...")
+    for demo_name, response in tqdm(responses.items()):
+        if demo_name not in video_paths:
+            continue
+        video_path = video_paths[demo_name]
+
+        if not video_valid[video_path]:
+            failed_count += 1
+            continue
+
         try:
             user_prompt = remove_timestamps_from_events(response)
             # Create conversation
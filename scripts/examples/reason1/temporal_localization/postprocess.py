@@ -18,9 +18,11 @@ import argparse
 import os
 import pickle
 import re
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
+from result_log import RESULTS_FILE, load_trial_outputs
 
 
 def extract_two_floats(text):
@@ -52,6 +54,189 @@ def extract_two_floats(text):
         return None, None
 
 
+def load_demo_outputs(results_dir, video_name, fps, trial_outputs=None):
+    """
+    Load the trial outputs of one video at one FPS.
+
+    Outputs come from the append-only result log if present, otherwise from the
+    legacy `results_{video_name}.pkl` pickle.
+
+    Args:
+        results_dir (str): Directory containing the results
+        video_name (str): Name of the video (e.g. "demo0")
+        fps (int): Frames per second the trials were run at
+        trial_outputs (dict): Result log contents from `load_trial_outputs`
+
+    Returns:
+        list: Trial outputs ordered by trial index, or None if there are none
+    """
+    if trial_outputs is not None:
+        outputs = trial_outputs.get(video_name, {}).get(fps)
+        if outputs:
+            return [outputs[trial] for trial in sorted(outputs)]
+
+    results_file = f"{results_dir}/results_{video_name}.pkl"
+    if not os.path.exists(results_file):
+        return None
+    with open(results_file, "rb") as f:
+        loaded_dict = pickle.load(f)
+    return loaded_dict.get(f"fps{fps}")
+
+
+def parse_answer(output_text, num_events):
+    """
+    Parse the predicted (start, end) times of every event from a model output.
+
+    Only the <answer> block is used if present. The answer is malformed unless
+    it has exactly `num_events` event lines, each with two timestamps.
+
+    Args:
+        output_text (str | list): Model output of one trial
+        num_events (int): Expected number of events
+
+    Returns:
+        np.ndarray: (num_events, 2) array of start and end times, or None if malformed
+    """
+    # Handle case where output_text might be a list
+    if isinstance(output_text, list):
+        output_text = output_text[0] if output_text else None
+    if not output_text:
+        return None
+
+    # Extract text between <answer> and </answer> tags
+    answer_match = re.search(
+        r"<answer>(.*?)</answer>", output_text, re.DOTALL | re.IGNORECASE
+    )
+    # If no answer tags, use the whole output text as fallback
+    answer_text = answer_match.group(1) if answer_match else output_text
+
+    event_lines = [line for line in answer_text.split("\n") if "Event" in line]
+    if len(event_lines) != num_events:
+        return None
+
+    extracted_values = [extract_two_floats(line) for line in event_lines]
+    if any(value is None for pair in extracted_values for value in pair):
+        return None
+    return np.array(extracted_values, dtype=np.float64)
+
+
+def parse_demo_trials(job):
+    """
+    Load and parse all trials of one (demo, fps) pair.
+
+    Args:
+        job (tuple): (results_dir, video_name, fps, num_events, num_trials, trial_outputs)
+
+    Returns:
+        tuple: (num_trials, num_events, 2) predictions with NaN for missing or
+            malformed trials, and whether any results were found
+    """
+    results_dir, video_name, fps, num_events, num_trials, trial_outputs = job
+    predictions = np.full((num_trials, num_events, 2), np.nan)
+
+    outputs = load_demo_outputs(results_dir, video_name, fps, trial_outputs)
+    if outputs is None:
+        return predictions, False
+
+    for trial, output_text in enumerate(outputs[:num_trials]):
+        parsed = parse_answer(output_text, num_events)
+        if parsed is not None:
+            predictions[trial] = parsed
+    return predictions, True
+
+
+def masked_mean_std(values, mask, axis):
+    """
+    Mean and (population) standard deviation over `axis`, using masked entries only.
+
+    Args:
+        values (np.ndarray): Values to reduce
+        mask (np.ndarray): Boolean mask broadcastable to `values`
+        axis (int): Axis to reduce
+
+    Returns:
+        tuple: Mean and standard deviation, NaN where the mask is empty
+    """
+    mask = np.broadcast_to(mask, values.shape)
+    count = mask.sum(axis=axis)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(mask, values, 0.0).sum(axis=axis) / count
+        deviation = np.where(mask, values - np.expand_dims(mean, axis), 0.0)
+        std = np.sqrt((deviation**2).sum(axis=axis) / count)
+    return mean, std
+
+
+def score_predictions(predictions, gt, windows, use_end_time):
+    """
+    Score all demos, FPS values, trials and tolerance windows at once.
+
+    Args:
+        predictions (np.ndarray): (demo, fps, trial, event, 2) predicted start and
+            end times, NaN for missing or malformed trials
+        gt (np.ndarray): (demo, event) ground truth timestamps
+        windows (np.ndarray): (window, fps) hit tolerances in seconds
+        use_end_time (bool): Compare the predicted end times instead of start times
+
+    Returns:
+        dict: Per-trial errors and hits, and their per-demo and aggregate statistics
+    """
+    # Duration until the first event, then between consecutive events
+    durations = np.diff(gt, axis=1, prepend=0.0)
+    valid = ~np.isnan(predictions).any(axis=(-2, -1))
+
+    pred_times = predictions[..., 1 if use_end_time else 0]
+    errors_s = np.abs(pred_times - gt[:, None, None, :])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        errors_pct = np.where(
+            durations[:, None, None, :] > 0,
+            errors_s / durations[:, None, None, :] * 100,
+            0.0,
+        )
+    hits = (errors_s[None] < windows[:, None, :, None, None]).astype(np.float64)
+
+    # Statistics across the valid trials of each demo
+    trial_mask = valid[..., None]
+    demo_errors_s, demo_std_errors_s = masked_mean_std(errors_s, trial_mask, axis=2)
+    demo_errors_pct, demo_std_errors_pct = masked_mean_std(
+        errors_pct, trial_mask, axis=2
+    )
+    demo_hit_rates, _ = masked_mean_std(hits, trial_mask, axis=3)
+
+    # Statistics across the demos with at least one valid trial
+    num_valid = valid.sum(axis=2)
+    demo_mask = (num_valid > 0)[..., None]
+    mean_errors_s, std_errors_s = masked_mean_std(demo_errors_s, demo_mask, axis=0)
+    mean_errors_pct, std_errors_pct = masked_mean_std(
+        demo_errors_pct, demo_mask, axis=0
+    )
+    mean_hit_rates, std_hit_rates = masked_mean_std(demo_hit_rates, demo_mask, axis=1)
+
+    return {
+        "durations": durations,
+        "valid": valid,
+        "num_valid": num_valid,
+        "errors_s": errors_s,
+        "errors_pct": errors_pct,
+        "hits": hits,
+        "demo_errors_s": demo_errors_s,
+        "demo_std_errors_s": demo_std_errors_s,
+        "demo_errors_pct": demo_errors_pct,
+        "demo_std_errors_pct": demo_std_errors_pct,
+        "demo_hit_rates": demo_hit_rates,
+        "mean_errors_s": mean_errors_s,
+        "std_errors_s": std_errors_s,
+        "mean_errors_pct": mean_errors_pct,
+        "std_errors_pct": std_errors_pct,
+        "mean_hit_rates": mean_hit_rates,
+        "std_hit_rates": std_hit_rates,
+    }
+
+
+def result_video_name(demo_name):
+    """Name under which the inference scripts store the results of a demo"""
+    return f"demo{demo_name}" if demo_name.isdigit() else demo_name
+
+
 def get_num_events(gt_timestamps_list):
     """
     Determine the number of events based on ground truth timestamps.
@@ -170,12 +355,15 @@ Available ground truth timestamp types:
 Examples:
   python postprocess.py /path/to/results --gt-timestamps toaster --fps 8
   python postprocess.py /path/to/results --gt-timestamps bridge --use-start-time
-  python postprocess.py /path/to/results --gt-timestamps cube_stacking --fps 4
+  python postprocess.py /path/to/results --gt-timestamps cube --fps 4 8 12
+  python postprocess.py /path/to/results --gt-timestamps cube --time-windows 0.1 0.25 0.5
         """,
     )
 
     parser.add_argument(
-        "results_dir", type=str, help="Directory containing the results pickle files"
+        "results_dir",
+        type=str,
+        help=f"Directory containing the {RESULTS_FILE} result log or results pickle files",
     )
 
     parser.add_argument(
@@ -189,8 +377,9 @@ Examples:
     parser.add_argument(
         "--fps",
         type=int,
-        default=8,
-        help="Frames per second for video analysis (default: 8)",
+        nargs="+",
+        default=[8],
+        help="Frames per second values to score (default: 8)",
     )
 
     parser.add_argument(
@@ -206,6 +395,37 @@ Examples:
         help="Number of trials to process per demo (default: 10)",
     )
 
+    parser.add_argument(
+        "--demos",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Demos to score (default: all demos of the ground truth type)",
+    )
+
+    parser.add_argument(
+        "--time-windows",
+        type=float,
+        nargs="+",
+        default=None,
+        help="Hit tolerance windows in seconds; the first one is used for the "
+        "per-demo files (default: 4.1 frames / 2 at each FPS)",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes parsing result files. Parsing is cheap, so this "
+        "only pays off for many legacy pickle files (default: 1)",
+    )
+
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Print the output and extracted predictions of every trial",
+    )
+
     # Parse arguments
     args = parser.parse_args()
 
@@ -213,193 +433,121 @@ Examples:
     results_dir = args.results_dir
     output_dir = results_dir
     gt_timestamps_type = args.gt_timestamps
-    fps = args.fps
+    fps_list = args.fps
     use_end_time = not args.use_start_time
     num_trials = args.num_trials
 
     # Get the ground truth timestamps
     gt_timestamps = gt_timestamps_map[gt_timestamps_type]
+    demo_names = args.demos if args.demos is not None else list(gt_timestamps.keys())
+    unknown_demos = [d for d in demo_names if d not in gt_timestamps]
+    if unknown_demos:
+        parser.error(f"Unknown demos for {gt_timestamps_type}: {unknown_demos}")
+
+    # Determine number of events
+    num_events = get_num_events(gt_timestamps[demo_names[0]])
+    assert all(
+        get_num_events(gt_timestamps[d]) == num_events for d in demo_names
+    ), "All demos must have the same number of events"
+
+    # Tolerance windows, per FPS unless given explicitly
+    if args.time_windows is not None:
+        windows = np.repeat(
+            np.asarray(args.time_windows, dtype=np.float64)[:, None],
+            len(fps_list),
+            axis=1,
+        )
+    else:
+        windows = np.asarray([[4.1 * (1 / fps) / 2 for fps in fps_list]])
 
     # Print configuration
     print(
         f"Using {'END' if use_end_time else 'START'} times ({'odd' if use_end_time else 'even'} indices)"
     )
-    print(f"FPS: {fps}")
+    print(f"FPS: {fps_list}")
     print(f"GT Timestamps Type: {gt_timestamps_type}")
     print(f"Number of trials: {num_trials}")
+    print(f"Number of demos: {len(demo_names)}")
     print(f"Results directory: {results_dir}")
     print()
 
-    # Store aggregate statistics across all demos and trials
-    all_demos_errors_seconds = []
-    all_demos_errors_percent = []
-    all_demos_hit_rates = []
-    all_demos_subtask_durations = []
-    all_trials_data = []  # Store per-trial data for analysis
-    time_window = 4.1 * (1 / fps) / 2
-
-    for demo_name in ["0"]:
-        print(f"\n{'='*70}")
-        print(f"Processing Demo {demo_name}...")
-        print(f"GT Timestamps: {gt_timestamps[demo_name]}")
-        print(f"{'='*70}")
-
-        # Determine number of events for this demo
-        num_events = get_num_events(gt_timestamps[demo_name])
-        print(f"Number of events: {num_events}")
-
-        results_file = f"{results_dir}/results_demo{demo_name}.pkl"
-        if not os.path.exists(results_file):
-            print(f"Results file not found: {results_file}")
-            continue
-        with open(results_file, "rb") as f:
-            loaded_dict = pickle.load(f)
-
-        # Calculate subtask durations from ground truth timestamps dynamically
-        subtask_durations = []
-        for i in range(num_events):
-            if i == 0:
-                subtask_durations.append(
-                    gt_timestamps[demo_name][0]
-                )  # Duration until first event
-            else:
-                subtask_durations.append(
-                    gt_timestamps[demo_name][i] - gt_timestamps[demo_name][i - 1]
-                )  # Duration between events
-
-        # Store errors and hits across all trials for this demo
-        demo_trials_errors_seconds = []
-        demo_trials_errors_percent = []
-        demo_trials_hit_rates = []
-        demo_trials_predictions = []
-
-        for trial in range(num_trials):
-            print(f"\n--- Trial {trial} ---")
-            if f"fps{fps}" not in loaded_dict:
-                print(f"FPS {fps} not found in results file")
-                continue
-            output_text_fps = loaded_dict[f"fps{fps}"]
-            if not output_text_fps:
-                print(
-                    f"Demo {demo_name} fps {fps} trial {trial}: No output text, skipping..."
-                )
-                continue
-            # Check if trial index is within bounds
-            if trial >= len(output_text_fps):
-                print(
-                    f"Trial {trial}: Index out of range (only {len(output_text_fps)} trials available), skipping..."
+    # Stream the result log once, keeping only the trials at the requested FPS
+    trial_outputs = load_trial_outputs(results_dir, fps_list)
+
+    # Parse all (demo, fps) pairs in parallel into one (demo, fps, trial, event, 2) array
+    jobs = [
+        (
+            results_dir,
+            result_video_name(demo_name),
+            fps,
+            num_events,
+            num_trials,
+            {
+                result_video_name(demo_name): trial_outputs.get(
+                    result_video_name(demo_name), {}
                 )
-                continue
-            output_text = loaded_dict[f"fps{fps}"][trial]
-            print(output_text)
-
-            if not output_text:
-                print(f"Trial {trial}: No output text, skipping...")
-                continue
+            },
+        )
+        for demo_name in demo_names
+        for fps in fps_list
+    ]
+    if args.workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            parsed = list(pool.map(parse_demo_trials, jobs, chunksize=8))
+    else:
+        parsed = [parse_demo_trials(job) for job in jobs]
 
-            # Handle case where output_text might be a list
-            if isinstance(output_text, list):
-                if len(output_text) > 0:
-                    output_text = output_text[0]
-                else:
-                    print(f"Trial {trial}: Empty output text list, skipping...")
-                    continue
+    predictions = np.stack([p for p, _ in parsed]).reshape(
+        len(demo_names), len(fps_list), num_trials, num_events, 2
+    )
+    found = np.asarray([f for _, f in parsed]).reshape(len(demo_names), len(fps_list))
+    gt = np.asarray([gt_timestamps[d] for d in demo_names], dtype=np.float64)
 
-            # Extract predictions from output - only from <answer> block
-            tmp_list = []
+    stats = score_predictions(predictions, gt, windows, use_end_time)
+    valid = stats["valid"]
+    os.makedirs(output_dir, exist_ok=True)
 
-            # Extract text between <answer> and </answer> tags
-            answer_match = re.search(
-                r"<answer>(.*?)</answer>", output_text, re.DOTALL | re.IGNORECASE
-            )
-            if answer_match:
-                answer_text = answer_match.group(1)
-            else:
-                # If no answer tags, use the whole output text as fallback
-                answer_text = output_text
-
-            # Extract event lines and their timestamps from answer block only
-            event_lines = [i for i in answer_text.split("\n") if "Event" in i]
-            extracted_values = [list(extract_two_floats(i)) for i in event_lines]
-
-            if extracted_values:
-                flattened = np.ravel(extracted_values)
-                tmp_list.append(flattened)
-
-            expected_length = num_events * 2  # Each event has start and end time
-            tmp_list = [
-                i
-                for i in tmp_list
-                if len(i) == expected_length and all(x is not None for x in i)
-            ]
+    column_names = []
+    for event_idx in range(num_events):
+        column_names.extend([f"event{event_idx+1}_start", f"event{event_idx+1}_end"])
 
-            if len(tmp_list) == 0:
-                print(f"Trial {trial}: No valid predictions extracted, skipping...")
-                print(f"  Found {len(event_lines)} event lines in answer block")
-                if extracted_values:
-                    print(f"  Extracted values: {extracted_values}")
+    for f_idx, fps in enumerate(fps_list):
+        for d_idx, demo_name in enumerate(demo_names):
+            subtask_durations = list(stats["durations"][d_idx])
+            if not found[d_idx, f_idx]:
+                print(
+                    f"Results not found for {result_video_name(demo_name)} at FPS {fps}"
+                )
                 continue
 
-            print(f"Trial {trial}: Extracted predictions: {tmp_list[0]}")
-            demo_trials_predictions.append(tmp_list[0])
-
-            # Calculate hits and errors for this trial
-            hit_table = []
-            error_table = []
-
-            for i in tmp_list:
-                # Dynamically build hit and error tables based on number of events
-                hit_row = []
-                error_row = []
-                for event_idx in range(num_events):
-                    # Use flag to determine which index to use
-                    if use_end_time:
-                        pred_end_time = i[
-                            event_idx * 2 + 1
-                        ]  # End time is at odd indices
+            trials = np.flatnonzero(valid[d_idx, f_idx])
+            if args.verbose:
+                print(f"\n{'='*70}")
+                print(f"Demo {demo_name} FPS {fps} GT Timestamps: {gt[d_idx]}")
+                for trial in range(num_trials):
+                    if valid[d_idx, f_idx, trial]:
+                        print(
+                            f"Trial {trial}: Extracted predictions: "
+                            f"{predictions[d_idx, f_idx, trial].ravel()}"
+                        )
                     else:
-                        pred_end_time = i[
-                            event_idx * 2
-                        ]  # Start time is at even indices
-
-                    gt_time = gt_timestamps[demo_name][event_idx]
-                    hit_row.append(np.abs(pred_end_time - gt_time) < time_window)
-                    error_row.append(np.abs(pred_end_time - gt_time))
-
-                hit_table.append(hit_row)
-                error_table.append(error_row)
-
-            hit_table = np.array(hit_table)
-            error_table = np.array(error_table)
-
-            # Calculate metrics for this trial
-            trial_errors_seconds = np.mean(error_table, axis=0)
-            trial_errors_percent = [
-                (trial_errors_seconds[i] / subtask_durations[i] * 100)
-                if subtask_durations[i] > 0
-                else 0
-                for i in range(num_events)
-            ]
-            trial_hit_rates = np.average(hit_table, axis=0)
-
-            demo_trials_errors_seconds.append(trial_errors_seconds)
-            demo_trials_errors_percent.append(trial_errors_percent)
-            demo_trials_hit_rates.append(trial_hit_rates)
+                        print(f"Trial {trial}: No valid predictions extracted")
 
-            print(f"Trial {trial} - Errors (s): {trial_errors_seconds}")
-            print(f"Trial {trial} - Hit rates: {trial_hit_rates}")
+            if len(trials) == 0:
+                print(f"Demo {demo_name}: No valid trials, skipping...")
+                continue
 
-        # Calculate average across all trials for this demo
-        if len(demo_trials_errors_seconds) > 0:
-            demo_avg_errors_seconds = np.mean(demo_trials_errors_seconds, axis=0)
-            demo_avg_errors_percent = np.mean(demo_trials_errors_percent, axis=0)
-            demo_avg_hit_rates = np.mean(demo_trials_hit_rates, axis=0)
-            demo_std_errors_seconds = np.std(demo_trials_errors_seconds, axis=0)
-            demo_std_errors_percent = np.std(demo_trials_errors_percent, axis=0)
+            demo_avg_errors_seconds = stats["demo_errors_s"][d_idx, f_idx]
+            demo_std_errors_seconds = stats["demo_std_errors_s"][d_idx, f_idx]
+            demo_avg_errors_percent = stats["demo_errors_pct"][d_idx, f_idx]
+            demo_std_errors_percent = stats["demo_std_errors_pct"][d_idx, f_idx]
+            demo_avg_hit_rates = stats["demo_hit_rates"][0, d_idx, f_idx]
 
+            print(f"\n{'='*70}")
             print(
-                f"\n=== Demo {demo_name} Summary (across {len(demo_trials_errors_seconds)} trials) ==="
+                f"=== Demo {demo_name} FPS {fps} Summary (across {len(trials)} trials) ==="
             )
+            print(f"GT Timestamps: {gt_timestamps[demo_name]}")
             print(f"Subtask durations (seconds): {subtask_durations}")
             print(
                 f"Average errors (seconds): {demo_avg_errors_seconds} ± {demo_std_errors_seconds}"
@@ -425,40 +573,28 @@ Examples:
             print(f"Average hit rates: {hit_rate_str}")
             print("=" * 70)
 
-            # Save per-demo results
-            os.makedirs(output_dir, exist_ok=True)
-
             # Save all predictions for this demo
-            if len(demo_trials_predictions) > 0:
-                # Dynamically generate column names based on number of events
-                column_names = []
-                for event_idx in range(num_events):
-                    column_names.extend(
-                        [f"event{event_idx+1}_start", f"event{event_idx+1}_end"]
-                    )
-
-                predictions_df = pd.DataFrame(
-                    demo_trials_predictions, columns=column_names
-                )
-                predictions_df["trial"] = range(len(demo_trials_predictions))
-                predictions_df.to_csv(
-                    f"{output_dir}/results_stat_demo_{demo_name}_fps{fps}_all_trials.csv",
-                    index=False,
-                )
+            predictions_df = pd.DataFrame(
+                predictions[d_idx, f_idx, trials].reshape(len(trials), -1),
+                columns=column_names,
+            )
+            predictions_df["trial"] = range(len(trials))
+            predictions_df.to_csv(
+                f"{output_dir}/results_stat_demo_{demo_name}_fps{fps}_all_trials.csv",
+                index=False,
+            )
 
             # Save per-trial error statistics
-            trials_error_dict = {"trial": range(len(demo_trials_errors_seconds))}
-
-            # Dynamically add columns for each event
+            trials_error_dict = {"trial": range(len(trials))}
             for event_idx in range(num_events):
-                trials_error_dict[f"event{event_idx+1}_error_s"] = [
-                    e[event_idx] for e in demo_trials_errors_seconds
+                trials_error_dict[f"event{event_idx+1}_error_s"] = stats["errors_s"][
+                    d_idx, f_idx, trials, event_idx
                 ]
-                trials_error_dict[f"event{event_idx+1}_error_pct"] = [
-                    e[event_idx] for e in demo_trials_errors_percent
-                ]
-                trials_error_dict[f"event{event_idx+1}_hit_rate"] = [
-                    h[event_idx] for h in demo_trials_hit_rates
+                trials_error_dict[f"event{event_idx+1}_error_pct"] = stats[
+                    "errors_pct"
+                ][d_idx, f_idx, trials, event_idx]
+                trials_error_dict[f"event{event_idx+1}_hit_rate"] = stats["hits"][
+                    0, d_idx, f_idx, trials, event_idx
                 ]
 
             trials_error_df = pd.DataFrame(trials_error_dict)
@@ -483,52 +619,36 @@ Examples:
                 f"{output_dir}/summary_demo_{demo_name}_fps{fps}.csv", index=False
             )
 
-            # Store data for overall aggregate calculation
-            all_demos_errors_seconds.append(demo_avg_errors_seconds)
-            all_demos_errors_percent.append(demo_avg_errors_percent)
-            all_demos_hit_rates.append(demo_avg_hit_rates)
-            all_demos_subtask_durations.append(subtask_durations)
-        else:
-            print(f"Demo {demo_name}: No valid trials, skipping...")
-
-    # Calculate and display aggregate statistics across all demos
-    print("\n" + "=" * 70)
-    print("=== AGGREGATE STATISTICS ACROSS ALL DEMOS ===")
-    print("=" * 70)
-
-    if len(all_demos_errors_seconds) > 0:
-        all_demos_errors_seconds = np.array(all_demos_errors_seconds)
-        all_demos_errors_percent = np.array(all_demos_errors_percent)
-        all_demos_hit_rates = np.array(all_demos_hit_rates)
-        all_demos_subtask_durations = np.array(all_demos_subtask_durations)
-
-        # Calculate mean and std across all demos
-        mean_errors_seconds = np.mean(all_demos_errors_seconds, axis=0)
-        std_errors_seconds = np.std(all_demos_errors_seconds, axis=0)
-        mean_errors_percent = np.mean(all_demos_errors_percent, axis=0)
-        std_errors_percent = np.std(all_demos_errors_percent, axis=0)
-        mean_hit_rates = np.mean(all_demos_hit_rates, axis=0)
-        std_hit_rates = np.std(all_demos_hit_rates, axis=0)
-        mean_subtask_durations = np.mean(all_demos_subtask_durations, axis=0)
-
-        print(f"\nNumber of demos analyzed: {len(all_demos_errors_seconds)}")
-        print(f"Number of trials per demo: {num_trials}")
+        # Calculate and display aggregate statistics across all demos
+        print("\n" + "=" * 70)
+        print(f"=== AGGREGATE STATISTICS ACROSS ALL DEMOS (FPS {fps}) ===")
+        print("=" * 70)
 
-        # Get the maximum number of events across all demos
-        max_events = (
-            mean_errors_seconds.shape[0]
-            if len(mean_errors_seconds.shape) > 0
-            else len(mean_errors_seconds)
-        )
+        scored_demos = np.flatnonzero(stats["num_valid"][:, f_idx] > 0)
+        if len(scored_demos) == 0:
+            print("\nNo valid data to aggregate!")
+            print("=" * 70)
+            continue
+
+        mean_errors_seconds = stats["mean_errors_s"][f_idx]
+        std_errors_seconds = stats["std_errors_s"][f_idx]
+        mean_errors_percent = stats["mean_errors_pct"][f_idx]
+        std_errors_percent = stats["std_errors_pct"][f_idx]
+        mean_hit_rates = stats["mean_hit_rates"][0, f_idx]
+        std_hit_rates = stats["std_hit_rates"][0, f_idx]
+        mean_subtask_durations = np.mean(stats["durations"][scored_demos], axis=0)
+
+        print(f"\nNumber of demos analyzed: {len(scored_demos)}")
+        print(f"Number of trials per demo: {num_trials}")
 
         # Print subtask durations
         duration_str = ", ".join(
-            [f"{mean_subtask_durations[i]:.2f}s" for i in range(max_events)]
+            [f"{mean_subtask_durations[i]:.2f}s" for i in range(num_events)]
         )
         print(f"Average subtask durations across demos: [{duration_str}]")
 
         print("\n--- Average Errors Across All Demos ---")
-        for event_idx in range(max_events):
+        for event_idx in range(num_events):
             print(
                 f"Event {event_idx + 1} - Mean error: {mean_errors_seconds[event_idx]:.3f}s ± {std_errors_seconds[event_idx]:.3f}s ({mean_errors_percent[event_idx]:.1f}% ± {std_errors_percent[event_idx]:.1f}%)"
             )
@@ -540,19 +660,21 @@ Examples:
             f"Overall mean error: {np.mean(mean_errors_percent):.1f}% ± {np.mean(std_errors_percent):.1f}%"
         )
 
-        # Print hit rates dynamically
-        hit_rate_str = ", ".join(
-            [
-                f"Event{i+1}={mean_hit_rates[i]:.3f}±{std_hit_rates[i]:.3f}"
-                for i in range(max_events)
-            ]
-        )
-        print(f"\nMean hit rates: {hit_rate_str}")
+        # Print hit rates for every tolerance window
+        for w_idx, window in enumerate(windows[:, f_idx]):
+            hit_rate_str = ", ".join(
+                [
+                    f"Event{i+1}={stats['mean_hit_rates'][w_idx, f_idx, i]:.3f}"
+                    f"±{stats['std_hit_rates'][w_idx, f_idx, i]:.3f}"
+                    for i in range(num_events)
+                ]
+            )
+            print(f"\nMean hit rates (window {window:.3f}s): {hit_rate_str}")
 
         # Save aggregate statistics
         aggregate_df = pd.DataFrame(
             {
-                "event": [f"Event {i+1}" for i in range(max_events)],
+                "event": [f"Event {i+1}" for i in range(num_events)],
                 "mean_subtask_duration_s": mean_subtask_durations,
                 "mean_error_s": mean_errors_seconds,
                 "std_error_s": std_errors_seconds,
@@ -566,24 +688,30 @@ Examples:
             f"{output_dir}/aggregate_stats_all_demos_fps{fps}.csv", index=False
         )
 
+        # Save hit rates for every tolerance window
+        window_dict = {"window_s": windows[:, f_idx]}
+        for event_idx in range(num_events):
+            window_dict[f"event{event_idx+1}_mean_hit_rate"] = stats["mean_hit_rates"][
+                :, f_idx, event_idx
+            ]
+            window_dict[f"event{event_idx+1}_std_hit_rate"] = stats["std_hit_rates"][
+                :, f_idx, event_idx
+            ]
+        pd.DataFrame(window_dict).to_csv(
+            f"{output_dir}/hit_rates_by_window_fps{fps}.csv", index=False
+        )
+
         # Save detailed per-demo comparison (averaged across trials for each demo)
-        demo_keys = [
-            k
-            for k, v in zip(gt_timestamps.keys(), all_demos_errors_seconds)
-            if v is not None
-        ]
-        comparison_dict = {"demo": demo_keys}
-
-        # Dynamically add columns for each event
-        for event_idx in range(max_events):
-            comparison_dict[f"event{event_idx+1}_error_s"] = all_demos_errors_seconds[
-                :, event_idx
+        comparison_dict = {"demo": [demo_names[d] for d in scored_demos]}
+        for event_idx in range(num_events):
+            comparison_dict[f"event{event_idx+1}_error_s"] = stats["demo_errors_s"][
+                scored_demos, f_idx, event_idx
             ]
-            comparison_dict[f"event{event_idx+1}_error_pct"] = all_demos_errors_percent[
-                :, event_idx
+            comparison_dict[f"event{event_idx+1}_error_pct"] = stats["demo_errors_pct"][
+                scored_demos, f_idx, event_idx
             ]
-            comparison_dict[f"event{event_idx+1}_hit_rate"] = all_demos_hit_rates[
-                :, event_idx
+            comparison_dict[f"event{event_idx+1}_hit_rate"] = stats["demo_hit_rates"][
+                0, scored_demos, f_idx, event_idx
             ]
 
         comparison_df = pd.DataFrame(comparison_dict)
@@ -598,6 +726,3 @@ Examples:
             f"Per-demo comparison saved to: {output_dir}/per_demo_comparison_fps{fps}.csv"
         )
         print("=" * 70)
-    else:
-        print("\nNo valid data to aggregate!")
-        print("=" * 70)
@@ -15,13 +15,22 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import argparse
+import asyncio
+import bisect
 import os
-import pickle
+import random
 import time
 import urllib.parse
 from pathlib import Path
 
-from openai import OpenAI
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, RateLimitError
+from result_log import ResultLog
+
+# Errors worth retrying; anything else (e.g. a bad request) fails the trial at once
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
 
 # User prompts dictionary
 USER_PROMPTS = {
@@ -100,7 +109,90 @@ def get_video_files(video_dir, extensions=(".mp4", ".avi", ".mov", ".mkv", ".web
     return sorted(video_files)
 
 
-def process_video(client, video_path, model_name, max_tokens, user_prompt):
+class RateLimiter:
+    """Token bucket limiting the amount of a resource used per minute
+
+    `acquire` waits until the bucket holds the requested amount. `consume`
+    charges usage only known after the fact (e.g. tokens of a response) and
+    may drive the bucket negative, which delays later `acquire` calls.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1.0):
+        """Wait until `amount` is available and take it"""
+        async with self.lock:
+            self._refill()
+            while self.level < amount:
+                await asyncio.sleep((amount - self.level) / self.rate)
+                self._refill()
+            self.level -= amount
+
+    def consume(self, amount):
+        """Charge `amount` without waiting"""
+        self._refill()
+        self.level -= amount
+
+
+class LatencyHistogram:
+    """Collects request latencies and prints a bucketed histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.latencies = []
+
+    def add(self, latency):
+        self.counts[bisect.bisect_left(self.buckets, latency)] += 1
+        self.latencies.append(latency)
+
+    def summary(self):
+        """Count, mean and percentiles of the recorded latencies"""
+        if not self.latencies:
+            return {"count": 0}
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+        return {
+            "count": len(latencies),
+            "mean": sum(latencies) / len(latencies),
+            "p50": percentile(0.5),
+            "p90": percentile(0.9),
+            "p99": percentile(0.99),
+            "max": latencies[-1],
+        }
+
+    def report(self):
+        stats = self.summary()
+        if stats["count"] == 0:
+            print("No successful requests")
+            return
+
+        print(
+            f"Latency: n={stats['count']} mean={stats['mean']:.2f}s "
+            f"p50={stats['p50']:.2f}s p90={stats['p90']:.2f}s "
+            f"p99={stats['p99']:.2f}s max={stats['max']:.2f}s"
+        )
+        max_count = max(self.counts)
+        labels = [f"<= {b}s" for b in self.buckets] + [f"> {self.buckets[-1]}s"]
+        for label, count in zip(labels, self.counts):
+            bar = "#" * round(40 * count / max_count)
+            print(f"  {label:>8} | {count:5d} {bar}")
+
+
+async def process_video(client, video_path, model_name, max_tokens, user_prompt):
     """Process a single video using OpenAI API"""
     # Create file:// URI for the video
     video_uri = "file://" + urllib.parse.quote(str(video_path), safe="/:")
@@ -117,12 +209,112 @@ def process_video(client, video_path, model_name, max_tokens, user_prompt):
     ]
 
     t0 = time.time()
-    resp = client.chat.completions.create(
+    resp = await client.chat.completions.create(
         model=model_name, messages=messages, max_tokens=max_tokens
     )
     latency = time.time() - t0
 
-    return resp.choices[0].message.content, latency
+    total_tokens = resp.usage.total_tokens if resp.usage is not None else 0
+    return resp.choices[0].message.content, latency, total_tokens
+
+
+async def run_trial(client, video_path, user_prompt, args, limits):
+    """Run one trial with bounded concurrency, rate limits and retries
+
+    Failed attempts with a retryable error are retried with exponential
+    backoff and full jitter, up to `args.max_retries` times.
+    """
+    semaphore, request_limiter, token_limiter = limits
+
+    for attempt in range(args.max_retries + 1):
+        async with semaphore:
+            if request_limiter is not None:
+                await request_limiter.acquire()
+            if token_limiter is not None:
+                # Token usage is only known afterwards, so wait out any debt
+                await token_limiter.acquire(0)
+
+            try:
+                output_text, latency, total_tokens = await process_video(
+                    client, video_path, args.model, args.max_tokens, user_prompt
+                )
+            except RETRYABLE_ERRORS as e:
+                if attempt == args.max_retries:
+                    raise
+                error = e
+            else:
+                if token_limiter is not None:
+                    token_limiter.consume(total_tokens)
+                return output_text, latency, attempt
+
+        # Back off outside of the semaphore so other requests can proceed
+        delay = random.uniform(
+            0, min(args.max_backoff, args.initial_backoff * 2**attempt)
+        )
+        print(f"    Retrying after {delay:.1f}s: {str(error)}")
+        await asyncio.sleep(delay)
+
+
+async def process_all(videos_to_process, user_prompt, args, result_log):
+    """Run all missing videos x trials concurrently and log results as they complete"""
+    # Retries are handled by `run_trial` so that they respect the rate limits
+    client = AsyncOpenAI(
+        api_key=args.api_key,
+        base_url=args.api_base,
+        timeout=args.timeout,
+        max_retries=0,
+    )
+    limits = (
+        asyncio.Semaphore(args.concurrency),
+        RateLimiter(args.requests_per_minute) if args.requests_per_minute else None,
+        RateLimiter(args.tokens_per_minute) if args.tokens_per_minute else None,
+    )
+    histogram = LatencyHistogram()
+
+    async def run(video_name, video_path, fps, trial_num):
+        try:
+            result = await run_trial(client, video_path, user_prompt, args, limits)
+            return video_name, video_path, fps, trial_num, result, None
+        except Exception as e:
+            return video_name, video_path, fps, trial_num, None, e
+
+    tasks = [
+        asyncio.create_task(run(video_name, video_path, fps, trial_num))
+        for video_name, video_path in videos_to_process
+        for fps in [8]
+        for trial_num in result_log.missing_trials(video_name, fps, args.num_trials)
+    ]
+    print(f"Running {len(tasks)} trials ({len(result_log.done)} already done)")
+
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            video_name, video_path, fps, trial_num, result, error = await next_done
+            label = f"{video_name} FPS {fps} trial {trial_num+1}/{args.num_trials}"
+
+            if error is not None:
+                print(f"  {label} - Error: {str(error)}")
+                continue
+
+            output_text, latency, retries = result
+            histogram.add(latency)
+
+            result_log.append(
+                video_name,
+                fps,
+                trial_num,
+                output_text,
+                video_path=video_path,
+            )
+
+            print(
+                f"  {label} - Latency: {latency:.2f}s - Retries: {retries}"
+                f" - Saved to: {result_log.path}"
+            )
+    finally:
+        await client.close()
+
+    print()
+    histogram.report()
 
 
 def main():
@@ -212,12 +404,45 @@ Examples:
         default=3600,
         help="API request timeout in seconds (default: 3600)",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of requests in flight (default: 8)",
+    )
+    parser.add_argument(
+        "--requests_per_minute",
+        type=float,
+        default=None,
+        help="Maximum request rate (default: unlimited)",
+    )
+    parser.add_argument(
+        "--tokens_per_minute",
+        type=float,
+        default=None,
+        help="Maximum prompt + completion token rate (default: unlimited)",
+    )
+    parser.add_argument(
+        "--max_retries",
+        type=int,
+        default=3,
+        help="Retries per trial on connection, rate limit and server errors (default: 3)",
+    )
+    parser.add_argument(
+        "--initial_backoff",
+        type=float,
+        default=1.0,
+        help="Upper bound of the first retry delay in seconds (default: 1.0)",
+    )
+    parser.add_argument(
+        "--max_backoff",
+        type=float,
+        default=60.0,
+        help="Upper bound of any retry delay in seconds (default: 60.0)",
+    )
 
     args = parser.parse_args()
 
-    # Initialize OpenAI client
-    client = OpenAI(api_key=args.api_key, base_url=args.api_base, timeout=args.timeout)
-
     user_prompt = USER_PROMPTS[args.prompt]
 
     print(f"\n{'='*60}")
@@ -227,6 +452,7 @@ Examples:
     print(f"  Prompt: {args.prompt}")
     print(f"  Trials per video: {args.num_trials}")
     print(f"  Max tokens: {args.max_tokens}")
+    print(f"  Concurrency: {args.concurrency}")
     print(f"  Output directory: {args.output_dir}")
 
     # Determine which mode to use
@@ -262,42 +488,10 @@ Examples:
     print(f"{'='*60}\n")
 
     # Process videos
-    for video_name, video_path in videos_to_process:
-        result_dict = {}
-
-        print(f"\nProcessing: {video_name}")
-        print(f"  Video: {video_path}")
-
-        for fps in [8]:
-            print(f"  FPS {fps}:")
-            result_dict["fps" + str(fps)] = []
-            for trial_num in range(args.num_trials):
-                print(f"  Trial {trial_num+1}/{args.num_trials}", end="")
-
-                try:
-                    # Process the video
-                    output_text, latency = process_video(
-                        client, video_path, args.model, args.max_tokens, user_prompt
-                    )
-
-                    result_dict["fps" + str(fps)].append(output_text)
-                    result_dict["video_path"] = video_path
-                    result_dict["model"] = args.model
-                    result_dict["prompt_type"] = args.prompt
-
-                    # Save result_dict after each trial
-                    os.makedirs(args.output_dir, exist_ok=True)
-                    output_file = os.path.join(
-                        args.output_dir, f"results_{video_name}.pkl"
-                    )
-                    with open(output_file, "wb") as f:
-                        pickle.dump(result_dict, f)
-
-                    print(f" - Latency: {latency:.2f}s - Saved to: {output_file}")
-
-                except Exception as e:
-                    print(f" - Error: {str(e)}")
-                    continue
+    # Completed trials are appended to the log, and skipped when resuming
+    run_config = {"model": args.model, "prompt_type": args.prompt}
+    with ResultLog(args.output_dir, run_config) as result_log:
+        asyncio.run(process_all(videos_to_process, user_prompt, args, result_log))
 
     print("\nAll processing completed!")
 
@@ -16,10 +16,10 @@
 
 import argparse
 import os
-import pickle
 import sys
 
 import torch
+from result_log import ResultLog
 from transformers import (
     AutoProcessor,
     Qwen3VLForConditionalGeneration,
@@ -296,6 +296,11 @@ Examples:
         args.num_trials if args.num_trials is not None else config["num_trials"]
     )
 
+    # Completed trials are appended to the log, and skipped when resuming. The
+    # log is opened before loading the model so that a log of another run fails fast.
+    run_config = {"model": args.model, "prompt_type": args.prompt}
+    result_log = ResultLog(args.output_dir, run_config)
+
     # Load model
     model, processor = load_model(config)
 
@@ -339,42 +344,38 @@ Examples:
 
     print(f"{'='*60}\n")
 
-    # Process videos
-    for video_name, video_path in videos_to_process:
-        result_dict = {}
-
-        print(f"\nProcessing: {video_name}")
-        print(f"  Video: {video_path}")
-
-        fps_key = f"fps{args.fps}"
-        print(f"  FPS {args.fps}:\n")
-        result_dict[fps_key] = []
-
-        for trial_num in range(1, num_trials + 1):
-            print(f"  Trial {trial_num}/{num_trials}")
-
-            try:
-                # Process the video
-                output_text = process_video(
-                    model, processor, config, video_path, args.fps, user_prompt
-                )
-
-                result_dict[fps_key].append(output_text)
-                result_dict["video_path"] = video_path
-                result_dict["model"] = args.model
-                result_dict["prompt_type"] = args.prompt
-
-                # Save result_dict after each trial
-                os.makedirs(args.output_dir, exist_ok=True)
-                output_file = f"{args.output_dir}/results_{video_name}.pkl"
-                with open(output_file, "wb") as f:
-                    pickle.dump(result_dict, f)
-
-                print(f"    Saved to: {output_file}")
-
-            except Exception as e:
-                print(f"    Error in trial {trial_num}: {str(e)}")
-                continue
+    with result_log:
+        # Process videos
+        for video_name, video_path in videos_to_process:
+            print(f"\nProcessing: {video_name}")
+            print(f"  Video: {video_path}")
+            print(f"  FPS {args.fps}:\n")
+
+            for trial in range(num_trials):
+                trial_num = trial + 1
+                if result_log.is_done(video_name, args.fps, trial):
+                    print(f"  Trial {trial_num}/{num_trials} already done")
+                    continue
+                print(f"  Trial {trial_num}/{num_trials}")
+
+                try:
+                    # Process the video
+                    output_text = process_video(
+                        model, processor, config, video_path, args.fps, user_prompt
+                    )
+
+                    result_log.append(
+                        video_name,
+                        args.fps,
+                        trial,
+                        output_text,
+                        video_path=video_path,
+                    )
+                    print(f"    Saved to: {result_log.path}")
+
+                except Exception as e:
+                    print(f"    Error in trial {trial_num}: {str(e)}")
+                    continue
 
     print("\nAll processing completed!")
 
@@ -16,9 +16,10 @@
 
 import argparse
 import os
-import pickle
+from concurrent.futures import ThreadPoolExecutor
 
 from qwen_vl_utils import process_vision_info
+from result_log import ResultLog
 from transformers import AutoProcessor
 from vllm import LLM, SamplingParams
 
@@ -99,10 +100,8 @@ def get_video_files(video_dir, extensions=(".mp4", ".avi", ".mov", ".mkv")):
     return sorted(video_files)
 
 
-def process_video(
-    llm, processor, sampling_params, video_path, fps, user_prompt, total_pixels=6422528
-):
-    """Process a single video and return the generated text"""
+def prepare_inputs(processor, video_path, fps, user_prompt, total_pixels=6422528):
+    """Decode a video and build the vLLM request inputs for it"""
     video_messages = [
         {"role": "system", "content": [{"type": "text", "text": SYSTEM_PROMPT}]},
         {
@@ -141,12 +140,127 @@ def process_video(
         "mm_processor_kwargs": video_kwargs,
     }
 
+    return llm_inputs
+
+
+def process_video(
+    llm, processor, sampling_params, video_path, fps, user_prompt, total_pixels=6422528
+):
+    """Process a single video and return the generated text"""
+    llm_inputs = prepare_inputs(processor, video_path, fps, user_prompt, total_pixels)
+
     outputs = llm.generate([llm_inputs], sampling_params=sampling_params)
     generated_text = outputs[0].outputs[0].text
 
     return generated_text
 
 
+def iter_prepared_batches(
+    processor, jobs, user_prompt, total_pixels, batch_size, num_workers
+):
+    """Yield batches of (job, llm_inputs), decoding the next batch in the background
+
+    Each job is a (video_name, video_path, fps, ...) tuple and is decoded exactly once.
+    Jobs whose video fails to decode are reported and left out of the batch.
+    """
+    batches = [jobs[i : i + batch_size] for i in range(0, len(jobs), batch_size)]
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+
+        def submit(batch):
+            return [
+                (
+                    job,
+                    pool.submit(
+                        prepare_inputs,
+                        processor,
+                        job[1],
+                        job[2],
+                        user_prompt,
+                        total_pixels,
+                    ),
+                )
+                for job in batch
+            ]
+
+        pending = submit(batches[0]) if batches else []
+        for batch_idx in range(len(batches)):
+            current = pending
+            if batch_idx + 1 < len(batches):
+                pending = submit(batches[batch_idx + 1])
+
+            prepared = []
+            for job, future in current:
+                try:
+                    prepared.append((job, future.result()))
+                except Exception as e:
+                    print(f"  Error decoding {job[0]} at FPS {job[2]}: {str(e)}")
+            yield prepared
+
+
+def process_videos_batched(
+    llm, processor, sampling_kwargs, videos_to_process, user_prompt, args, result_log
+):
+    """Process all videos x FPS values x trials in large vLLM batches
+
+    Every (video, fps) pair is decoded once and its missing trials are all
+    sampled from one prompt via `SamplingParams.n`. Many pairs are submitted per
+    `llm.generate` call so that vLLM's continuous batching stays busy.
+    """
+    jobs = []
+    for video_name, video_path in videos_to_process:
+        for fps in args.fps_list:
+            trials = result_log.missing_trials(video_name, fps, args.num_trials)
+            if trials:
+                jobs.append((video_name, video_path, fps, trials))
+            else:
+                print(f"  Skipping {video_name} FPS {fps}: all trials done")
+
+    sampling_params_by_n = {}
+
+    def get_sampling_params(n):
+        if n not in sampling_params_by_n:
+            sampling_params_by_n[n] = SamplingParams(**sampling_kwargs, n=n)
+        return sampling_params_by_n[n]
+
+    for prepared in iter_prepared_batches(
+        processor,
+        jobs,
+        user_prompt,
+        args.total_pixels,
+        args.batch_size,
+        args.num_decode_workers,
+    ):
+        if not prepared:
+            continue
+
+        num_requests = sum(len(job[3]) for job, _ in prepared)
+        print(f"\nGenerating {len(prepared)} videos, {num_requests} trials in total")
+        try:
+            outputs = llm.generate(
+                [llm_inputs for _, llm_inputs in prepared],
+                sampling_params=[
+                    get_sampling_params(len(job[3])) for job, _ in prepared
+                ],
+            )
+        except Exception as e:
+            print(f"  Error in batch: {str(e)}")
+            continue
+
+        for ((video_name, video_path, fps, trials), _), output in zip(
+            prepared, outputs
+        ):
+            for trial, completion in zip(trials, output.outputs):
+                result_log.append(
+                    video_name,
+                    fps,
+                    trial,
+                    completion.text,
+                    video_path=video_path,
+                )
+        print(f"  Saved to: {result_log.path}")
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Run vLLM inference on videos with different prompts",
@@ -260,6 +374,23 @@ Examples:
         default=None,
         help="CUDA_VISIBLE_DEVICES to set (e.g., '0,1'). If not specified, uses current environment setting.",
     )
+    parser.add_argument(
+        "--batched",
+        action="store_true",
+        help="Decode each (video, fps) once and submit all videos x trials in large batches",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=16,
+        help="Number of (video, fps) requests per vLLM generate call in batched mode (default: 16)",
+    )
+    parser.add_argument(
+        "--num_decode_workers",
+        type=int,
+        default=4,
+        help="Number of background threads decoding videos in batched mode (default: 4)",
+    )
     return parser.parse_args()
 
 
@@ -290,6 +421,8 @@ def main():
     print(f"  Total pixels: {args.total_pixels}")
     if args.max_model_len:
         print(f"  Max model length: {args.max_model_len}")
+    if args.batched:
+        print(f"  Batched: {args.batch_size} requests per batch")
 
     # Determine which mode to use
     if args.video_dir:
@@ -323,6 +456,11 @@ def main():
 
     print(f"{'='*60}\n")
 
+    # Completed trials are appended to the log, and skipped when resuming. The
+    # log is opened before loading the model so that a log of another run fails fast.
+    run_config = {"model": args.model_path, "prompt_type": args.prompt}
+    result_log = ResultLog(args.output_dir, run_config)
+
     # Initialize the model once
     print(f"Loading model from: {args.model_path}")
     if args.max_model_len:
@@ -337,59 +475,70 @@ def main():
             limit_mm_per_prompt={"image": 10, "video": 10},
         )
 
-    sampling_params = SamplingParams(
+    sampling_kwargs = dict(
         temperature=args.temperature,
         top_p=args.top_p,
         repetition_penalty=args.repetition_penalty,
         max_tokens=args.max_tokens,
     )
+    sampling_params = SamplingParams(**sampling_kwargs)
 
     # Initialize processor once
     processor = AutoProcessor.from_pretrained(args.model_path)
 
-    # Process videos
-    for video_name, video_path in videos_to_process:
-        result_dict = {}
-        result_dict["video_path"] = video_path
-        result_dict["prompt_type"] = args.prompt
-
-        print(f"\nProcessing: {video_name}")
-        print(f"  Video: {video_path}")
-
-        for fps in args.fps_list:
-            print(f"  FPS {fps}:")
-            fps_key = f"fps{fps}"
-            result_dict[fps_key] = []
-
-            for trial_num in range(1, args.num_trials + 1):
-                print(f"    Trial {trial_num}/{args.num_trials}")
-
-                try:
-                    # Process the video
-                    output_text = process_video(
-                        llm,
-                        processor,
-                        sampling_params,
-                        video_path,
-                        fps,
-                        user_prompt,
-                        args.total_pixels,
-                    )
-
-                    result_dict[fps_key].append(output_text)
-
-                    # Save result_dict after each trial
-                    output_file = os.path.join(
-                        args.output_dir, f"results_{video_name}.pkl"
-                    )
-                    with open(output_file, "wb") as f:
-                        pickle.dump(result_dict, f)
-
-                    print(f"      Saved to: {output_file}")
+    with result_log:
+        if args.batched:
+            process_videos_batched(
+                llm,
+                processor,
+                sampling_kwargs,
+                videos_to_process,
+                user_prompt,
+                args,
+                result_log,
+            )
+            print("\nAll processing completed!")
+            return
 
-                except Exception as e:
-                    print(f"      Error in trial {trial_num}: {str(e)}")
-                    continue
+        # Process videos
+        for video_name, video_path in videos_to_process:
+            print(f"\nProcessing: {video_name}")
+            print(f"  Video: {video_path}")
+
+            for fps in args.fps_list:
+                print(f"  FPS {fps}:")
+
+                for trial in range(args.num_trials):
+                    trial_num = trial + 1
+                    if result_log.is_done(video_name, fps, trial):
+                        print(f"    Trial {trial_num}/{args.num_trials} already done")
+                        continue
+                    print(f"    Trial {trial_num}/{args.num_trials}")
+
+                    try:
+                        # Process the video
+                        output_text = process_video(
+                            llm,
+                            processor,
+                            sampling_params,
+                            video_path,
+                            fps,
+                            user_prompt,
+                            args.total_pixels,
+                        )
+
+                        result_log.append(
+                            video_name,
+                            fps,
+                            trial,
+                            output_text,
+                            video_path=video_path,
+                        )
+                        print(f"      Saved to: {result_log.path}")
+
+                    except Exception as e:
+                        print(f"      Error in trial {trial_num}: {str(e)}")
+                        continue
 
     print("\nAll processing completed!")
 
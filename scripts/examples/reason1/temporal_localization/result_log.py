@@ -0,0 +1,154 @@
+# Copyright 2025 NVIDIA CORPORATION & AFFILIATES
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Append-only JSONL log of temporal localization trial outputs.
+
+Every completed trial is appended as one JSON record:
+
+    {"video": ..., "fps": ..., "trial": ..., "output": ..., <metadata>}
+
+Records are flushed as they are written and fsynced in batches, so a crash
+loses at most the last unsynced batch. Reopening the log builds an index of
+the (video, fps, trial) tuples already done so that runners can resume. A log
+belongs to a single run configuration (model and prompt type), and reopening
+it with another one is refused rather than mixing outputs of different runs.
+"""
+
+import json
+import os
+import time
+
+RESULTS_FILE = "results.jsonl"
+
+
+def iter_results(path):
+    """Lazily yield the records of a result log
+
+    Lines that cannot be parsed (e.g. a record torn by a crash) are skipped.
+    """
+    if not os.path.exists(path):
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def load_trial_outputs(results_dir, fps_values=None):
+    """Read the trial outputs of a result log in one pass, grouped by video and FPS
+
+    Returns:
+        dict: {video: {fps: {trial: output}}}, restricted to the FPS values in
+            `fps_values` if given
+    """
+    if fps_values is not None:
+        fps_values = set(fps_values)
+    outputs = {}
+    for record in iter_results(os.path.join(results_dir, RESULTS_FILE)):
+        if fps_values is not None and record["fps"] not in fps_values:
+            continue
+        video_outputs = outputs.setdefault(record["video"], {})
+        video_outputs.setdefault(record["fps"], {})[record["trial"]] = record["output"]
+    return outputs
+
+
+class ResultLog:
+    """Append-only result writer with fsync batching and a resume index
+
+    Args:
+        output_dir: Directory of the log
+        run_config: Metadata identifying the run, e.g. {"model": ..., "prompt_type": ...},
+            added to every record. Raises ValueError if the log already holds
+            records of a run with different values.
+    """
+
+    def __init__(self, output_dir, run_config=None, fsync_every=16, fsync_interval=5.0):
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, RESULTS_FILE)
+        self.run_config = dict(run_config or {})
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+
+        self.done = set()
+        for record in iter_results(self.path):
+            for key, value in self.run_config.items():
+                # Records of older logs may lack some keys
+                if key in record and record[key] != value:
+                    raise ValueError(
+                        f"{self.path} holds results for {key}={record[key]!r}, "
+                        f"not {value!r}; use another output directory"
+                    )
+            self.done.add((record["video"], record["fps"], record["trial"]))
+
+        self._file = open(self.path, "a", encoding="utf-8")
+        # Terminate a record torn by a crash so that the next one starts on its own line
+        if self._file.tell() > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def is_done(self, video, fps, trial):
+        return (video, fps, trial) in self.done
+
+    def missing_trials(self, video, fps, num_trials):
+        """Trial indices in [0, num_trials) that have no result yet"""
+        return [
+            trial for trial in range(num_trials) if not self.is_done(video, fps, trial)
+        ]
+
+    def append(self, video, fps, trial, output, **metadata):
+        """Append the output of one trial"""
+        record = {"video": video, "fps": fps, "trial": trial, "output": output}
+        record.update(self.run_config)
+        record.update(metadata)
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self.done.add((video, fps, trial))
+
+        self._unsynced += 1
+        if (
+            self._unsynced >= self.fsync_every
+            or time.monotonic() - self._last_sync >= self.fsync_interval
+        ):
+            self.sync()
+
+    def sync(self):
+        """Force the appended records to disk"""
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
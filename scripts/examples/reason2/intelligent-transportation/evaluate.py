@@ -14,19 +14,22 @@
 # limitations under the License.
 
 """Evaluate a model on a dataset."""
+import collections
 import concurrent.futures
-import glob
 import json
 import logging as log
+import math
 import os
 import re
+import string
 import sysconfig
 import time
 from argparse import ArgumentParser
 from functools import partial
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 import attrs
+import av
 import yaml
 from PIL import Image
 from qwen_vl_utils import process_vision_info
@@ -45,7 +48,33 @@ from vllm import LLM, SamplingParams
 Processor = AutoProcessor
 
 from utils.model_download import download_checkpoint
-from utils.output import OutputStructure, parse_letter_response, save_results_parallel
+from utils.output import (
+    OutputStructure,
+    ResultStore,
+    compute_accuracy,
+    export_results_json,
+    get_shard_store_path,
+    merge_result_stores,
+    parse_letter_response,
+    parse_option_letters,
+)
+from utils.task_queue import TASK_QUEUE_FNAME, LeaseTaskQueue
+
+# Number of top logprobs requested when scoring option letters
+MAX_OPTION_LOGPROBS = 20
+
+# Pixels covered by one vision token
+VISION_TOKEN_PIXELS = 32 * 32
+# Number of video frames merged into one temporal patch
+VISION_TEMPORAL_PATCH = 2
+# Video sampling rate of `process_vision_info` when the vision config sets none
+DEFAULT_FPS = 2.0
+# Vision tokens assumed for media whose headers cannot be read
+DEFAULT_MEDIA_TOKENS = 8192
+# Tokens assumed per question on top of the shared media prefix
+QUESTION_TOKENS = 256
+# Seconds to wait before asking the task queue again while other workers hold leases
+TASK_QUEUE_POLL_SECONDS = 30
 
 
 def check_python_headers():
@@ -79,6 +108,7 @@ class LlavaInputStructure:
     media_paths: str
     media_mode: str
     correct_answer: str
+    task_id: str
     prompt: Optional[Union[str, List[Dict[str, Any]]]] = None
 
     @classmethod
@@ -93,176 +123,313 @@ class LlavaInputStructure:
             question_idx=qa_pair["id"],
             media_paths=qa_pair["media_paths"],
             media_mode=qa_pair["media_mode"],
+            task_id=qa_pair["task_id"],
             prompt=qa_pair["conversations"][:-1],
         )
 
 
-def prepare_model_inputs_parallel(
+def group_tasks_by_media(input_tasks: List[LlavaInputStructure]) -> List[List[int]]:
+    """
+    Groups task indices by the media they reference, in order of first appearance.
+
+    The vision config is shared by all tasks of a run, so tasks with the same media
+    paths produce the same decoded frames and only need to be decoded once. Within
+    a group, tasks of the same datasource are kept next to each other so that
+    consecutive prompts share the system prompt and media prefix.
+
+    Args:
+        input_tasks: A list of InputStructure objects.
+
+    Returns:
+        A list of groups, each a list of indices into `input_tasks`.
+    """
+    groups: Dict[Tuple[str, Tuple[str, ...]], List[int]] = {}
+    for idx, input_task in enumerate(input_tasks):
+        key = (input_task.media_mode, tuple(input_task.media_paths))
+        groups.setdefault(key, []).append(idx)
+    return [
+        sorted(group, key=lambda idx: input_tasks[idx].datasource)
+        for group in groups.values()
+    ]
+
+
+def estimate_media_tokens(
+    input_task: LlavaInputStructure, vision_config: dict
+) -> float:
+    """
+    Estimates the number of vision tokens of a task's media from their headers.
+
+    Mirrors the frame sampling and resizing of `process_vision_info` closely enough
+    to balance work across workers without decoding anything.
+
+    Args:
+        input_task: The InputStructure object whose media to estimate.
+        vision_config: Vision parameters added to every media entry of the prompt.
+
+    Returns:
+        The estimated number of vision tokens, counting DEFAULT_MEDIA_TOKENS for
+        each media that cannot be read.
+    """
+    num_tokens = 0.0
+    for media_path in input_task.media_paths:
+        try:
+            if input_task.media_mode == "video":
+                with av.open(media_path) as container:
+                    stream = container.streams.video[0]
+                    pixels = stream.codec_context.width * stream.codec_context.height
+                    if stream.duration is not None and stream.time_base:
+                        duration = float(stream.duration * stream.time_base)
+                    else:
+                        duration = (container.duration or 0) / av.time_base
+                num_frames = vision_config.get(
+                    "nframes"
+                ) or duration * vision_config.get("fps", DEFAULT_FPS)
+                num_frames = max(num_frames, VISION_TEMPORAL_PATCH)
+                if "total_pixels" in vision_config:
+                    pixels = min(
+                        pixels,
+                        vision_config["total_pixels"]
+                        / num_frames
+                        * VISION_TEMPORAL_PATCH,
+                    )
+                if "max_pixels" in vision_config:
+                    pixels = min(pixels, vision_config["max_pixels"])
+                num_tokens += (
+                    num_frames / VISION_TEMPORAL_PATCH * pixels / VISION_TOKEN_PIXELS
+                )
+            else:
+                with Image.open(media_path) as image:
+                    width, height = image.size
+                pixels = min(
+                    width * height, vision_config.get("max_pixels", width * height)
+                )
+                num_tokens += pixels / VISION_TOKEN_PIXELS
+        except (OSError, ValueError, IndexError, av.error.FFmpegError) as e:
+            log.warning(
+                f"Could not read the header of {media_path}: {e}. "
+                f"Assuming {DEFAULT_MEDIA_TOKENS} vision tokens."
+            )
+            num_tokens += DEFAULT_MEDIA_TOKENS
+    return num_tokens
+
+
+def iter_model_input_chunks(
     input_tasks: List[LlavaInputStructure],
     processor: Any,
     num_processes: int,
     vision_config: dict,
-) -> List[Any]:
+    chunk_size: int,
+    max_inflight: int,
+) -> Iterator[Tuple[List[int], List[Any]]]:
     """
-    Prepares model inputs for a list of input tasks in parallel using threads.
+    Prepares model inputs on a thread pool and yields them in chunks as they complete.
 
-    This function is suitable for I/O-bound tasks like reading files or
-    processing data structures, as it uses ThreadPoolExecutor. It calls
-    `prepare_single_model_input` for each task. Handles collecting results
-    and filters out any tasks that failed during preparation.
+    Tasks are grouped by media and each group is decoded once, with the decoded
+    frames shared by the inputs of all its questions. Groups are submitted in order
+    through a sliding window so that at most `max_inflight` groups are being
+    prepared, waiting in the buffer or held by the consumer at any time. The inputs
+    of a chunk are released when the consumer asks for the next chunk, so decoded
+    videos never pile up in host memory and generation can start as soon as the
+    first chunk is ready.
 
     Args:
         input_tasks: A list of InputStructure objects to prepare inputs for.
         processor: The model's processor/tokenizer object.
         num_processes: The maximum number of threads to use for parallel execution.
-        fps: The frames per second to associate with video inputs.
-
-    Returns:
-        A list of prepared model input objects. Tasks that failed during
-        preparation are excluded from the list. The order of inputs
-        corresponds to the order of successful tasks in the input list.
+        vision_config: Vision parameters added to every media entry of the prompt.
+        chunk_size: Number of prepared inputs to yield at once. Media groups are
+                    never split, so a chunk may be larger to hold a whole group.
+        max_inflight: Peak number of media groups whose decoded media are held in
+                      memory.
+
+    Yields:
+        Tuples of (task indices, prepared model inputs). The questions of a media
+        group are consecutive so that vLLM prefix caching can reuse their prefix.
+        Tasks that failed during preparation are logged and left out.
     """
     if not input_tasks:
         log.info("No input tasks to prepare model inputs for.")
-        return []
+        return
 
-    # Determine the number of workers, up to the number of tasks
-    num_workers = min(num_processes, len(input_tasks))
+    groups = group_tasks_by_media(input_tasks)
+    chunk_size = max(1, chunk_size)
+    max_inflight = max(1, max_inflight)
+    num_workers = max(1, min(num_processes, max_inflight, len(groups)))
 
     log.info(
-        f"Preparing model inputs in parallel for {len(input_tasks)} tasks "
-        f"using {num_workers} threads."
+        f"Preparing model inputs for {len(input_tasks)} tasks over {len(groups)} media "
+        f"using {num_workers} threads (chunk size {chunk_size}, at most "
+        f"{max_inflight} media in flight)."
     )
 
-    # Create a partial function with fixed arguments for the worker
-
     worker_fn = partial(
-        prepare_single_model_input,
+        prepare_media_group_inputs,
         processor=processor,
         vision_config=vision_config,
     )
 
-    processed_inputs_with_index: List[Tuple[int, Any]] = []
-
-    # Use ThreadPoolExecutor for potentially I/O-bound model input preparation
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-        # Submit tasks and map futures to their original index
-        future_to_idx = {
-            executor.submit(worker_fn, task): i for i, task in enumerate(input_tasks)
-        }
-
-        # Use tqdm to track progress as futures complete
-        for future in tqdm(
-            concurrent.futures.as_completed(future_to_idx),
-            total=len(future_to_idx),
-            desc="Preparing model inputs",
-        ):
-            idx = future_to_idx[future]
-            try:
-                model_input = future.result()
-                if model_input is not None:  # Only append successful results
-                    processed_inputs_with_index.append((idx, model_input))
-            except (ValueError, OSError, RuntimeError) as e:
-                # This catch might be redundant if prepare_single_model_input handles errors,
-                # but included for robustness.
-                log.exception(
-                    f"Unexpected error preparing model input for task {idx}: {e}. Skipping task."
+    next_group = 0
+    # Groups submitted and not yet handed over and released by the consumer
+    num_inflight = 0
+    num_failed = 0
+    future_to_group: Dict[concurrent.futures.Future, int] = {}
+    ready: List[Tuple[int, List[Any]]] = []
+    num_ready_tasks = 0
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=num_workers
+    ) as executor, tqdm(total=len(input_tasks), desc="Preparing model inputs") as pbar:
+        while True:
+            # Keep the window full
+            while num_inflight < max_inflight and next_group < len(groups):
+                group_tasks = [input_tasks[idx] for idx in groups[next_group]]
+                future = executor.submit(worker_fn, group_tasks)
+                future_to_group[future] = next_group
+                next_group += 1
+                num_inflight += 1
+
+            if not future_to_group and not ready:
+                break
+
+            # Flush a partial chunk only when nothing else can complete
+            if future_to_group and num_ready_tasks < chunk_size:
+                done, _ = concurrent.futures.wait(
+                    future_to_group, return_when=concurrent.futures.FIRST_COMPLETED
                 )
-
-    # Sort successful results by original index and extract the inputs
-    processed_inputs_with_index.sort(key=lambda x: x[0])
-    inputs = [inp for idx, inp in processed_inputs_with_index]
-
-    if len(inputs) < len(input_tasks):
+                for future in done:
+                    group_idx = future_to_group.pop(future)
+                    group = groups[group_idx]
+                    pbar.update(len(group))
+                    try:
+                        model_inputs = future.result()
+                    except (ValueError, OSError, RuntimeError) as e:
+                        log.exception(
+                            f"Unexpected error preparing model inputs for tasks {group}: {e}. Skipping tasks."
+                        )
+                        model_inputs = None
+                    if model_inputs is None:
+                        num_failed += len(group)
+                        num_inflight -= 1
+                    else:
+                        ready.append((group_idx, model_inputs))
+                        num_ready_tasks += len(group)
+                continue
+
+            ready.sort(key=lambda x: x[0])
+            chunk_indices: List[int] = []
+            chunk_inputs: List[Any] = []
+            num_chunk_groups = 0
+            for group_idx, model_inputs in ready:
+                if (
+                    chunk_indices
+                    and len(chunk_indices) + len(model_inputs) > chunk_size
+                ):
+                    break
+                chunk_indices.extend(groups[group_idx])
+                chunk_inputs.extend(model_inputs)
+                num_chunk_groups += 1
+            ready = ready[num_chunk_groups:]
+            num_ready_tasks -= len(chunk_indices)
+            yield chunk_indices, chunk_inputs
+            # The consumer is done with the chunk; free its slots in the window
+            num_inflight -= num_chunk_groups
+            del chunk_inputs
+
+    if num_failed:
         log.warning(
-            f"Successfully prepared inputs for {len(inputs)} out of {len(input_tasks)} tasks."
+            f"Successfully prepared inputs for {len(input_tasks) - num_failed} out of {len(input_tasks)} tasks."
         )
 
-    return inputs
-
 
-def prepare_single_model_input(
-    input_task: LlavaInputStructure,
+def prepare_media_group_inputs(
+    input_tasks: List[LlavaInputStructure],
     processor: Any,
     vision_config: dict,
-) -> Optional[Any]:
+) -> Optional[List[Any]]:
     """
-    Worker function to prepare the input data for a single model inference task.
+    Worker function to prepare the input data for all tasks that share the same media.
 
-    Integrates the video path into the prompt structure and applies the model's
-    chat template. Uses `process_vision_info` and formats the final model input
-    based on whether a Hugging Face checkpoint is being used.
+    Integrates the media paths into each prompt structure and applies the model's
+    chat template. The media are decoded once with `process_vision_info` and the
+    decoded frames are shared by the model inputs of every task in the group;
+    only the text prompt differs between them.
 
     Args:
-        input_task: The InputStructure object for the task.
+        input_tasks: The InputStructure objects of one media group.
         processor: The model's processor or tokenizer object, used for template application
                    and input formatting.
-        fps: The frames per second to associate with the video input.
+        vision_config: Vision parameters added to every media entry of the prompt.
 
     Returns:
-        The prepared model input object or None
+        The prepared model input objects, one per task, or None
         if an error occurs during preparation.
     """
-    # Add video information to the user message content
-    # Assuming the user message is the second element and its content is text
-    if (
-        len(input_task.prompt) > 1
-        and input_task.prompt[1]["role"] == "user"
-        and isinstance(input_task.prompt[1]["content"], str)
-    ):
-        content = []
-        media_mode = input_task.media_mode
-        for media_path in input_task.media_paths:
-            video_content = {
-                "type": media_mode,
-                media_mode: media_path,
-            }
-            # Add all key:value pairs from vision_config to the video_content dict
-            for k, v in vision_config.items():
-                video_content[k] = v
-            content.append(video_content)
-        content.append({"type": "text", "text": input_task.prompt[1]["content"]})
-        input_task.prompt[1]["content"] = content
-
-    # Apply the model's chat template to get the final text prompt
-    # Use add_generation_prompt=True to include the prompt part that signals
-    # the model to start generating the response.
-    processed_text_prompt = processor.apply_chat_template(
-        input_task.prompt, tokenize=False, add_generation_prompt=True
-    )
+    processed_text_prompts = []
+    for input_task in input_tasks:
+        # Add video information to the user message content
+        # Assuming the user message is the second element and its content is text
+        if (
+            len(input_task.prompt) > 1
+            and input_task.prompt[1]["role"] == "user"
+            and isinstance(input_task.prompt[1]["content"], str)
+        ):
+            content = []
+            media_mode = input_task.media_mode
+            for media_path in input_task.media_paths:
+                video_content = {
+                    "type": media_mode,
+                    media_mode: media_path,
+                }
+                # Add all key:value pairs from vision_config to the video_content dict
+                for k, v in vision_config.items():
+                    video_content[k] = v
+                content.append(video_content)
+            content.append({"type": "text", "text": input_task.prompt[1]["content"]})
+            input_task.prompt[1]["content"] = content
+
+        # Apply the model's chat template to get the final text prompt
+        # Use add_generation_prompt=True to include the prompt part that signals
+        # the model to start generating the response.
+        processed_text_prompts.append(
+            processor.apply_chat_template(
+                input_task.prompt, tokenize=False, add_generation_prompt=True
+            )
+        )
 
-    # Process vision information (image/video paths) from the prompt structure
+    # Process vision information (image/video paths) from the prompt structure.
+    # All tasks of the group reference the same media, so decode them only once.
+    input_task = input_tasks[0]
     image_inputs, video_inputs, video_kwargs = process_vision_info(
         input_task.prompt,
         image_patch_size=16,
         return_video_kwargs=True,
         return_video_metadata=True,
     )
-    # Format for a potential custom model structure
-    # Assuming video_inputs contains a list and we need the first item
     if not video_inputs and not image_inputs:
         log.error(
             f"No video or image inputs found for task: media_id={input_task.media_id}, question_idx={input_task.question_idx}. Cannot prepare model input."
         )
         return None
 
-    if video_inputs:
-        model_input = {
-            "prompt": processed_text_prompt,
-            "multi_modal_data": {"video": video_inputs},
-            "mm_processor_kwargs": video_kwargs,
-        }
-    else:
-        model_input = {
-            "prompt": processed_text_prompt,
-            "multi_modal_data": {"image": image_inputs},
-        }
+    model_inputs = []
+    for processed_text_prompt in processed_text_prompts:
+        if video_inputs:
+            model_input = {
+                "prompt": processed_text_prompt,
+                "multi_modal_data": {"video": video_inputs},
+                "mm_processor_kwargs": video_kwargs,
+            }
+        else:
+            model_input = {
+                "prompt": processed_text_prompt,
+                "multi_modal_data": {"image": image_inputs},
+            }
+        model_inputs.append(model_input)
 
     log.debug(
-        f"Prepared model input for task: media_id={input_task.media_id}, "
-        f"question_idx={input_task.question_idx}"
+        f"Prepared {len(model_inputs)} model inputs for media: media_id={input_task.media_id}"
     )
-    return model_input
+    return model_inputs
 
 
 # === Model Definition Functions ===
@@ -315,6 +482,8 @@ def define_model(
         limit_mm_per_prompt={"video": 1, "image": 1},
         tensor_parallel_size=tp_size,
         max_model_len=max_length,
+        # Reuse the KV cache of the shared system prompt and media prefix
+        enable_prefix_caching=True,
         max_num_seqs=8,
         gpu_memory_utilization=0.85,
     )
@@ -361,6 +530,8 @@ def make_tasks_from_single_media(
             # Get the correct answer (handles variations in dict key)
             correct_answer=qa_pair["conversations"][-1]["content"],
             output_json_fname=output_json_fname,
+            question_id=str(qa_pair["id"]),
+            task_id=qa_pair["task_id"],
             prompt="",  # This will be filled later
         )
     )
@@ -395,6 +566,10 @@ def make_all_tasks(
 
     # Process each datasource
     qa_pairs = []
+    # Number of questions seen so far per media, to give each task a unique ID.
+    # Annotation IDs are not unique, e.g. the same video name may appear in
+    # several directories of a dataset.
+    num_media_questions = collections.Counter()
     for datasource_name, datasource_config in datasets.items():
         log.info(f"Gathering tasks from dataset: {datasource_name}")
 
@@ -453,8 +628,16 @@ def make_all_tasks(
                 else:
                     media_paths = relative_media_paths
 
+                media_key = (datasource_name, tuple(relative_media_paths))
+                question_num = num_media_questions[media_key]
+                num_media_questions[media_key] += 1
+
                 qa_pairs.append(
                     {
+                        "datasource": datasource_name,
+                        "task_id": json.dumps(
+                            [datasource_name, relative_media_paths, question_num]
+                        ),
                         "media_id": relative_media_paths[0],
                         "id": item["id"],
                         "media_paths": media_paths,
@@ -463,17 +646,24 @@ def make_all_tasks(
                     }
                 )
 
-    shard_qa_pairs = qa_pairs[shard_id::total_shard]
+    # Shard by media so that all questions about a media are decoded by one shard
+    media_ids = list(dict.fromkeys(qa_pair["media_id"] for qa_pair in qa_pairs))
+    shard_media_ids = set(media_ids[shard_id::total_shard])
+    shard_qa_pairs = [
+        qa_pair for qa_pair in qa_pairs if qa_pair["media_id"] in shard_media_ids
+    ]
     log.info(
-        f"Sharding {len(qa_pairs)} tasks into {total_shard} shards, shard {shard_id} has {len(shard_qa_pairs)} tasks."
+        f"Sharding {len(qa_pairs)} tasks over {len(media_ids)} media into {total_shard} shards, "
+        f"shard {shard_id} has {len(shard_qa_pairs)} tasks over {len(shard_media_ids)} media."
     )
     for qa_pair in shard_qa_pairs:
         output_json_fname = os.path.join(
-            results_output_folder, datasource_name, f"{qa_pair['media_id']}.json"
+            results_output_folder,
+            qa_pair["datasource"],
+            f"{qa_pair['media_id']}.json",
         )
-        os.makedirs(os.path.dirname(output_json_fname), exist_ok=True)
         input_task, output_result = make_tasks_from_single_media(
-            output_json_fname, qa_pair, datasource_name
+            output_json_fname, qa_pair, qa_pair["datasource"]
         )
         input_tasks.extend(input_task)
         output_results.extend(output_result)
@@ -484,6 +674,108 @@ def make_all_tasks(
 # === Model Execution Functions ===
 
 
+def get_letter_token_ids(tokenizer: Any) -> dict[str, int]:
+    """
+    Maps every uppercase letter that is encoded as a single token to its token ID.
+
+    Args:
+        tokenizer: The model's tokenizer.
+
+    Returns:
+        A dictionary mapping letters to token IDs.
+    """
+    letter_token_ids = {}
+    for letter in string.ascii_uppercase:
+        token_ids = tokenizer.encode(letter, add_special_tokens=False)
+        if len(token_ids) == 1:
+            letter_token_ids[letter] = token_ids[0]
+    return letter_token_ids
+
+
+def score_letter_options(
+    model: LLM,
+    inputs: list[str],
+    input_tasks: list[LlavaInputStructure],
+    output_results: list[OutputStructure],
+    letter_token_ids: dict[str, int],
+    seed: int = 0,
+) -> None:
+    """
+    Scores multiple choice tasks from the next-token distribution over the option letters.
+
+    Each task runs a single prefill pass that samples exactly one token, restricted
+    to the task's option letters, and returns the top logprobs. The answer is the
+    most likely option and the option probabilities, renormalized over the options,
+    are stored with the result. Options outside the returned top logprobs get a
+    probability of zero. No decoding steps or retries are needed.
+
+    Args:
+        model: The loaded VLLM model.
+        inputs: A list of prompt strings for the model.
+        input_tasks: List of original InputStructure objects.
+        output_results: List of OutputStructure objects to update with results.
+        letter_token_ids: Token ID of each letter, from `get_letter_token_ids`.
+        seed: Random seed for sampling.
+    """
+    task_letters = []
+    sampling_params = []
+    for input_task in input_tasks:
+        letters = [
+            letter
+            for letter in parse_option_letters(input_task.question)
+            if letter in letter_token_ids
+        ]
+        task_letters.append(letters)
+        sampling_params.append(
+            SamplingParams(
+                temperature=0.0,
+                max_tokens=1,
+                allowed_token_ids=[letter_token_ids[letter] for letter in letters],
+                logprobs=MAX_OPTION_LOGPROBS,
+                seed=seed,
+            )
+        )
+
+    log.info(f"Scoring options for {len(inputs)} tasks using VLLM...")
+    list_of_requestoutput = model.generate(inputs, sampling_params)
+    log.info(f"Finished VLLM scoring. Received {len(list_of_requestoutput)} outputs.")
+
+    for requestoutput, input_task, output_result, letters in zip(
+        list_of_requestoutput, input_tasks, output_results, task_letters, strict=False
+    ):
+        completion = requestoutput.outputs[0]
+        top_logprobs = completion.logprobs[0] if completion.logprobs else {}
+        letter_logprobs = {
+            letter: top_logprobs[letter_token_ids[letter]].logprob
+            for letter in letters
+            if letter_token_ids[letter] in top_logprobs
+        }
+
+        # Renormalize over the options (subtract the max for numerical stability)
+        option_probs = {}
+        if letter_logprobs:
+            max_logprob = max(letter_logprobs.values())
+            weights = {
+                letter: math.exp(logprob - max_logprob)
+                for letter, logprob in letter_logprobs.items()
+            }
+            total = sum(weights.values())
+            option_probs = {
+                letter: weights.get(letter, 0.0) / total for letter in letters
+            }
+            answer = max(option_probs, key=option_probs.get)
+        else:
+            answer, _ = parse_letter_response(completion.text)
+
+        output_result.prompt = input_task.prompt  # Store the original prompt
+        output_result.reasoning = ""
+        output_result.answer = answer
+        output_result.full_response = completion.text
+        output_result.option_probs = option_probs
+        output_result.confidence = option_probs.get(answer, 0.0)
+        output_result.is_correct = answer.lower() == input_task.correct_answer.lower()
+
+
 def run_model(
     model: LLM,
     inputs: list[str],  # VLLM generate takes list of prompts
@@ -498,6 +790,7 @@ def run_model(
     presence_penalty: float = 0.0,
     frequency_penalty: float = 0.0,
     seed: int = 0,
+    letter_token_ids: Optional[dict[str, int]] = None,
 ) -> None:
     """
     Runs the VLLM model on the provided inputs and processes the outputs.
@@ -517,7 +810,16 @@ def run_model(
         presence_penalty: Penalty for using tokens already present.
         frequency_penalty: Penalty based on token frequency.
         seed: Random seed for sampling.
+        letter_token_ids: Token ID of each letter. If given and answer_type is
+                          "letter", tasks are scored from the option logprobs
+                          with `score_letter_options` instead of generated.
     """
+    if answer_type == "letter" and letter_token_ids:
+        score_letter_options(
+            model, inputs, input_tasks, output_results, letter_token_ids, seed
+        )
+        return
+
     # Configure sampling parameters based on the expected answer type
     if answer_type == "letter":
         # Use greedy decoding (temperature=0, top_k=1) for letter answers
@@ -651,22 +953,221 @@ def run_model(
             )
 
 
-def run_evaluation_metrics(result_path):
+def run_tasks(
+    input_tasks: list[LlavaInputStructure],
+    output_results: list[OutputStructure],
+    model: LLM,
+    processor: Any,
+    result_store: ResultStore,
+    num_processes: int,
+    vision_config: dict,
+    chunk_size: int,
+    max_inflight_videos: int,
+    run_model_kwargs: dict[str, Any],
+    on_chunk_done: Optional[Callable[[], Any]] = None,
+) -> None:
+    """
+    Prepares inputs, generates outputs and stores the results of tasks chunk by chunk.
+
+    Inputs are prepared on a worker pool while the model generates the previous
+    chunk, and results are added to the result store as soon as their chunk
+    finishes. Tasks whose inputs could not be prepared are stored unanswered so
+    that they still count towards the accuracy.
+
+    Args:
+        input_tasks: List of InputStructure objects to evaluate.
+        output_results: List of OutputStructure objects to update with results.
+        model: The loaded VLLM model.
+        processor: The model's processor/tokenizer object.
+        result_store: The result store to add the results to.
+        num_processes: The maximum number of threads used to prepare inputs.
+        vision_config: Vision parameters added to every media entry of the prompt.
+        chunk_size: Number of tasks per generate call.
+        max_inflight_videos: Peak number of decoded videos held in memory.
+        run_model_kwargs: Arguments of `run_model` other than the model and tasks.
+        on_chunk_done: Called after each chunk, e.g. to renew task leases.
+    """
+    start_time = time.time()
+    saved_indices: set[int] = set()
+    chunks = iter_model_input_chunks(
+        input_tasks,
+        processor,
+        num_processes,
+        vision_config,
+        chunk_size,
+        max_inflight_videos,
+    )
+    for chunk_indices, chunk_inputs in chunks:
+        chunk_tasks = [input_tasks[i] for i in chunk_indices]
+        chunk_results = [output_results[i] for i in chunk_indices]
+
+        # Run evaluation using the VLLM backend
+        run_model(
+            model,
+            chunk_inputs,  # VLLM expects list of strings (prompts) directly
+            chunk_tasks,
+            chunk_results,
+            **run_model_kwargs,
+        )
+
+        # Buffer the updated OutputStructure objects in the result store
+        result_store.add(chunk_results)
+        saved_indices.update(chunk_indices)
+        # Drop the decoded media before the next chunk is requested
+        del chunk_inputs
+        if on_chunk_done is not None:
+            on_chunk_done()
+        log.info(
+            f"Finished {len(saved_indices)}/{len(input_tasks)} tasks "
+            f"({time.time() - start_time:.2f} seconds elapsed)."
+        )
+
+    unprepared_results = [
+        output_result
+        for i, output_result in enumerate(output_results)
+        if i not in saved_indices
+    ]
+    if unprepared_results:
+        log.warning(f"Saving {len(unprepared_results)} tasks without model outputs.")
+        result_store.add(unprepared_results)
+
+
+def populate_task_queue(
+    task_queue: LeaseTaskQueue,
+    input_tasks: list[LlavaInputStructure],
+    num_processes: int,
+    vision_config: dict,
+) -> None:
+    """
+    Adds all tasks to the task queue, one group per media, with the estimated
+    token count of the group as its cost.
+
+    Args:
+        task_queue: The task queue to populate.
+        input_tasks: List of all InputStructure objects of the evaluation.
+        num_processes: The maximum number of threads used to read media headers.
+        vision_config: Vision parameters added to every media entry of the prompt.
+    """
+    groups = group_tasks_by_media(input_tasks)
+    log.info(f"Estimating the token counts of {len(groups)} media...")
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, num_processes)
+    ) as executor:
+        media_tokens = list(
+            executor.map(
+                partial(estimate_media_tokens, vision_config=vision_config),
+                [input_tasks[group[0]] for group in groups],
+            )
+        )
+
+    queue_groups = []
+    for group, num_tokens in zip(groups, media_tokens, strict=True):
+        first_task = input_tasks[group[0]]
+        group_key = json.dumps([first_task.media_mode, list(first_task.media_paths)])
+        task_ids = [input_tasks[idx].task_id for idx in group]
+        queue_groups.append(
+            (group_key, task_ids, num_tokens + QUESTION_TOKENS * len(group))
+        )
+    task_queue.populate(queue_groups)
+    log.info(f"Added {len(queue_groups)} task groups to '{task_queue.path}'.")
+
+
+def run_task_queue(
+    task_queue: LeaseTaskQueue,
+    worker_id: str,
+    input_tasks: list[LlavaInputStructure],
+    output_results: list[OutputStructure],
+    result_store: ResultStore,
+    lease_token_budget: float,
+    lease_seconds: float,
+    **run_tasks_kwargs: Any,
+) -> None:
     """
-    Calculates the accuracy of the model on the model responses in the results directory.
+    Evaluates task groups leased from the task queue until all groups are done.
+
+    Each lease covers groups worth up to `lease_token_budget` estimated tokens.
+    Leases are renewed after every chunk, and groups are marked done only after
+    their results are written to the result store. When no group is available,
+    the worker waits for the groups leased by other workers, taking them over if
+    their leases expire.
+
+    Args:
+        task_queue: The task queue shared by all workers.
+        worker_id: The ID of this worker.
+        input_tasks: List of all InputStructure objects of the evaluation.
+        output_results: List of all OutputStructure objects of the evaluation.
+        result_store: The result store of this worker.
+        lease_token_budget: Estimated token count of the groups leased at once.
+        lease_seconds: Duration of a lease.
+        **run_tasks_kwargs: Further arguments of `run_tasks`.
     """
-    correct_count = 0
-    total_count = 0
-    result_files = glob.glob(os.path.join(result_path, "**", "*.json"), recursive=True)
-    for result_file in result_files:
-        if "results.json" in result_file:
+    task_index = {input_task.task_id: i for i, input_task in enumerate(input_tasks)}
+    num_finished = 0
+    while True:
+        leased = task_queue.lease(worker_id, lease_token_budget, lease_seconds)
+        if not leased:
+            num_unfinished = task_queue.num_unfinished()
+            if not num_unfinished:
+                break
+            log.info(
+                f"Waiting for {num_unfinished} task groups leased by other workers..."
+            )
+            time.sleep(TASK_QUEUE_POLL_SECONDS)
             continue
-        with open(result_file, "r") as f:
-            result = json.load(f)
-            for item in result:
-                if item["correct_answer"].lower() == item["answer"].lower():
-                    correct_count += 1
-                total_count += 1
+
+        group_keys = [group_key for group_key, _ in leased]
+        indices = []
+        for _, task_ids in leased:
+            for task_id in task_ids:
+                if task_id in task_index:
+                    indices.append(task_index[task_id])
+                else:
+                    log.warning(
+                        f"Task {task_id} from the task queue is not part of this "
+                        "evaluation. Was the queue created with another config?"
+                    )
+        log.info(
+            f"Worker {worker_id} leased {len(leased)} media with {len(indices)} tasks."
+        )
+
+        run_tasks(
+            [input_tasks[i] for i in indices],
+            [output_results[i] for i in indices],
+            result_store=result_store,
+            on_chunk_done=partial(
+                task_queue.renew, worker_id, group_keys, lease_seconds
+            ),
+            **run_tasks_kwargs,
+        )
+        # The results must be on disk before the groups are marked done
+        result_store.flush()
+        task_queue.complete(group_keys)
+        num_finished += len(indices)
+        log.info(f"Worker {worker_id} finished {num_finished} tasks so far.")
+
+    abandoned_task_ids = task_queue.abandoned_task_ids()
+    if abandoned_task_ids:
+        log.warning(
+            f"{len(abandoned_task_ids)} tasks were abandoned after their leases expired "
+            f"{task_queue.max_attempts} times: {abandoned_task_ids}"
+        )
+
+
+def run_evaluation_metrics(
+    result_path, total_shard=1, export_json=False, deduplicate=False
+):
+    """
+    Merges the shard result stores and calculates the accuracy of the model
+    on the model responses in the results directory.
+
+    Args:
+        result_path: The results directory of the evaluation.
+        total_shard: The total number of shards.
+        export_json: Also export the results to one JSON file per media.
+        deduplicate: Keep only the first result of each task.
+    """
+    store_path = merge_result_stores(result_path, total_shard, deduplicate)
+    correct_count, total_count = compute_accuracy(store_path)
 
     if total_count == 0:
         log.warning("No results found. Please check the results directory.")
@@ -685,6 +1186,9 @@ def run_evaluation_metrics(result_path):
     with open(os.path.join(result_path, "results.json"), "w") as f:
         json.dump(results, f)
 
+    if export_json:
+        export_results_json(store_path)
+
 
 # === Main Function and Script Entry Point ===
 def main():
@@ -732,6 +1236,14 @@ def main():
         help="Shard ID.",
     )
 
+    parser.add_argument(
+        "--dynamic_sharding",
+        action="store_true",
+        help="Lease tasks from a queue shared by all shards instead of splitting "
+        "them statically. Start one process per shard with the same --total_shard "
+        "and --results_dir; re-running a shard resumes it.",
+    )
+
     args = parser.parse_args()
 
     # Load configuration from YAML file
@@ -773,6 +1285,13 @@ def main():
     answer_type = eval_config.get("answer_type", "reasoning")
     num_processes = eval_config.get("num_processes", 80)
     seed = eval_config.get("seed", 1)
+    letter_scoring = eval_config.get("letter_scoring", "generate")
+    result_batch_size = eval_config.get("result_batch_size", 256)
+    export_json = eval_config.get("export_json", False)
+    lease_token_budget = eval_config.get("lease_token_budget", 500000)
+    lease_seconds = eval_config.get("lease_seconds", 1800)
+    chunk_size = eval_config.get("chunk_size", 64)
+    max_inflight_videos = eval_config.get("max_inflight_videos", 256)
 
     # --- Generation Parameters ---
     max_retries = gen_config.get("max_retries", 10)
@@ -800,6 +1319,15 @@ def main():
     log.info(f"  Answer type: {answer_type}")
     log.info(f"  Number of processes: {num_processes}")
     log.info(f"  Seed: {seed}")
+    log.info(f"  Letter scoring: {letter_scoring}")
+    log.info(f"  Result batch size: {result_batch_size}")
+    log.info(f"  Export JSON: {export_json}")
+    log.info(f"  Dynamic sharding: {args.dynamic_sharding}")
+    if args.dynamic_sharding:
+        log.info(f"  Lease token budget: {lease_token_budget}")
+        log.info(f"  Lease seconds: {lease_seconds}")
+    log.info(f"  Chunk size: {chunk_size}")
+    log.info(f"  Max in-flight videos: {max_inflight_videos}")
     log.info("--- Vision Configuration ---")
     log.info(f"  Vision config: {vision_config}")
     log.info("--- Generation Configuration ---")
@@ -829,8 +1357,9 @@ def main():
         datasets,  # Use the datasets list directly instead of a file
         results_output_dir,  # Pass the full results directory
         answer_type,
-        args.total_shard,
-        args.shard_id,
+        # With dynamic sharding every shard gathers all tasks and leases them
+        1 if args.dynamic_sharding else args.total_shard,
+        0 if args.dynamic_sharding else args.shard_id,
     )
     log.info(f"Initial number of tasks gathered: {len(input_tasks)}")
 
@@ -848,59 +1377,88 @@ def main():
     )
     log.info(f"Time taken to load model: {time.time() - start_time:.2f} seconds")
 
-    # === Step 3: Prepare model inputs ===
-    log.info("Preparing model inputs in parallel...")
-    start_time = time.time()
-    # Prepare inputs based on the chosen backend (HF or VLLM)
-    # This step tokenizes prompts and handles image/video encoding if needed
-    inputs = prepare_model_inputs_parallel(
-        input_tasks,
-        processor,
-        num_processes,
-        vision_config,
-    )
-    log.info(f"Prepared inputs for {len(inputs)} tasks.")
-    log.info(
-        f"Time taken to prepare model inputs: {time.time() - start_time:.2f} seconds"
-    )
+    # Score letter answers from the option logprobs instead of generating them
+    letter_token_ids = None
+    if answer_type == "letter" and letter_scoring == "logprobs":
+        letter_token_ids = get_letter_token_ids(processor.tokenizer)
+    elif letter_scoring != "generate":
+        log.warning(
+            f"Ignoring letter_scoring={letter_scoring!r}; only 'generate' and "
+            "'logprobs' (with answer_type 'letter') are supported."
+        )
 
-    # === Step 4: Generate outputs using the model ===
-    log.info("Generating outputs using the model...")
-    start_time = time.time()
+    run_model_kwargs = {
+        # Need the EOS token ID from the processor's tokenizer for VLLM stopping
+        "stop_token_id": processor.tokenizer.eos_token_id,
+        "answer_type": answer_type,
+        "max_retries": max_retries,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "repetition_penalty": repetition_penalty,
+        "presence_penalty": presence_penalty,
+        "frequency_penalty": frequency_penalty,
+        "seed": seed,
+        "letter_token_ids": letter_token_ids,
+    }
+    run_tasks_kwargs = {
+        "model": model,
+        "processor": processor,
+        "num_processes": num_processes,
+        "vision_config": vision_config,
+        "chunk_size": chunk_size,
+        "max_inflight_videos": max_inflight_videos,
+        "run_model_kwargs": run_model_kwargs,
+    }
 
-    # Run evaluation using the VLLM backend
-    # Need the EOS token ID from the processor's tokenizer for VLLM stopping
-    run_model(
-        model,
-        inputs,  # VLLM expects list of strings (prompts) directly
-        input_tasks,
-        output_results,
-        processor.tokenizer.eos_token_id,  # Pass EOS token ID for VLLM stopping
-        answer_type,
-        max_retries,
-        max_tokens,
-        temperature,
-        repetition_penalty,
-        presence_penalty,
-        frequency_penalty,
-        seed,
+    # === Step 3: Prepare inputs, generate and save results chunk by chunk ===
+    log.info("Preparing inputs and generating outputs chunk by chunk...")
+    start_time = time.time()
+    shard_store_path = get_shard_store_path(
+        results_output_dir, args.shard_id, args.total_shard
     )
+    if args.dynamic_sharding:
+        # Tasks are leased from a queue shared by all shards. A restarted shard
+        # keeps its stored results and skips the task groups that are done.
+        task_queue = LeaseTaskQueue(os.path.join(results_output_dir, TASK_QUEUE_FNAME))
+        if not task_queue.is_populated():
+            populate_task_queue(task_queue, input_tasks, num_processes, vision_config)
+        with task_queue, ResultStore(
+            shard_store_path, batch_size=result_batch_size
+        ) as result_store:
+            run_task_queue(
+                task_queue,
+                f"shard-{args.shard_id}",
+                input_tasks,
+                output_results,
+                result_store,
+                lease_token_budget,
+                lease_seconds,
+                **run_tasks_kwargs,
+            )
+    else:
+        # Each shard appends to its own store; a re-run of a shard replaces its results
+        if os.path.exists(shard_store_path):
+            os.remove(shard_store_path)
+        with ResultStore(
+            shard_store_path, batch_size=result_batch_size
+        ) as result_store:
+            run_tasks(
+                input_tasks,
+                output_results,
+                result_store=result_store,
+                **run_tasks_kwargs,
+            )
     log.info(
-        f"Time taken for model generation and output processing: {time.time() - start_time:.2f} seconds"
+        f"Time taken for input preparation, model generation and saving results: {time.time() - start_time:.2f} seconds"
     )
-
-    # === Step 5: Save results in parallel ===
-    log.info("Saving results in parallel...")
-    start_time = time.time()
-    # Save the updated OutputStructure objects to JSON files
-    save_results_parallel(output_results, num_processes=num_processes)
-    log.info(f"Time taken to save results: {time.time() - start_time:.2f} seconds")
     log.info("Evaluation completed.")
 
-    # === Step 6: Run evaluation metrics ===
+    # === Step 4: Run evaluation metrics ===
     log.info("Running evaluation metrics...")
     start_time = time.time()
-    run_evaluation_metrics(results_output_dir)
+    run_evaluation_metrics(
+        results_output_dir, args.total_shard, export_json, args.dynamic_sharding
+    )
     log.info(
         f"Time taken to run evaluation metrics: {time.time() - start_time:.2f} seconds"
     )
@@ -13,11 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import concurrent.futures
+import itertools
 import json
 import logging as log
 import os
 import re
+import sqlite3
 
 import attrs
 
@@ -34,6 +35,8 @@ class OutputStructure:
     datasource: str
     video_id: str
     output_json_fname: str  # Specifies the output file path for this item
+    question_id: str = ""  # ID of the question in the annotation file
+    task_id: str = ""  # Unique ID of the task in the evaluation
 
     # Input fields related to the prompt/task
     prompt: str = ""
@@ -47,6 +50,12 @@ class OutputStructure:
     # Evaluation field
     is_correct: bool = False  # Boolean indicating if the extracted answer is correct
 
+    # Fields for logprob-based multiple choice scoring
+    option_probs: dict = attrs.field(
+        factory=dict
+    )  # Probability of each option letter, renormalized over the options
+    confidence: float = 0.0  # Probability of the selected answer
+
     @classmethod
     def from_dict(cls, data: dict) -> "OutputStructure":
         """
@@ -61,12 +70,16 @@ class OutputStructure:
         return cls(
             datasource=data.get("datasource", ""),
             video_id=data.get("video_id", ""),
+            question_id=data.get("question_id", ""),
+            task_id=data.get("task_id", ""),
             prompt=data.get("prompt", ""),
             correct_answer=data.get("correct_answer", ""),
             reasoning=data.get("reasoning", ""),
             answer=data.get("answer", ""),
             full_response=data.get("full_response", ""),
             is_correct=data.get("is_correct", False),
+            option_probs=data.get("option_probs", {}),
+            confidence=data.get("confidence", 0.0),
             output_json_fname=data.get(
                 "output_json_fname"
             ),  # Note: output_json_fname is used internally but not saved in the final JSON
@@ -81,6 +94,27 @@ ANSWER_PATTERN = re.compile(r"<answer>(.*?)</answer>", re.DOTALL)
 REASONING_PATTERN = re.compile(r"<think>(.*?)</think>", re.DOTALL)
 # Regex pattern to find a single uppercase letter (A-Z)
 SINGLE_LETTER_PATTERN = re.compile(r"[A-Z]")
+# Regex pattern to find option letters listed at the start of a line (e.g. "A: ...")
+OPTION_LETTER_PATTERN = re.compile(r"^\s*([A-Z])\s*[:.)]", re.MULTILINE)
+# Options assumed when a question does not list any
+DEFAULT_OPTION_LETTERS = "ABCD"
+
+
+def parse_option_letters(question: str) -> list[str]:
+    """
+    Extracts the option letters of a multiple choice question.
+
+    Options are expected at the start of a line, e.g. "A: ..." or "B. ...".
+
+    Args:
+        question: The question text including its options.
+
+    Returns:
+        The option letters in order of appearance, or the default options
+        A-D if none are found.
+    """
+    letters = list(dict.fromkeys(OPTION_LETTER_PATTERN.findall(question)))
+    return letters or list(DEFAULT_OPTION_LETTERS)
 
 
 def parse_letter_response(output_text: str) -> tuple[str, str]:
@@ -108,108 +142,229 @@ def parse_letter_response(output_text: str) -> tuple[str, str]:
     return answer, reasoning
 
 
-def save_single_file(args: tuple[str, list["OutputStructure"]]):
+#  ------------- result store -------------
+
+# File name of the merged result store in the results directory
+RESULT_STORE_FNAME = "results.sqlite"
+# Directory, relative to the results directory, holding the per-shard stores
+SHARD_STORE_DIR = "shards"
+
+# Column types of the results table, one column per OutputStructure field
+RESULT_COLUMNS = {
+    "datasource": "TEXT",
+    "video_id": "TEXT",
+    "output_json_fname": "TEXT",
+    "question_id": "TEXT",
+    "task_id": "TEXT",
+    "prompt": "TEXT",
+    "correct_answer": "TEXT",
+    "reasoning": "TEXT",
+    "answer": "TEXT",
+    "full_response": "TEXT",
+    "is_correct": "INTEGER",
+    "option_probs": "TEXT",
+    "confidence": "REAL",
+}
+# Columns holding JSON-encoded values
+JSON_COLUMNS = ("prompt", "option_probs")
+
+_CREATE_RESULTS_TABLE = "CREATE TABLE IF NOT EXISTS results ({})".format(
+    ", ".join(f"{name} {sql_type}" for name, sql_type in RESULT_COLUMNS.items())
+)
+_COLUMN_NAMES = ", ".join(RESULT_COLUMNS)
+
+
+def _result_to_row(result: OutputStructure) -> tuple:
+    """Converts an OutputStructure object to a row of the results table."""
+    row = []
+    for name in RESULT_COLUMNS:
+        value = getattr(result, name)
+        if name in JSON_COLUMNS:
+            value = json.dumps(value)
+        row.append(value)
+    return tuple(row)
+
+
+def get_shard_store_path(result_path: str, shard_id: int, total_shard: int) -> str:
     """
-    Helper function to save a list of OutputStructure objects to a single JSON file.
-    Intended for use with multiprocessing.
-
-    If the output file already exists, loads its contents, appends the new results,
-    and overwrites the file with the combined list.
+    Returns the path of the result store written by one shard.
 
     Args:
-        args: A tuple containing the target output JSON filename (str)
-              and a list of OutputStructure objects to save to that file.
+        result_path: The results directory of the evaluation.
+        shard_id: The shard ID.
+        total_shard: The total number of shards.
     """
-    output_json_fname, results = args
+    return os.path.join(
+        result_path,
+        SHARD_STORE_DIR,
+        f"results-{shard_id:05d}-of-{total_shard:05d}.sqlite",
+    )
 
-    # Convert OutputStructure objects to dictionaries for JSON serialization
-    results_dicts = [attrs.asdict(result) for result in results]
 
-    # Remove the internal 'output_json_fname' key from dictionaries before saving
-    for result_dict in results_dicts:
-        result_dict.pop("output_json_fname", None)
+class ResultStore:
+    """
+    SQLite store of evaluation results, with one column per OutputStructure field.
 
-    # Ensure the output directory exists
-    output_dir = os.path.dirname(output_json_fname)
-    if output_dir:  # Only try to create directory if path is not just a filename
-        os.makedirs(output_dir, exist_ok=True)
+    Results are buffered and appended in batches of `batch_size` rows, one
+    transaction per batch. Each shard writes its own store, and the shard stores
+    are combined with `merge_result_stores` once evaluation is done.
+    """
 
-    try:
-        # If file exists, load and extend
-        if os.path.exists(output_json_fname):
-            try:
-                with open(output_json_fname, "r") as f:
-                    existing_data = json.load(f)
-                if not isinstance(existing_data, list):
-                    log.warning(
-                        f"Existing file '{output_json_fname}' does not contain a list. Overwriting."
-                    )
-                    existing_data = []
-            except Exception as e:
-                log.warning(
-                    f"Could not load existing JSON from '{output_json_fname}': {e}. Overwriting."
-                )
-                existing_data = []
-            combined_data = existing_data + results_dicts
-        else:
-            combined_data = results_dicts
-
-        with open(output_json_fname, "w") as f:
-            json.dump(combined_data, f, indent=4)
-        log.info(
-            f"Successfully wrote {len(results_dicts)} new results (total {len(combined_data)}) to '{output_json_fname}'"
-        )
-    except Exception as e:
-        log.error(
-            f"An error occurred while writing to JSON file '{output_json_fname}': {e}"
+    def __init__(self, path: str, batch_size: int = 256):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_CREATE_RESULTS_TABLE)
+        self._conn.commit()
+        self._buffer: list[tuple] = []
+
+    def add(self, output_results: list[OutputStructure]):
+        """Buffers results and appends them once a batch is full."""
+        self._buffer.extend(_result_to_row(result) for result in output_results)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Appends all buffered results."""
+        if not self._buffer:
+            return
+        placeholders = ", ".join("?" * len(RESULT_COLUMNS))
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT INTO results ({_COLUMN_NAMES}) VALUES ({placeholders})",
+                self._buffer,
+            )
+        log.info(f"Appended {len(self._buffer)} results to '{self.path}'")
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def merge_result_stores(
+    result_path: str, total_shard: int, deduplicate: bool = False
+) -> str:
+    """
+    Merges the shard result stores of an evaluation into a single store.
+
+    The merged store is written to a temporary file and moved into place, so a
+    previous merged store is only replaced once the merge succeeded.
+
+    Args:
+        result_path: The results directory of the evaluation.
+        total_shard: The total number of shards.
+        deduplicate: Keep only the first result of each task, for runs in which
+                     a task may have been evaluated twice.
+
+    Returns:
+        The path of the merged store.
+    """
+    shard_paths = [
+        get_shard_store_path(result_path, shard_id, total_shard)
+        for shard_id in range(total_shard)
+    ]
+    missing = [path for path in shard_paths if not os.path.exists(path)]
+    if missing:
+        log.warning(
+            f"{len(missing)} of {total_shard} shard result stores are missing; "
+            "the merged results only cover the finished shards."
         )
 
+    store_path = os.path.join(result_path, RESULT_STORE_FNAME)
+    # Workers may merge concurrently, so each writes its own temporary file
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
 
-def save_results_parallel(
-    output_results: list[OutputStructure], num_processes: int = 4
-):
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute(_CREATE_RESULTS_TABLE)
+        insert = "INSERT INTO"
+        if deduplicate:
+            # Later results of a task are ignored
+            conn.execute("CREATE UNIQUE INDEX results_task ON results (task_id)")
+            insert = "INSERT OR IGNORE INTO"
+        conn.commit()
+        for shard_path in shard_paths:
+            if shard_path in missing:
+                continue
+            conn.execute("ATTACH DATABASE ? AS shard", (shard_path,))
+            conn.execute(
+                f"{insert} results ({_COLUMN_NAMES}) "
+                f"SELECT {_COLUMN_NAMES} FROM shard.results ORDER BY rowid"
+            )
+            conn.commit()
+            conn.execute("DETACH DATABASE shard")
+    finally:
+        conn.close()
+    os.replace(tmp_path, store_path)
+    return store_path
+
+
+def compute_accuracy(store_path: str) -> tuple[int, int]:
     """
-    Saves a list of OutputStructure objects to their respective output files
-    using multiprocessing for parallel processing.
+    Counts the correct answers of a result store with a single query.
 
-    Groups results by their 'output_json_fname' attribute before saving.
+    An answer is correct if it matches the correct answer case-insensitively.
 
-    Args:
-        output_results: A list of OutputStructure objects to save.
-        num_processes: The number of worker processes to use for parallel saving.
-                       Defaults to 4.
+    Returns:
+        A tuple of (number of correct answers, total number of questions).
     """
-    # Group output results by their designated output file name
-    output_files: dict[str, list[OutputStructure]] = {}
+    conn = sqlite3.connect(store_path)
+    try:
+        correct_count, total_count = conn.execute(
+            "SELECT COALESCE(SUM(LOWER(answer) = LOWER(correct_answer)), 0), COUNT(*) "
+            "FROM results"
+        ).fetchone()
+    finally:
+        conn.close()
+    return correct_count, total_count
 
-    for result in output_results:
-        if result.output_json_fname not in output_files:
-            output_files[result.output_json_fname] = []
-        output_files[result.output_json_fname].append(result)
 
-    log.info(
-        f"Saving results to {len(output_files)} output files using {num_processes} processes..."
-    )
+def export_results_json(store_path: str):
+    """
+    Exports a result store to one JSON file per media, at each result's
+    `output_json_fname`, in the same layout as the OutputStructure objects.
 
-    # Prepare arguments for the save_single_file helper function
-    save_args = [
-        (output_json_fname, results)
-        for output_json_fname, results in output_files.items()
-    ]
+    Existing files are overwritten.
 
-    # Use ProcessPoolExecutor to save files in parallel
-    with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes) as executor:
-        # Submit each file-saving task to the executor
-        futures = {executor.submit(save_single_file, arg): arg for arg in save_args}
-
-        # Wait for tasks to complete and report results or errors
-        for future in concurrent.futures.as_completed(futures):
-            arg = futures[future]
-            try:
-                future.result()  # Retrieve result (or exception)
-            except Exception as e:
-                log.error(
-                    f"Error occurred during parallel saving for file {arg[0]}: {e}"
-                )
-
-    log.info("Parallel saving process completed.")
+    Args:
+        store_path: The path of the result store to export.
+    """
+    conn = sqlite3.connect(store_path)
+    try:
+        rows = conn.execute(
+            f"SELECT {_COLUMN_NAMES} FROM results ORDER BY output_json_fname, rowid"
+        )
+        num_files = 0
+        for output_json_fname, group in itertools.groupby(
+            (dict(zip(RESULT_COLUMNS, row)) for row in rows),
+            key=lambda result: result["output_json_fname"],
+        ):
+            results_dicts = []
+            for result_dict in group:
+                # output_json_fname is used internally but not saved in the JSON
+                result_dict.pop("output_json_fname")
+                for name in JSON_COLUMNS:
+                    result_dict[name] = json.loads(result_dict[name])
+                result_dict["is_correct"] = bool(result_dict["is_correct"])
+                results_dicts.append(result_dict)
+
+            output_dir = os.path.dirname(output_json_fname)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            with open(output_json_fname, "w") as f:
+                json.dump(results_dicts, f, indent=4)
+            num_files += 1
+    finally:
+        conn.close()
+    log.info(f"Exported results to {num_files} JSON files.")
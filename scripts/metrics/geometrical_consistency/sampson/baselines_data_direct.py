@@ -25,6 +25,7 @@ from pathlib import Path
 # Use local mvbench modules
 from mvbench.data.base import BaseData, CameraView
 from mvbench.data.generated import GeneratedStackedData
+from mvbench.data.streaming import StreamingStackedData
 
 
 @dataclass
@@ -62,12 +63,13 @@ class SimpleClip:
         return cls(clip_id=stem, chunk_id="", video_path=video_path, category="custom")
 
 
-def get_data_direct(video_path: Path) -> BaseData:
+def get_data_direct(video_path: Path, streaming: bool = False) -> BaseData:
     """
     Load video data directly from a file path.
 
     Args:
         video_path: Path to the video file (should be a 2x3 grid video)
+        streaming: Decode frames on demand instead of loading the whole video
 
     Returns:
         BaseData object for evaluation
@@ -78,7 +80,8 @@ def get_data_direct(video_path: Path) -> BaseData:
     # Assume standard Cosmos 2x3 grid layout:
     # [LEFT  FRONT  RIGHT]
     # [REAR_L REAR  REAR_R]
-    return GeneratedStackedData(
+    data_cls = StreamingStackedData if streaming else GeneratedStackedData
+    return data_cls(
         video_path,
         [
             [CameraView.CROSS_LEFT, CameraView.FRONT, CameraView.CROSS_RIGHT],
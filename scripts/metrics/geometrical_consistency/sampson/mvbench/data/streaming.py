@@ -0,0 +1,235 @@
+# Copyright 2025 NVIDIA CORPORATION & AFFILIATES
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Lazily decoded counterparts of the generated data classes.
+
+Instead of decoding the whole clip up front, frames are decoded on demand by a
+seekable decoder that only keeps a small ring buffer of recent frames.
+"""
+from collections import OrderedDict
+from pathlib import Path
+
+import av
+import numpy as np
+from mvbench.data.base import CameraView
+
+from .generated import GeneratedData
+
+
+class VideoFrameReader:
+    """Seekable video decoder with a small ring buffer of decoded RGB frames.
+
+    Frames are addressed by their index in presentation order. Reading forward
+    (the access pattern of the Sampson metrics) decodes each frame once; a jump
+    backwards or far ahead seeks to the closest preceding keyframe.
+    """
+
+    def __init__(
+        self, path: Path, buffer_size: int = 8, max_forward_decode: int = 32
+    ) -> None:
+        self.path = Path(path)
+        self.buffer_size = buffer_size
+        self.max_forward_decode = max_forward_decode
+
+        self._container = av.open(str(self.path))
+        stream = self._container.streams.video[0]
+        stream.thread_type = "AUTO"
+        self._width = stream.codec_context.width
+        self._height = stream.codec_context.height
+
+        # Index the packet timestamps without decoding to map frame indices to pts.
+        self._pts = sorted(
+            packet.pts
+            for packet in self._container.demux(stream)
+            if packet.pts is not None
+        )
+        self._pts_to_idx = {pts: idx for idx, pts in enumerate(self._pts)}
+        assert len(self._pts) > 0, f"No video frames found in {self.path}"
+
+        self._buffer: OrderedDict[int, np.ndarray] = OrderedDict()
+        self._seek(0)
+
+    def __len__(self) -> int:
+        return len(self._pts)
+
+    @property
+    def shape(self) -> tuple[int, int, int, int]:
+        return len(self), self._height, self._width, 3
+
+    def close(self) -> None:
+        self._buffer.clear()
+        self._container.close()
+
+    def _seek(self, frame_idx: int) -> None:
+        stream = self._container.streams.video[0]
+        self._container.seek(self._pts[frame_idx], stream=stream, backward=True)
+        self._frames = self._container.decode(stream)
+        # Unknown until the first frame after the keyframe is decoded.
+        self._next_idx: int | None = None
+
+    def __getitem__(self, frame_idx: int) -> np.ndarray:
+        if frame_idx < 0:
+            frame_idx += len(self)
+        if not 0 <= frame_idx < len(self):
+            raise IndexError(f"Frame {frame_idx} out of range for {self.path}")
+
+        if frame_idx in self._buffer:
+            self._buffer.move_to_end(frame_idx)
+            return self._buffer[frame_idx]
+
+        if (
+            self._next_idx is None
+            or frame_idx < self._next_idx
+            or frame_idx > self._next_idx + self.max_forward_decode
+        ):
+            self._seek(frame_idx)
+
+        for frame in self._frames:
+            idx = self._pts_to_idx.get(frame.pts)
+            if idx is None:
+                continue
+            self._next_idx = idx + 1
+            if idx < frame_idx:
+                continue
+
+            image = frame.to_ndarray(format="rgb24")
+            self._buffer[idx] = image
+            if len(self._buffer) > self.buffer_size:
+                self._buffer.popitem(last=False)
+
+            if idx == frame_idx:
+                return image
+
+        raise IndexError(f"Could not decode frame {frame_idx} from {self.path}")
+
+
+class LazyVideo:
+    """Array-like (frames, h, w, 3) view onto a frame range and tile of a video.
+
+    Supports the subset of the ndarray interface used by `GeneratedData`:
+    `shape`, `len` and integer frame indexing.
+    """
+
+    def __init__(
+        self,
+        reader: VideoFrameReader,
+        frame_offset: int = 0,
+        num_frames: int | None = None,
+        rows: slice = slice(None),
+        cols: slice = slice(None),
+    ) -> None:
+        self.reader = reader
+        self.frame_offset = frame_offset
+        self.num_frames = (
+            num_frames if num_frames is not None else len(reader) - frame_offset
+        )
+        self.rows = rows
+        self.cols = cols
+
+    def __len__(self) -> int:
+        return self.num_frames
+
+    @property
+    def shape(self) -> tuple[int, int, int, int]:
+        _, h, w, c = self.reader.shape
+        height = len(range(*self.rows.indices(h)))
+        width = len(range(*self.cols.indices(w)))
+        return self.num_frames, height, width, c
+
+    def __getitem__(self, frame_idx: int) -> np.ndarray:
+        if not isinstance(frame_idx, (int, np.integer)):
+            raise TypeError("LazyVideo only supports integer frame indexing")
+        if frame_idx < 0:
+            frame_idx += self.num_frames
+        if not 0 <= frame_idx < self.num_frames:
+            raise IndexError(f"Frame {frame_idx} out of range")
+        return self.reader[self.frame_offset + frame_idx][self.rows, self.cols]
+
+
+class StreamingStackedData(GeneratedData):
+    """Lazily decoded `GeneratedStackedData`: all views share one decoder."""
+
+    def __init__(
+        self,
+        video_path: Path,
+        layout: list[list[CameraView]],
+        traj_path: Path | None = None,
+        buffer_size: int = 8,
+    ):
+        super().__init__(traj_path)
+
+        self.video_path = video_path
+        self.reader = VideoFrameReader(video_path, buffer_size=buffer_size)
+        _, h, w, c = self.reader.shape
+        assert c == 3, "Only RGB videos are supported"
+
+        num_rows = len(layout)
+        num_cols = len(layout[0])
+        vid_height = h // num_rows
+        vid_width = w // num_cols
+
+        for row_idx, row in enumerate(layout):
+            assert len(row) == num_cols, "All rows must have the same length"
+            for col_idx, view in enumerate(row):
+                self.videos[view] = LazyVideo(
+                    self.reader,
+                    rows=slice(row_idx * vid_height, (row_idx + 1) * vid_height),
+                    cols=slice(col_idx * vid_width, (col_idx + 1) * vid_width),
+                )
+
+
+class StreamingSequentialData(GeneratedData):
+    """Lazily decoded `GeneratedSequentialData`.
+
+    Each view gets its own decoder, so alternating between views at the same
+    frame index does not seek back and forth within the file.
+    """
+
+    def __init__(
+        self,
+        video_path: Path,
+        seq: list[CameraView],
+        traj_path: Path | None = None,
+        buffer_size: int = 8,
+    ):
+        super().__init__(traj_path)
+
+        self.video_path = video_path
+        for idx, view in enumerate(seq):
+            reader = VideoFrameReader(video_path, buffer_size=buffer_size)
+            vid_length = len(reader) // len(seq)
+            self.videos[view] = LazyVideo(
+                reader, frame_offset=idx * vid_length, num_frames=vid_length
+            )
+
+
+class StreamingSeparateData(GeneratedData):
+    """Lazily decoded `GeneratedSeparateData`: one decoder per view file."""
+
+    def __init__(
+        self,
+        video_paths: dict[CameraView, Path],
+        traj_path: Path | None = None,
+        buffer_size: int = 8,
+    ):
+        super().__init__(traj_path)
+
+        self.video_paths = video_paths
+        for view, path in video_paths.items():
+            self.videos[view] = LazyVideo(
+                VideoFrameReader(path, buffer_size=buffer_size)
+            )
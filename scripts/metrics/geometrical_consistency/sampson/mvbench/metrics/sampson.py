@@ -14,9 +14,14 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import os
+import weakref
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from logging import warning
 from pathlib import Path
+from typing import Callable
 
 import cv2
 import matplotlib
@@ -28,7 +33,7 @@ from lightglue import LightGlue, SuperPoint, viz2d
 from lightglue.utils import rbd
 from mvbench.data.base import BaseData, CameraView
 from mvbench.utils.camera_model import FThetaCamera, IdealPinholeCamera
-from mvbench.utils.geometry import compute_rectify_map, rectify_image, rectify_kp
+from mvbench.utils.geometry import Rectifier
 from mvbench.utils.logging import pbar
 
 
@@ -48,24 +53,270 @@ def skew(x: torch.Tensor):
     return torch.tensor([[0, -c, b], [c, 0, -a], [-b, a, 0]]).to(x)
 
 
+def pad_segments(
+    values: torch.Tensor, counts: torch.Tensor, fill: float
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Scatter per-frame segments into a padded tensor.
+
+    values: (sum(counts),) per-keypoint values of all frames, concatenated
+    counts: (F,) number of keypoints of each frame
+    Returns the (F, max_kp) padded values and the matching validity mask.
+    """
+    counts = counts.to(values.device)
+    max_kp = int(counts.max()) if len(counts) > 0 else 0
+    valid = torch.arange(max_kp, device=values.device)[None, :] < counts[:, None]
+    padded = torch.full(valid.shape, fill, dtype=values.dtype, device=values.device)
+    return padded.masked_scatter(valid, values), valid
+
+
+def segment_keep_lowest(
+    values: torch.Tensor, counts: torch.Tensor, keep_ratio: float
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Per-frame top-K filtering: keep the lowest `keep_ratio` of each frame's
+    values (at least one per non-empty frame), preserving the original order.
+
+    Like torch.topk, NaN ranks above every other value, so it is only kept when
+    a frame has fewer than `num_keep` other values.
+
+    Returns a boolean mask over `values` and the new per-frame counts.
+    """
+    counts = counts.to(values.device)
+    padded, valid = pad_segments(values, counts, float("inf"))
+    num_keep = torch.clamp((counts.double() * keep_ratio).long(), min=1)
+    num_keep = torch.where(counts > 0, num_keep, torch.zeros_like(num_keep))
+    # torch.sort puts NaN after +inf: move the padding behind NaN with a second,
+    # stable sort on the padding flag so that padding always ranks last
+    order = torch.argsort(padded, dim=1, stable=True)
+    order = order.gather(
+        1, torch.argsort((~valid).gather(1, order).int(), dim=1, stable=True)
+    )
+    rank = torch.argsort(order, dim=1)
+    keep = (rank < num_keep[:, None]) & valid
+    return keep[valid], keep.sum(dim=1)
+
+
+def segment_mean_median(
+    values: torch.Tensor, counts: torch.Tensor, empty_value: float = float("nan")
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Per-frame mean and median of concatenated segments. Like torch.median, the
+    median is the lower one and NaN propagates. Empty frames get `empty_value`.
+    """
+    counts = counts.to(values.device)
+    padded, valid = pad_segments(values, counts, float("inf"))
+    # At least one column so that the median gather is valid when all frames are empty
+    if padded.shape[1] == 0:
+        padded = torch.full(
+            (len(counts), 1), float("inf"), dtype=values.dtype, device=values.device
+        )
+        valid = torch.zeros_like(padded, dtype=torch.bool)
+
+    mean = torch.where(valid, padded, torch.zeros_like(padded)).sum(dim=1) / counts
+    median = torch.sort(padded, dim=1).values.gather(
+        1, torch.clamp(counts - 1, min=0)[:, None] // 2
+    )[:, 0]
+    median = torch.where(
+        torch.isnan(padded).any(dim=1), torch.full_like(median, float("nan")), median
+    )
+
+    empty = counts == 0
+    mean = torch.where(empty, torch.full_like(mean, empty_value), mean)
+    median = torch.where(empty, torch.full_like(median, empty_value), median)
+    return mean, median
+
+
+class FeatureCache:
+    """Bounded LRU cache of SuperPoint features keyed by (view, frame_idx).
+
+    The cache is bound to one data object at a time: binding a different clip
+    drops every entry, so keys never collide across clips. Each entry holds the
+    keypoints and descriptors of one frame (~2 MB for 2048 keypoints). Entries
+    are kept in host memory and moved back to the extraction device on a hit,
+    so the cache does not pin GPU memory. By default it is sized at bind time
+    to `views_per_clip` views of every frame of the clip, which covers all
+    views evaluated together.
+    """
+
+    def __init__(self, max_size: int | None = None, views_per_clip: int = 3) -> None:
+        self.max_size = max_size
+        self.views_per_clip = views_per_clip
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[
+            tuple[CameraView, int], tuple[torch.device, dict[str, torch.Tensor]]
+        ] = OrderedDict()
+        self._data_ref: weakref.ref | None = None
+        self._size = max_size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def bind(self, data: BaseData) -> None:
+        if self._data_ref is None or self._data_ref() is not data:
+            self.clear()
+            self._data_ref = weakref.ref(data)
+            if self.max_size is None:
+                self._size = self.views_per_clip * data.num_frames()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._data_ref = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self,
+        key: tuple[CameraView, int],
+        extract_fn: Callable[[], dict[str, torch.Tensor]],
+    ) -> dict[str, torch.Tensor]:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            device, feats = self._entries[key]
+            return {k: v.to(device) for k, v in feats.items()}
+
+        self.misses += 1
+        feats = extract_fn()
+        device = next(iter(feats.values())).device
+        self._entries[key] = (device, {k: v.cpu() for k, v in feats.items()})
+        if self._size is not None and len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+        return feats
+
+
+FramePair = tuple[CameraView, int, CameraView, int]
+
+
+def stack_features(feats: list[dict[str, torch.Tensor]]) -> dict[str, torch.Tensor]:
+    """Concatenate single-image SuperPoint outputs along the batch dimension."""
+    return {k: torch.cat([f[k] for f in feats], dim=0) for k in feats[0]}
+
+
 class BaseSampsonMetric:
-    def __init__(self, target_intrinsic: IdealPinholeCamera | None) -> None:
-        self.extractor = SuperPoint(max_num_keypoints=2048).eval().cuda()
-        self.matcher = LightGlue(features="superpoint").eval().cuda()
+    def __init__(
+        self,
+        target_intrinsic: IdealPinholeCamera | None,
+        feature_cache: FeatureCache | None = None,
+        batch_size: int = 1,
+        device: str | torch.device = "cuda",
+        rectify_cache_dir: Path | None = None,
+    ) -> None:
+        assert batch_size >= 1, "batch_size must be positive"
+        self.batch_size = batch_size
+        self.device = torch.device(device)
+        self.extractor = SuperPoint(max_num_keypoints=2048).eval().to(self.device)
+        if batch_size > 1:
+            # LightGlue takes its early-stopping and pruning decisions over the
+            # whole batch, which would make a pair's matches depend on the other
+            # pairs in its batch. Disable both so batching does not change results.
+            self.matcher = (
+                LightGlue(
+                    features="superpoint", depth_confidence=-1, width_confidence=-1
+                )
+                .eval()
+                .to(self.device)
+            )
+        else:
+            self.matcher = LightGlue(features="superpoint").eval().to(self.device)
 
         self.target_intrinsic = target_intrinsic
-        self.precomputed_rectify_maps: dict[CameraView, torch.Tensor] = {}
+        self.rectifier = (
+            Rectifier(target_intrinsic, self.device, rectify_cache_dir)
+            if target_intrinsic is not None
+            else None
+        )
+        # Share one cache between metrics to extract each frame once per clip.
+        self.feature_cache = (
+            feature_cache if feature_cache is not None else FeatureCache()
+        )
+
+    @torch.no_grad()
+    def extract(self, image: torch.Tensor) -> dict[str, torch.Tensor]:
+        image = rearrange(image, "h w c -> c h w").to(self.device)
+        return self.extractor.extract(image)
+
+    def get_features(
+        self, data: BaseData, view: CameraView, frame_idx: int
+    ) -> dict[str, torch.Tensor]:
+        """SuperPoint features of one frame, extracted at most once per clip."""
+        self.feature_cache.bind(data)
+        return self.feature_cache.get(
+            (view, frame_idx), lambda: self.extract(data.get_image(view, frame_idx))
+        )
 
     @torch.no_grad()
     def match(
         self, image0: torch.Tensor, image1: torch.Tensor
     ) -> tuple[torch.Tensor, torch.Tensor]:
-        image0 = rearrange(image0, "h w c -> c h w").cuda()
-        image1 = rearrange(image1, "h w c -> c h w").cuda()
+        return self.match_features(self.extract(image0), self.extract(image1))
+
+    def match_frames(
+        self,
+        data: BaseData,
+        view0: CameraView,
+        frame_idx0: int,
+        view1: CameraView,
+        frame_idx1: int,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        return self.match_frames_batch(data, [(view0, frame_idx0, view1, frame_idx1)])[
+            0
+        ]
 
-        feats0 = self.extractor.extract(image0)
-        feats1 = self.extractor.extract(image1)
+    @torch.no_grad()
+    def match_frames_batch(
+        self, data: BaseData, pairs: list[FramePair]
+    ) -> list[tuple[torch.Tensor, torch.Tensor]]:
+        """
+        Match several (view0, frame_idx0, view1, frame_idx1) pairs, up to
+        `batch_size` pairs per LightGlue forward pass.
 
+        LightGlue has no public input for keypoint masks, and padded keypoints
+        would take part in attention. Pairs are therefore grouped by their
+        keypoint counts and only same-sized pairs are stacked, which with
+        SuperPoint's fixed keypoint budget covers almost every frame.
+        """
+        feats = [
+            (self.get_features(data, v0, f0), self.get_features(data, v1, f1))
+            for v0, f0, v1, f1 in pairs
+        ]
+
+        buckets: dict[tuple[int, int], list[int]] = defaultdict(list)
+        for i, (feats0, feats1) in enumerate(feats):
+            size = (feats0["keypoints"].shape[1], feats1["keypoints"].shape[1])
+            buckets[size].append(i)
+
+        results: list[tuple[torch.Tensor, torch.Tensor]] = [None] * len(pairs)
+        for inds in buckets.values():
+            for start in range(0, len(inds), self.batch_size):
+                chunk = inds[start : start + self.batch_size]
+                matches01 = self.matcher(
+                    {
+                        "image0": stack_features([feats[i][0] for i in chunk]),
+                        "image1": stack_features([feats[i][1] for i in chunk]),
+                    }
+                )
+                for b, i in enumerate(chunk):
+                    match_inds = matches01["matches"][b]
+                    results[i] = (
+                        feats[i][0]["keypoints"][0][match_inds[:, 0]],
+                        feats[i][1]["keypoints"][0][match_inds[:, 1]],
+                    )
+
+        return results
+
+    def iter_matches(self, data: BaseData, pairs: list[FramePair], desc: str):
+        """Yield the matched keypoints of each pair, `batch_size` pairs at a time."""
+        for start in pbar(range(0, len(pairs), self.batch_size), desc=desc):
+            yield from self.match_frames_batch(
+                data, pairs[start : start + self.batch_size]
+            )
+
+    @torch.no_grad()
+    def match_features(
+        self, feats0: dict[str, torch.Tensor], feats1: dict[str, torch.Tensor]
+    ) -> tuple[torch.Tensor, torch.Tensor]:
         matches01 = self.matcher({"image0": feats0, "image1": feats1})
         feats0, feats1, matches01 = [rbd(x) for x in [feats0, feats1, matches01]]
 
@@ -166,28 +417,8 @@ class BaseSampsonMetric:
             img1_rec = img1
 
         else:
-            if cv0 not in self.precomputed_rectify_maps:
-                self.precomputed_rectify_maps[cv0] = compute_rectify_map(
-                    calib_intr[cv0], self.target_intrinsic
-                )
-
-            if cv1 not in self.precomputed_rectify_maps:
-                self.precomputed_rectify_maps[cv1] = compute_rectify_map(
-                    calib_intr[cv1], self.target_intrinsic
-                )
-
-            img0_rec = rectify_image(
-                img0,
-                calib_intr[cv0],
-                self.target_intrinsic,
-                precomputed_map=self.precomputed_rectify_maps[cv0],
-            )
-            img1_rec = rectify_image(
-                img1,
-                calib_intr[cv1],
-                self.target_intrinsic,
-                precomputed_map=self.precomputed_rectify_maps[cv1],
-            )
+            img0_rec = self.rectifier.rectify_image(img0, calib_intr[cv0])
+            img1_rec = self.rectifier.rectify_image(img1, calib_intr[cv1])
 
         pixel_error_np = pixel_error.cpu().numpy()
         color = cmap(pixel_error_np / 20.0)[:, :3]
@@ -253,8 +484,14 @@ class CrossViewSampsonMetric(BaseSampsonMetric):
         fundamental_method: SampsonFundamentalMethod,
         keep_ratio: float = 1.0,
         visualization_folder: Path | None = None,
+        feature_cache: FeatureCache | None = None,
+        batch_size: int = 1,
+        device: str | torch.device = "cuda",
+        rectify_cache_dir: Path | None = None,
     ) -> None:
-        super().__init__(target_intrinsic)
+        super().__init__(
+            target_intrinsic, feature_cache, batch_size, device, rectify_cache_dir
+        )
         self.fundamental_method = fundamental_method
         self.keep_ratio = keep_ratio
         self.visualization_folder = visualization_folder
@@ -268,24 +505,16 @@ class CrossViewSampsonMetric(BaseSampsonMetric):
         ).float()
         k0_rec = k1_rec = torch.from_numpy(self.target_intrinsic.K)
 
+        pairs = [(cv0, i, cv1, i) for i in range(data.num_frames())]
         kp0_rec_all, kp1_rec_all = [], []
-        for frame_idx in pbar(
-            range(data.num_frames()), desc=f"Cross metric {cv0.value} - {cv1.value}"
+        for kp0_raw, kp1_raw in self.iter_matches(
+            data, pairs, desc=f"Cross metric {cv0.value} - {cv1.value}"
         ):
-            img0 = data.get_image(cv0, frame_idx)
-            img1 = data.get_image(cv1, frame_idx)
-            kp0_raw, kp1_raw = self.match(img0, img1)
-            kp0_raw, kp1_raw = kp0_raw.cpu(), kp1_raw.cpu()
-
-            # Perform rectification
-            kp0_rec = rectify_kp(
-                kp0_raw, data_calib.intrinsics[cv0], self.target_intrinsic
-            )
-            kp1_rec = rectify_kp(
-                kp1_raw, data_calib.intrinsics[cv1], self.target_intrinsic
-            )
-            kp0_rec_all.append(kp0_rec)
-            kp1_rec_all.append(kp1_rec)
+            # Perform rectification on the matching device
+            kp0_rec = self.rectifier.rectify_kp(kp0_raw, data_calib.intrinsics[cv0])
+            kp1_rec = self.rectifier.rectify_kp(kp1_raw, data_calib.intrinsics[cv1])
+            kp0_rec_all.append(kp0_rec.cpu())
+            kp1_rec_all.append(kp1_rec.cpu())
 
         kp_count = torch.tensor([len(t) for t in kp0_rec_all])
         kp_end = torch.cumsum(kp_count, dim=0)
@@ -310,52 +539,14 @@ class CrossViewSampsonMetric(BaseSampsonMetric):
 
         # Apply keep_ratio filtering if needed
         if self.keep_ratio < 1.0:
-            filtered_kp0_rec_all = []
-            filtered_kp1_rec_all = []
-            filtered_pixel_errors_all = []
-
-            for i in range(len(kp_count)):
-                s, e = kp_start[i], kp_end[i]
-                frame_pixel_error = pixel_error[s:e]
-                frame_kp0 = kp0_rec[s:e]
-                frame_kp1 = kp1_rec[s:e]
-
-                if len(frame_pixel_error) > 0:
-                    # Filter to keep only top K% (lowest errors) for this frame
-                    num_keep = max(1, int(len(frame_pixel_error) * self.keep_ratio))
-                    _, top_indices = torch.topk(
-                        frame_pixel_error, num_keep, largest=False
-                    )
-                    top_indices = torch.sort(top_indices)[0]  # Keep original order
-
-                    filtered_kp0_rec_all.append(frame_kp0[top_indices])
-                    filtered_kp1_rec_all.append(frame_kp1[top_indices])
-                    filtered_pixel_errors_all.append(frame_pixel_error[top_indices])
-                else:
-                    filtered_kp0_rec_all.append(frame_kp0)
-                    filtered_kp1_rec_all.append(frame_kp1)
-                    filtered_pixel_errors_all.append(frame_pixel_error)
-
-            # Update variables with filtered data
-            kp_count = torch.tensor([len(t) for t in filtered_kp0_rec_all])
+            keep, kp_count = segment_keep_lowest(pixel_error, kp_count, self.keep_ratio)
             kp_end = torch.cumsum(kp_count, dim=0)
             kp_start = kp_end - kp_count
-            kp0_rec = torch.cat(filtered_kp0_rec_all, dim=0)
-            kp1_rec = torch.cat(filtered_kp1_rec_all, dim=0)
-            pixel_error = torch.cat(filtered_pixel_errors_all, dim=0)
-
-        result_mean = torch.tensor(
-            [
-                torch.mean(pixel_error[kp_start[i] : kp_end[i]])
-                for i in range(len(kp_count))
-            ]
-        )
-        result_median = torch.tensor(
-            [
-                torch.median(pixel_error[kp_start[i] : kp_end[i]])
-                for i in range(len(kp_count))
-            ]
-        )
+            kp0_rec = kp0_rec[keep]
+            kp1_rec = kp1_rec[keep]
+            pixel_error = pixel_error[keep]
+
+        result_mean, result_median = segment_mean_median(pixel_error, kp_count)
 
         if self.visualization_folder is not None:
             viz_path = self.visualization_folder / f"cross_{cv0.value}_{cv1.value}"
@@ -390,8 +581,10 @@ class DynamicCrossViewSampsonMetric(BaseSampsonMetric):
         fundamental_method: SampsonFundamentalMethod,
         keep_ratio: float = 1.0,
         visualization_folder: Path | None = None,
+        feature_cache: FeatureCache | None = None,
+        device: str | torch.device = "cuda",
     ) -> None:
-        super().__init__(target_intrinsic)
+        super().__init__(target_intrinsic, feature_cache, device=device)
         self.fundamental_method = fundamental_method
         self.keep_ratio = keep_ratio
         self.visualization_folder = visualization_folder
@@ -417,9 +610,7 @@ class DynamicCrossViewSampsonMetric(BaseSampsonMetric):
             assert hasattr(data, "get_frame_calibration")
             frame_calib = data.get_frame_calibration(frame_idx)
 
-            img0 = data.get_image(cv0, frame_idx)
-            img1 = data.get_image(cv1, frame_idx)
-            kp0_raw, kp1_raw = self.match(img0, img1)
+            kp0_raw, kp1_raw = self.match_frames(data, cv0, frame_idx, cv1, frame_idx)
             kp0_raw, kp1_raw = kp0_raw.cpu(), kp1_raw.cpu()
 
             # No rectification needed for pinhole cameras - use raw keypoints directly
@@ -460,50 +651,16 @@ class DynamicCrossViewSampsonMetric(BaseSampsonMetric):
 
         # Apply keep_ratio filtering if needed
         if self.keep_ratio < 1.0:
-            filtered_kp0_rec_all = []
-            filtered_kp1_rec_all = []
-            filtered_pixel_error_all = []
-
-            for i in range(len(kp0_rec_all)):
-                start_idx = kp_start[i]
-                end_idx = kp_end[i]
-                frame_pixel_error = pixel_error[start_idx:end_idx]
-                frame_kp0_rec = kp0_rec_all[i]
-                frame_kp1_rec = kp1_rec_all[i]
-
-                # Keep top percentage of keypoints based on error
-                num_keep = max(1, int(len(frame_pixel_error) * self.keep_ratio))
-                _, indices = torch.topk(frame_pixel_error, num_keep, largest=False)
-
-                filtered_kp0_rec_all.append(frame_kp0_rec[indices])
-                filtered_kp1_rec_all.append(frame_kp1_rec[indices])
-                filtered_pixel_error_all.append(frame_pixel_error[indices])
-
-            kp0_rec_all = filtered_kp0_rec_all
-            kp1_rec_all = filtered_kp1_rec_all
-            pixel_error = torch.cat(filtered_pixel_error_all)
-
-            # Recalculate indices after filtering
-            kp_count = torch.tensor([len(t) for t in kp0_rec_all])
+            keep, kp_count = segment_keep_lowest(pixel_error, kp_count, self.keep_ratio)
             kp_end = torch.cumsum(kp_count, dim=0)
             kp_start = kp_end - kp_count
+            kp0_rec = kp0_rec[keep]
+            kp1_rec = kp1_rec[keep]
+            pixel_error = pixel_error[keep]
 
         # Compute per-frame statistics
-        result_mean = torch.tensor(
-            [
-                torch.mean(pixel_error[kp_start[i] : kp_end[i]])
-                if kp_start[i] < kp_end[i]
-                else torch.tensor(0.0)
-                for i in range(len(kp_count))
-            ]
-        )
-        result_median = torch.tensor(
-            [
-                torch.median(pixel_error[kp_start[i] : kp_end[i]])
-                if kp_start[i] < kp_end[i]
-                else torch.tensor(0.0)
-                for i in range(len(kp_count))
-            ]
+        result_mean, result_median = segment_mean_median(
+            pixel_error, kp_count, empty_value=0.0
         )
 
         # Visualization support (if needed)
@@ -542,67 +699,107 @@ class TemporalSampsonMetric(BaseSampsonMetric):
         fundamental_method: SampsonFundamentalMethod,
         keep_ratio: float = 1.0,
         visualization_folder: Path | None = None,
+        feature_cache: FeatureCache | None = None,
+        batch_size: int = 1,
+        device: str | torch.device = "cuda",
+        rectify_cache_dir: Path | None = None,
+        num_workers: int | None = None,
     ) -> None:
-        super().__init__(target_intrinsic)
+        """
+        num_workers: threads estimating the per-frame fundamental matrices.
+            Defaults to one per core on CPU and to 1 otherwise.
+        """
+        super().__init__(
+            target_intrinsic, feature_cache, batch_size, device, rectify_cache_dir
+        )
         self.fundamental_method = fundamental_method
         self.keep_ratio = keep_ratio
         self.visualization_folder = visualization_folder
+        if num_workers is None:
+            num_workers = (os.cpu_count() or 1) if self.device.type == "cpu" else 1
+        self.num_workers = num_workers
+
+    def frame_error(
+        self,
+        kp0_rec: torch.Tensor,
+        kp1_rec: torch.Tensor,
+        t_trans: torch.Tensor | None,
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Sampson pixel error of one frame pair, after keep_ratio filtering.
+
+        Only touches its arguments, so frames can be evaluated concurrently;
+        OpenCV releases the GIL inside RANSAC.
+        """
+        if self.fundamental_method == SampsonFundamentalMethod.CALIBRATED:
+            k_rec = torch.from_numpy(self.target_intrinsic.K)
+            f_mat = self.fundamental_from_calibration(t_trans, k_rec, k_rec)
+
+        elif self.fundamental_method == SampsonFundamentalMethod.KNOWN_INTRINSIC:
+            k_rec = torch.from_numpy(self.target_intrinsic.K)
+            f_mat = self.fundamental_from_5_point(kp0_rec, kp1_rec, k_rec, k_rec)
+
+        elif self.fundamental_method == SampsonFundamentalMethod.UNKNOWN_INTRINSIC:
+            f_mat = self.fundamental_from_8_point(kp0_rec, kp1_rec)
+
+        else:
+            raise ValueError("Unknown method")
+
+        sampson_error = self.sampson_error(kp0_rec, kp1_rec, f_mat)
+        pixel_error = torch.sqrt(sampson_error)
+
+        # Filter to keep only top K% (lowest errors)
+        if self.keep_ratio < 1.0 and len(pixel_error) > 0:
+            num_keep = max(1, int(len(pixel_error) * self.keep_ratio))
+            _, top_indices = torch.topk(pixel_error, num_keep, largest=False)
+            top_indices = torch.sort(top_indices)[0]  # Keep original order
+            pixel_error = pixel_error[top_indices]
+            kp0_rec = kp0_rec[top_indices]
+            kp1_rec = kp1_rec[top_indices]
+
+        return kp0_rec, kp1_rec, pixel_error
 
     def compute(self, data: BaseData, cv: CameraView, frame_gap: int = 1):
         data_calib = data.get_calibration()
         mean_error, median_error = [], []
 
         cv_poses = data_calib.get_trajectory(cv)
-        for frame_idx in pbar(
-            range(data.num_frames() - frame_gap), desc=f"Temporal metric {cv.value}"
+        frame_indices = range(data.num_frames() - frame_gap)
+        pairs = [(cv, i, cv, i + frame_gap) for i in frame_indices]
+        frame_args = []
+        for frame_idx, (kp0_raw, kp1_raw) in zip(
+            frame_indices,
+            self.iter_matches(data, pairs, desc=f"Temporal metric {cv.value}"),
         ):
-            img0 = data.get_image(cv, frame_idx)
-            img1 = data.get_image(cv, frame_idx + frame_gap)
-            kp0_raw, kp1_raw = self.match(img0, img1)
-            kp0_raw, kp1_raw = kp0_raw.cpu(), kp1_raw.cpu()
-
-            # Perform rectification
+            # Perform rectification on the matching device
             if self.target_intrinsic is None or cv not in data_calib.intrinsics:
-                kp0_rec = kp0_raw
-                kp1_rec = kp1_raw
+                kp0_rec = kp0_raw.cpu()
+                kp1_rec = kp1_raw.cpu()
 
             else:
-                kp0_rec = rectify_kp(
-                    kp0_raw, data_calib.intrinsics[cv], self.target_intrinsic
-                )
-                kp1_rec = rectify_kp(
-                    kp1_raw, data_calib.intrinsics[cv], self.target_intrinsic
-                )
+                intr = data_calib.intrinsics[cv]
+                kp0_rec = self.rectifier.rectify_kp(kp0_raw, intr).cpu()
+                kp1_rec = self.rectifier.rectify_kp(kp1_raw, intr).cpu()
 
+            t_trans = None
             if self.fundamental_method == SampsonFundamentalMethod.CALIBRATED:
                 t_trans = torch.from_numpy(
                     np.linalg.inv(cv_poses[frame_idx]) @ cv_poses[frame_idx + frame_gap]
                 ).float()
-                k_rec = torch.from_numpy(self.target_intrinsic.K)
-                f_mat = self.fundamental_from_calibration(t_trans, k_rec, k_rec)
-
-            elif self.fundamental_method == SampsonFundamentalMethod.KNOWN_INTRINSIC:
-                k_rec = torch.from_numpy(self.target_intrinsic.K)
-                f_mat = self.fundamental_from_5_point(kp0_rec, kp1_rec, k_rec, k_rec)
 
-            elif self.fundamental_method == SampsonFundamentalMethod.UNKNOWN_INTRINSIC:
-                f_mat = self.fundamental_from_8_point(kp0_rec, kp1_rec)
+            frame_args.append((kp0_rec, kp1_rec, t_trans))
 
-            else:
-                raise ValueError("Unknown method")
-
-            sampson_error = self.sampson_error(kp0_rec, kp1_rec, f_mat)
-            pixel_error = torch.sqrt(sampson_error)
-
-            # Filter to keep only top K% (lowest errors)
-            if self.keep_ratio < 1.0 and len(pixel_error) > 0:
-                num_keep = max(1, int(len(pixel_error) * self.keep_ratio))
-                _, top_indices = torch.topk(pixel_error, num_keep, largest=False)
-                top_indices = torch.sort(top_indices)[0]  # Keep original order
-                pixel_error = pixel_error[top_indices]
-                kp0_rec = kp0_rec[top_indices]
-                kp1_rec = kp1_rec[top_indices]
+        if self.num_workers > 1:
+            with ThreadPoolExecutor(self.num_workers) as pool:
+                frame_results = list(
+                    pool.map(lambda args: self.frame_error(*args), frame_args)
+                )
+        else:
+            frame_results = [self.frame_error(*args) for args in frame_args]
 
+        for frame_idx, (kp0_rec, kp1_rec, pixel_error) in zip(
+            frame_indices, frame_results
+        ):
             mean_error.append(torch.mean(pixel_error))
             median_error.append(torch.median(pixel_error))
 
@@ -611,8 +808,8 @@ class TemporalSampsonMetric(BaseSampsonMetric):
                 viz_path.mkdir(exist_ok=True, parents=True)
                 self.save_visualization(
                     viz_path / f"{frame_idx:04d}.png",
-                    img0,
-                    img1,
+                    data.get_image(cv, frame_idx),
+                    data.get_image(cv, frame_idx + frame_gap),
                     kp0_rec,
                     kp1_rec,
                     cv,
@@ -5,8 +5,11 @@
 
 """Camera model definitions."""
 
+import hashlib
 import json
 import math
+import os
+from pathlib import Path
 from typing import Any, Dict, Tuple, TypeVar, Union
 
 import numpy as np
@@ -17,6 +20,51 @@ from scipy.optimize import curve_fit
 CropParams = TypeVar("CropParams")
 ScaleParams = TypeVar("ScaleParams")
 
+# Set this to a directory to persist FTheta forward polynomial fits across runs.
+FW_POLY_CACHE_DIR_ENV = "MVBENCH_FW_POLY_CACHE_DIR"
+
+# Forward polynomial fits, keyed by a hash of the intrinsics they were fitted for.
+_FW_POLY_CACHE: Dict[str, Dict[str, np.ndarray]] = {}
+
+
+def _fw_poly_cache_path(key: str) -> Path | None:
+    cache_dir = os.environ.get(FW_POLY_CACHE_DIR_ENV)
+    return Path(cache_dir) / f"fw_poly_{key}.npz" if cache_dir else None
+
+
+def _load_fw_poly(key: str) -> Dict[str, np.ndarray] | None:
+    """Looks up a forward polynomial fit in memory, then on disk."""
+    if key in _FW_POLY_CACHE:
+        return _FW_POLY_CACHE[key]
+
+    cache_path = _fw_poly_cache_path(key)
+    if cache_path is None or not cache_path.exists():
+        return None
+
+    with np.load(cache_path) as data:
+        entry = {name: data[name] for name in data.files}
+    _FW_POLY_CACHE[key] = entry
+    return entry
+
+
+def _store_fw_poly(
+    key: str, fw_poly: Polynomial, max_ray_distortion: np.ndarray
+) -> None:
+    """Stores a forward polynomial fit in memory and, if enabled, on disk."""
+    entry = {
+        "fw_poly": np.asarray(fw_poly.coef),
+        "max_ray_distortion": np.asarray(max_ray_distortion).copy(),
+    }
+    _FW_POLY_CACHE[key] = entry
+
+    cache_path = _fw_poly_cache_path(key)
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so concurrent workers never read a partial file.
+        tmp_path = cache_path.with_name(f"{cache_path.stem}.{os.getpid()}.tmp.npz")
+        np.savez(tmp_path, **entry)
+        os.replace(tmp_path, cache_path)
+
 
 class CameraModel:
     pass
@@ -270,7 +318,6 @@ class FThetaCamera(CameraModel):
         self._width = int(width)
         self._height = int(height)
         self._bw_poly = Polynomial(bw_poly)
-        self._fw_poly = self._compute_fw_poly()
         # Other properties that need to be computed
         self._horizontal_fov = None
         self._vertical_fov = None
@@ -281,7 +328,21 @@ class FThetaCamera(CameraModel):
             np.float32
         )
 
-        self._update_calibrated_camera()
+        # The forward polynomial fit only depends on the intrinsics, so it is
+        # computed once per camera and reused by every instance afterwards.
+        key = hashlib.sha1(
+            np.append([cx, cy, width, height], bw_poly).astype(np.float64).tobytes()
+        ).hexdigest()
+        cached = _load_fw_poly(key)
+        if cached is None:
+            self._fw_poly = self._compute_fw_poly()
+            self._update_calibrated_camera()
+            _store_fw_poly(key, self._fw_poly, self._max_ray_distortion)
+        else:
+            self._fw_poly = Polynomial(cached["fw_poly"])
+            self._compute_fov()
+            self._max_ray_angle = (self._max_angle).copy()
+            self._max_ray_distortion = cached["max_ray_distortion"]
 
     @property
     def is_rescaled(self):
@@ -453,19 +514,20 @@ class FThetaCamera(CameraModel):
         max_value = max(max_value, value)
 
         SAMPLE_COUNT = 500
-        samples_x = []
-        samples_b = []
         step = max_value / SAMPLE_COUNT
-        x = step
-
-        for _ in range(0, SAMPLE_COUNT):
-            p = np.asarray([self._center[0] + x, self._center[1]], dtype=np.float32)
-            ray, _ = self.pixel2ray(p)
-            xy_norm = np.linalg.norm(ray[0, :2])
-            theta = np.arctan2(float(xy_norm), float(ray[0, 2]))
-            samples_x.append(theta)
-            samples_b.append(float(x))
-            x += step
+        # Same accumulation (and dtype) as stepping x by `step` SAMPLE_COUNT times.
+        samples_b = np.cumsum(np.full(SAMPLE_COUNT, step))
+
+        # Backproject all samples along the horizontal through the center at once.
+        p = np.stack(
+            [self._center[0] + samples_b, np.full_like(samples_b, self._center[1])],
+            axis=1,
+        ).astype(np.float32)
+        rays, _ = self.pixel2ray(p)
+        xy_norm = np.linalg.norm(rays[:, :2], axis=1)
+        samples_x = np.arctan2(
+            xy_norm.astype(np.float64), rays[:, 2].astype(np.float64)
+        )
 
         x = np.asarray(samples_x, dtype=np.float64)
         y = np.asarray(samples_b, dtype=np.float64)
@@ -677,8 +739,8 @@ def rays_to_pixels_batch(
     img_height = cam_intrinsic[3]
     img_bw_poly = cam_intrinsic[4:]
     ftheta_model = FThetaCamera(img_cx, img_cy, img_width, img_height, img_bw_poly)
-    # Computes the forward polynomial for this camera
-    fw_poly = list(ftheta_model._compute_fw_poly())
+    # The forward polynomial is fitted once per set of intrinsics and cached
+    fw_poly = list(ftheta_model._fw_poly)
     device = rays.device
     max_ray_angle = torch.tensor(ftheta_model._max_ray_angle, device=device)
     max_ray_distortion = torch.tensor(ftheta_model._max_ray_distortion, device=device)
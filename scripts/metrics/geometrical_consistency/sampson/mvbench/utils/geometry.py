@@ -14,6 +14,8 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import hashlib
+import os
 from pathlib import Path
 
 import numpy as np
@@ -72,3 +74,112 @@ def rectify_kp(
     r, _ = ftheta_cam.pixel2ray(kp.cpu().numpy())
     kp_rec, _ = target_cam.ray2pixel(r)
     return torch.from_numpy(kp_rec).to(kp.device)
+
+
+class Rectifier:
+    """FTheta -> ideal pinhole rectification with cached, device-resident state.
+
+    Everything depending on a source camera is cached per (source intrinsics,
+    target camera) key: the backward polynomial used to rectify keypoints and
+    the dense `grid_sample` map used to rectify images. Maps are the expensive
+    part and are also persisted to `cache_dir` when given.
+    """
+
+    def __init__(
+        self,
+        target_cam: IdealPinholeCamera,
+        device: str | torch.device = "cpu",
+        cache_dir: Path | None = None,
+    ) -> None:
+        self.target_cam = target_cam
+        self.device = torch.device(device)
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+
+        self._f = torch.tensor(
+            [target_cam.K[0, 0], target_cam.K[1, 1]], dtype=torch.float64
+        ).to(self.device)
+        self._c = torch.tensor(
+            [target_cam.K[0, 2], target_cam.K[1, 2]], dtype=torch.float64
+        ).to(self.device)
+        self._kp_params: dict[str, tuple[torch.Tensor, ...]] = {}
+        self._maps: dict[str, torch.Tensor] = {}
+
+    def camera_key(self, ftheta_cam: FThetaCamera) -> str:
+        params = np.concatenate(
+            [
+                ftheta_cam._intrinsics,
+                [ftheta_cam.width, ftheta_cam.height],
+                self.target_cam.K.ravel(),
+                [self.target_cam.width, self.target_cam.height],
+            ]
+        ).astype(np.float64)
+        return hashlib.sha1(params.tobytes()).hexdigest()
+
+    def _get_kp_params(self, ftheta_cam: FThetaCamera) -> tuple[torch.Tensor, ...]:
+        key = self.camera_key(ftheta_cam)
+        if key not in self._kp_params:
+            scale = [1.0, 1.0]
+            if ftheta_cam.is_rescaled:
+                scale = [
+                    ftheta_cam._width / ftheta_cam._rescale_width,
+                    ftheta_cam._height / ftheta_cam._rescale_height,
+                ]
+            self._kp_params[key] = tuple(
+                torch.tensor(np.asarray(x, dtype=np.float64)).to(self.device)
+                for x in (scale, ftheta_cam._center, ftheta_cam._bw_poly.coef)
+            )
+        return self._kp_params[key]
+
+    def rectify_kp(self, kp: torch.Tensor, ftheta_cam: FThetaCamera) -> torch.Tensor:
+        """
+        Torch equivalent of `rectify_kp`, computed in one batched op on the
+        rectifier's device: kp (N, 2) FTheta pixels -> (N, 2) pinhole pixels.
+        """
+        scale, center, bw_coef = self._get_kp_params(ftheta_cam)
+
+        xd = kp.to(self.device, torch.float64) * scale - center
+        xd_norm = torch.linalg.norm(xd, dim=1, keepdim=True)
+        alpha = torch.zeros_like(xd_norm)
+        for coef in reversed(bw_coef):  # Horner evaluation of the backward poly
+            alpha = alpha * xd_norm + coef
+
+        # Pixels at the optical center map to the ray (0, 0, 1), as in pixel2ray
+        valid = xd_norm > np.finfo(np.float32).eps
+        direction = xd / torch.where(valid, xd_norm, torch.ones_like(xd_norm))
+        kp_rec = self._f * torch.tan(alpha) * direction + self._c
+        kp_rec = torch.where(valid, kp_rec, self._c.expand_as(kp_rec))
+        return kp_rec.float().to(kp.device)
+
+    def rectify_map(self, ftheta_cam: FThetaCamera) -> torch.Tensor:
+        key = self.camera_key(ftheta_cam)
+        if key in self._maps:
+            return self._maps[key]
+
+        cache_path = (
+            self.cache_dir / f"rectify_map_{key}.pt"
+            if self.cache_dir is not None
+            else None
+        )
+        if cache_path is not None and cache_path.exists():
+            pos_norm = torch.load(cache_path)
+        else:
+            pos_norm = compute_rectify_map(ftheta_cam, self.target_cam)
+            if cache_path is not None:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                # Write to a per-process temporary file first so concurrent
+                # workers never move a partial file into place.
+                tmp_path = cache_path.with_name(f"{cache_path.stem}.{os.getpid()}.tmp")
+                torch.save(pos_norm, tmp_path)
+                os.replace(tmp_path, cache_path)
+
+        self._maps[key] = pos_norm.to(self.device)
+        return self._maps[key]
+
+    def rectify_image(
+        self, image: torch.Tensor, ftheta_cam: FThetaCamera
+    ) -> torch.Tensor:
+        pos_norm = self.rectify_map(ftheta_cam)
+        img = rectify_image(
+            image.to(self.device), ftheta_cam, self.target_cam, precomputed_map=pos_norm
+        )
+        return img.to(image.device)
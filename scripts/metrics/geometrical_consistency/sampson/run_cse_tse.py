@@ -21,8 +21,12 @@ This version doesn't depend on eval_list.json.
 Completely independent version - all dependencies are local.
 """
 import json
+import multiprocessing as mp
+import os
 import sys
 from argparse import ArgumentParser
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
 import matplotlib.pyplot as plt
@@ -31,6 +35,7 @@ from baselines_data_direct import SimpleClip, get_all_videos, get_data_direct
 from mvbench.data.base import CameraView
 from mvbench.metrics.sampson import (
     CrossViewSampsonMetric,
+    FeatureCache,
     SampsonFundamentalMethod,
     TemporalSampsonMetric,
 )
@@ -38,28 +43,58 @@ from mvbench.utils.camera_model import IdealPinholeCamera
 from tqdm import tqdm
 
 
-def evaluate_single_video(video_path: Path, output_dir: Path, verbose: bool = False):
-    """Evaluate Cross-view and Temporal Sampson Errors for a single video."""
-
-    clip = SimpleClip.from_video_path(video_path)
-    clip_output_dir = output_dir / "cse_tse"
-    clip_output_dir.mkdir(parents=True, exist_ok=True)
-
-    if verbose:
-        print(f"Processing {clip.clip_id} from {video_path}")
-
+def build_metrics(
+    batch_size: int = 1, device: str = "cuda"
+) -> tuple[TemporalSampsonMetric, CrossViewSampsonMetric]:
+    """Load the temporal and cross-view metrics (SuperPoint/LightGlue weights)."""
     target_intrinsic = IdealPinholeCamera(fov_x_deg=120.0, width=960, height=540)
+    # Temporal and cross-view passes share the FRONT/CROSS_* frames, so a shared
+    # cache runs SuperPoint once per frame instead of once per pair.
+    feature_cache = FeatureCache()
     temporal_metric = TemporalSampsonMetric(
         fundamental_method=SampsonFundamentalMethod.UNKNOWN_INTRINSIC,
         target_intrinsic=target_intrinsic,
+        feature_cache=feature_cache,
+        batch_size=batch_size,
+        device=device,
     )
     cross_metric = CrossViewSampsonMetric(
         fundamental_method=SampsonFundamentalMethod.UNKNOWN_INTRINSIC,
         target_intrinsic=target_intrinsic,
+        feature_cache=feature_cache,
+        batch_size=batch_size,
+        device=device,
     )
+    return temporal_metric, cross_metric
+
+
+def evaluate_single_video(
+    video_path: Path,
+    output_dir: Path,
+    verbose: bool = False,
+    batch_size: int = 1,
+    device: str = "cuda",
+    streaming: bool = False,
+    metrics: tuple[TemporalSampsonMetric, CrossViewSampsonMetric] | None = None,
+):
+    """Evaluate Cross-view and Temporal Sampson Errors for a single video.
+
+    Pass `metrics` from `build_metrics` to reuse loaded models across videos.
+    """
+
+    clip = SimpleClip.from_video_path(video_path)
+    clip_output_dir = output_dir / "cse_tse"
+    clip_output_dir.mkdir(parents=True, exist_ok=True)
+
+    if verbose:
+        print(f"Processing {clip.clip_id} from {video_path}")
+
+    if metrics is None:
+        metrics = build_metrics(batch_size, device)
+    temporal_metric, cross_metric = metrics
 
     try:
-        data = get_data_direct(video_path)
+        data = get_data_direct(video_path, streaming=streaming)
     except Exception as e:
         print(f"Error loading data for {clip.clip_id}: {e}")
         return None
@@ -123,6 +158,9 @@ def evaluate_single_video(video_path: Path, output_dir: Path, verbose: bool = Fa
                 traceback.print_exc()
             continue
 
+    # Features are only reused within a clip, so release them now.
+    temporal_metric.feature_cache.clear()
+
     # Generate visualization
     if visualize_results:
         plt.figure(figsize=(12, 6))
@@ -162,74 +200,230 @@ def evaluate_single_video(video_path: Path, output_dir: Path, verbose: bool = Fa
     return eval_results
 
 
-def compute_aggregate_stats(all_results: dict) -> dict:
-    """Compute aggregate statistics across all videos."""
+class AggregateStats:
+    """Per-video median errors, accumulated one video at a time."""
 
-    stats = {"num_videos": len(all_results), "temporal": {}, "cross_view": {}}
+    def __init__(self) -> None:
+        self.num_videos = 0
+        self.temporal_values = {
+            view: [] for view in ["front", "cross_left", "cross_right"]
+        }
+        self.cross_values = {"front-cross_right": [], "front-cross_left": []}
 
-    # Collect all values for aggregation
-    temporal_values = {view: [] for view in ["front", "cross_left", "cross_right"]}
-    cross_values = {"front-cross_right": [], "front-cross_left": []}
+    def add(self, results: dict | None) -> None:
+        self.num_videos += 1
 
-    for video_id, results in all_results.items():
         if results and "T" in results:
             for view, values in results["T"].items():
                 if values and "median" in values and values["median"] is not None:
-                    temporal_values[view].append(values["median"])
+                    self.temporal_values[view].append(values["median"])
 
         if results and "C" in results:
             for pair, values in results["C"].items():
                 if values and "median" in values and values["median"] is not None:
-                    cross_values[pair].append(values["median"])
-
-    # Compute aggregate stats for temporal
-    for view, values in temporal_values.items():
-        if values:
-            stats["temporal"][view] = {
-                "mean": float(np.mean(values)),
-                "median": float(np.median(values)),
-                "std": float(np.std(values)),
-                "min": float(np.min(values)),
-                "max": float(np.max(values)),
-                "count": len(values),
+                    self.cross_values[pair].append(values["median"])
+
+    def summary(self) -> dict:
+        stats = {"num_videos": self.num_videos, "temporal": {}, "cross_view": {}}
+
+        # Compute aggregate stats for temporal
+        for view, values in self.temporal_values.items():
+            if values:
+                stats["temporal"][view] = {
+                    "mean": float(np.mean(values)),
+                    "median": float(np.median(values)),
+                    "std": float(np.std(values)),
+                    "min": float(np.min(values)),
+                    "max": float(np.max(values)),
+                    "count": len(values),
+                }
+
+        # Compute aggregate stats for cross-view
+        for pair, values in self.cross_values.items():
+            if values:
+                stats["cross_view"][pair] = {
+                    "mean": float(np.mean(values)),
+                    "median": float(np.median(values)),
+                    "std": float(np.std(values)),
+                    "min": float(np.min(values)),
+                    "max": float(np.max(values)),
+                    "count": len(values),
+                }
+
+        # Overall averages
+        all_temporal = []
+        for values in self.temporal_values.values():
+            all_temporal.extend(values)
+
+        all_cross = []
+        for values in self.cross_values.values():
+            all_cross.extend(values)
+
+        if all_temporal:
+            stats["temporal"]["overall"] = {
+                "mean": float(np.mean(all_temporal)),
+                "median": float(np.median(all_temporal)),
+                "std": float(np.std(all_temporal)),
             }
 
-    # Compute aggregate stats for cross-view
-    for pair, values in cross_values.items():
-        if values:
-            stats["cross_view"][pair] = {
-                "mean": float(np.mean(values)),
-                "median": float(np.median(values)),
-                "std": float(np.std(values)),
-                "min": float(np.min(values)),
-                "max": float(np.max(values)),
-                "count": len(values),
+        if all_cross:
+            stats["cross_view"]["overall"] = {
+                "mean": float(np.mean(all_cross)),
+                "median": float(np.median(all_cross)),
+                "std": float(np.std(all_cross)),
             }
 
-    # Overall averages
-    all_temporal = []
-    for values in temporal_values.values():
-        all_temporal.extend(values)
+        return stats
 
-    all_cross = []
-    for values in cross_values.values():
-        all_cross.extend(values)
 
-    if all_temporal:
-        stats["temporal"]["overall"] = {
-            "mean": float(np.mean(all_temporal)),
-            "median": float(np.median(all_temporal)),
-            "std": float(np.std(all_temporal)),
-        }
+def compute_aggregate_stats(all_results: dict) -> dict:
+    """Compute aggregate statistics across all videos."""
+    stats = AggregateStats()
+    for results in all_results.values():
+        stats.add(results)
+    return stats.summary()
+
+
+def load_results_index(index_path: Path) -> dict[str, dict]:
+    """Read the append-only results index; the last record of a clip wins."""
+    records = {}
+    if not index_path.exists():
+        return records
+
+    with open(index_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run interrupted mid-write can leave a truncated last line.
+                continue
+            records[record["clip_id"]] = record
+    return records
+
+
+def append_result(index_file, video_path: Path, results: dict | None) -> None:
+    """Append one clip's outcome to the results index and flush it to disk."""
+    record = {
+        "clip_id": SimpleClip.from_video_path(video_path).clip_id,
+        "video_path": str(video_path),
+        "status": "ok" if results is not None else "failed",
+        "results": results,
+    }
+    index_file.write(json.dumps(record) + "\n")
+    index_file.flush()
+    os.fsync(index_file.fileno())
+
+
+# Per-process state of pool workers: models are loaded once per worker.
+_worker_state: dict = {}
+
+# Number of times a clip is submitted before it is recorded as failed because
+# its worker process died.
+MAX_CLIP_ATTEMPTS = 2
+
+
+def _init_worker(devices, output_dir, verbose, batch_size, streaming):
+    # Worker processes are numbered from 1, and replacement workers keep counting,
+    # so the device assignment stays round-robin when a pool is rebuilt.
+    worker_idx = mp.current_process()._identity[0] - 1
+    device = devices[worker_idx % len(devices)]
+    _worker_state.update(
+        metrics=build_metrics(batch_size, device),
+        output_dir=output_dir,
+        verbose=verbose,
+        streaming=streaming,
+    )
+
+
+def _evaluate_in_worker(video_path: Path) -> tuple[Path, dict | None]:
+    try:
+        result = evaluate_single_video(
+            video_path,
+            _worker_state["output_dir"],
+            _worker_state["verbose"],
+            streaming=_worker_state["streaming"],
+            metrics=_worker_state["metrics"],
+        )
+    except Exception as e:
+        print(f"\nError processing {video_path}: {e}")
+        result = None
+    return video_path, result
 
-    if all_cross:
-        stats["cross_view"]["overall"] = {
-            "mean": float(np.mean(all_cross)),
-            "median": float(np.median(all_cross)),
-            "std": float(np.std(all_cross)),
-        }
 
-    return stats
+def iter_evaluations(videos: list[Path], args):
+    """Yield (video_path, results) as clips finish, in completion order."""
+    devices = args.device.split(",")
+
+    if args.num_workers <= 1:
+        metrics = build_metrics(args.batch_size, devices[0])
+        for video_path in videos:
+            try:
+                result = evaluate_single_video(
+                    video_path,
+                    args.output,
+                    args.verbose,
+                    streaming=args.streaming,
+                    metrics=metrics,
+                )
+            except Exception as e:
+                print(f"\nError processing {video_path}: {e}")
+                result = None
+            yield video_path, result
+        return
+
+    # CUDA cannot be re-initialized in forked children.
+    ctx = mp.get_context("spawn")
+    initargs = (
+        devices,
+        args.output,
+        args.verbose,
+        args.batch_size,
+        args.streaming,
+    )
+    queue = list(reversed(videos))
+    # Clips that were running when a worker died. Only one of them is usually at
+    # fault, so they are retried one at a time to not lose the others again.
+    retries = []
+    attempts = dict.fromkeys(videos, 0)
+    while queue or retries:
+        # Keep at most one clip per worker in flight, so that when a worker dies
+        # (e.g. killed for running out of memory) only the clips that were running
+        # are lost. They are submitted again to a new pool, and recorded as failed
+        # once they used up their attempts.
+        with ProcessPoolExecutor(
+            args.num_workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=initargs,
+        ) as pool:
+            in_flight = {}
+            broken = False
+            while (queue or retries or in_flight) and not broken:
+                while (retries and not in_flight) or (
+                    queue and not retries and len(in_flight) < args.num_workers
+                ):
+                    video_path = retries.pop() if retries else queue.pop()
+                    attempts[video_path] += 1
+                    in_flight[pool.submit(_evaluate_in_worker, video_path)] = video_path
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    video_path = in_flight.pop(future)
+                    try:
+                        yield future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        in_flight[future] = video_path
+            # Every clip still in flight was lost with the pool.
+            for video_path in in_flight.values():
+                if attempts[video_path] < MAX_CLIP_ATTEMPTS:
+                    print(f"\nWorker died while processing {video_path}, retrying")
+                    retries.append(video_path)
+                else:
+                    print(f"\nWorker died while processing {video_path}, giving up")
+                    yield video_path, None
 
 
 def main():
@@ -254,6 +448,30 @@ def main():
         default="*.mp4",
         help="File pattern for video files (default: *.mp4)",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Number of frame pairs matched per LightGlue forward pass (default: 1)",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda",
+        help="Device for SuperPoint/LightGlue, e.g. cuda, cuda:1 or cpu. A comma-separated "
+        "list assigns workers to devices round-robin (default: cuda)",
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=1,
+        help="Number of worker processes, each loading the models once (default: 1)",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Decode frames on demand instead of loading each whole video in memory",
+    )
     parser.add_argument("--verbose", action="store_true", help="Enable verbose output")
     args = parser.parse_args()
 
@@ -268,27 +486,39 @@ def main():
     # Create output directory
     args.output.mkdir(parents=True, exist_ok=True)
 
+    # Skip clips that a previous run already recorded in the results index
+    index_path = args.output / "results_index.jsonl"
+    previous = load_results_index(index_path)
+    clip_ids = {SimpleClip.from_video_path(v).clip_id for v in videos}
+
+    done = {clip_id for clip_id, record in previous.items() if record["status"] == "ok"}
+    pending = [v for v in videos if SimpleClip.from_video_path(v).clip_id not in done]
+
+    aggregate = AggregateStats()
+    for clip_id in done & clip_ids:
+        aggregate.add(previous[clip_id]["results"])
+
+    if len(pending) < len(videos):
+        print(f"Resuming: {len(videos) - len(pending)} videos already evaluated")
+
     # Process all videos
-    all_results = {}
     failed_videos = []
 
-    with tqdm(videos, desc="Processing videos") as pbar:
-        for video_path in pbar:
-            pbar.set_description(f"Processing {video_path.name}")
-            try:
-                result = evaluate_single_video(video_path, args.output, args.verbose)
-                if result is not None:
-                    clip = SimpleClip.from_video_path(video_path)
-                    all_results[clip.clip_id] = result
-                else:
-                    failed_videos.append(str(video_path))
-            except Exception as e:
-                print(f"\nError processing {video_path}: {e}")
+    with open(index_path, "a") as index_file, tqdm(
+        total=len(pending), desc="Processing videos"
+    ) as pbar:
+        for video_path, result in iter_evaluations(pending, args):
+            pbar.set_description(f"Processed {video_path.name}")
+            pbar.update(1)
+            append_result(index_file, video_path, result)
+            if result is not None:
+                aggregate.add(result)
+            else:
                 failed_videos.append(str(video_path))
 
     # Compute and save aggregate statistics
-    if all_results:
-        stats = compute_aggregate_stats(all_results)
+    if aggregate.num_videos > 0:
+        stats = aggregate.summary()
 
         # Save aggregate stats
         stats_path = args.output / "aggregate_stats.json"
@@ -299,7 +529,7 @@ def main():
         print("\n" + "=" * 60)
         print("EVALUATION SUMMARY")
         print("=" * 60)
-        print(f"Successfully processed: {len(all_results)}/{len(videos)} videos")
+        print(f"Successfully processed: {stats['num_videos']}/{len(videos)} videos")
 
         if "temporal" in stats and "overall" in stats["temporal"]:
             print(f"\nTemporal Sampson Error (TSE):")
@@ -14,15 +14,21 @@
 # limitations under the License.
 
 import argparse
-import gc
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
-from typing import Any, List
+from typing import Any, Iterator, List, Optional, Tuple
 
 import decord
 import numpy as np
 import torch
+from reference_stats import (
+    add_reference_stats_args,
+    reference_stats_key,
+    reference_stats_path,
+    temporary_path,
+)
 from torch.nn.functional import interpolate
 from torchmetrics.image.fid import FrechetInceptionDistance
 from tqdm import tqdm
@@ -32,75 +38,190 @@ from tqdm import tqdm
 decord.bridge.set_bridge("torch")
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
+# Metric states holding the running statistics of the ground truth features.
+REAL_FEATURE_STATES = (
+    "real_features_sum",
+    "real_features_cov_sum",
+    "real_features_num_samples",
+)
 
-@torch.no_grad()
-def compute_fid(
-    pred_images: List[torch.Tensor], gt_images: List[torch.Tensor]
-) -> float:
+
+def decode_video(video_path: str, num_frames: int = None) -> torch.Tensor:
     """
-    Compute FID score between predicted and ground truth images.
+    Decode the frames of a video used for FID computation.
 
     Args:
-        pred_images: List of predicted image tensors
-        gt_images: List of ground truth image tensors
+        video_path: Path to the video file
+        num_frames: Number of frames to extract (None for all frames)
 
     Returns:
-        FID score as float
+        Frame tensor of shape (t, h, w, c)
     """
-    fid = FrechetInceptionDistance(feature=2048, normalize=True).to(device)
-    fid.reset()
+    vr = decord.VideoReader(video_path)
+    num_video_frames = len(vr) if num_frames is None else min(num_frames, len(vr))
+    return vr.get_batch(np.arange(0, num_video_frames))
+
 
-    trunk_size = 512
-    for i in range(0, len(pred_images), trunk_size):
-        fid.update(torch.cat(pred_images[i : i + trunk_size]), real=False)
-        fid.update(torch.cat(gt_images[i : i + trunk_size]), real=True)
+def iter_frame_batches(
+    video_paths: List[str], num_frames: int = None, batch_size: int = 512
+) -> Iterator[torch.Tensor]:
+    """
+    Stream resized frames from videos in fixed-size batches.
 
-    return fid.compute().item()
+    The next video is decoded in a background thread while the frames of the
+    current one are resized and consumed, so only a couple of videos and one
+    batch of frames are held in memory at any time.
 
+    Args:
+        video_paths: List of paths to video files
+        num_frames: Number of frames to extract per video (None for all frames)
+        batch_size: Number of frames per yielded batch
 
-def load_videos_for_fid(
-    video_paths: List[str], num_frames: int = None
-) -> List[torch.Tensor]:
+    Yields:
+        Frame tensors of shape (batch_size, c, 224, 224); the last may be smaller
+    """
+    pending: List[torch.Tensor] = []
+    num_pending = 0
+
+    with ThreadPoolExecutor(max_workers=1) as decoder:
+        next_video = decoder.submit(decode_video, video_paths[0], num_frames)
+        for i in tqdm(range(len(video_paths)), desc="Loading videos"):
+            raw_video = next_video.result()
+            if i + 1 < len(video_paths):
+                next_video = decoder.submit(
+                    decode_video, video_paths[i + 1], num_frames
+                )
+
+            # Convert to torch tensor and move to device
+            # Shape: (t, h, w, c) -> (t, c, h, w)
+            video = raw_video.permute(0, 3, 1, 2).float().to(device)
+            del raw_video
+
+            # Resize to 224x224 for Inception network
+            video = interpolate(video, (224, 224), mode="bilinear", align_corners=False)
+            pending.append(video)
+            num_pending += len(video)
+
+            while num_pending >= batch_size:
+                frames = torch.cat(pending)
+                yield frames[:batch_size]
+                pending = [frames[batch_size:]]
+                num_pending -= batch_size
+
+    if num_pending > 0:
+        yield torch.cat(pending)
+
+
+@torch.no_grad()
+def update_fid(
+    fid: FrechetInceptionDistance,
+    video_paths: List[str],
+    real: bool,
+    num_frames: int = None,
+    batch_size: int = 512,
+) -> int:
     """
-    Load videos and extract frames for FID computation.
+    Accumulate the Inception statistics of a set of videos into a FID metric.
 
     Args:
+        fid: FID metric to update
         video_paths: List of paths to video files
-        num_frames: Number of frames to extract (None for all frames)
+        real: Whether the videos are ground truth (True) or predicted (False)
+        num_frames: Number of frames to use per video (None for all frames)
+        batch_size: Number of frames per Inception forward pass
 
     Returns:
-        List of frame tensors
+        Number of frames accumulated
     """
-    all_images = []
+    total_frames = 0
+    for frames in iter_frame_batches(video_paths, num_frames, batch_size):
+        fid.update(frames, real=real)
+        total_frames += len(frames)
+    return total_frames
 
-    for video_path in tqdm(video_paths, desc="Loading videos"):
-        vr = decord.VideoReader(video_path)
-        frame_idxs = np.arange(0, len(vr))
-        raw_video = vr.get_batch(frame_idxs)
 
-        # Limit frames if specified
-        if num_frames is not None:
-            video = raw_video[:num_frames]
-        else:
-            video = raw_video
+@torch.no_grad()
+def update_fid_reference(
+    fid: FrechetInceptionDistance,
+    gt_video_paths: List[str],
+    num_frames: int = None,
+    batch_size: int = 512,
+    ref_stats_path: Optional[str] = None,
+) -> int:
+    """
+    Accumulate the ground truth statistics into a FID metric.
 
-        # Convert to torch tensor and move to device
-        # Shape: (t, h, w, c) -> (t, c, h, w)
-        video = video.permute(0, 3, 1, 2).float().to(device)
+    The statistics are loaded from `ref_stats_path` if it exists. Otherwise they
+    are computed from the videos and saved there for later runs.
 
-        # Resize to 224x224 for Inception network
-        video = interpolate(video, (224, 224), mode="bilinear", align_corners=False)
+    Args:
+        fid: FID metric to update
+        gt_video_paths: List of paths to ground truth videos
+        num_frames: Number of frames to use per video (None for all frames)
+        batch_size: Number of frames per Inception forward pass
+        ref_stats_path: Cache file of the statistics (None disables caching)
+
+    Returns:
+        Number of ground truth frames
+    """
+    if ref_stats_path is not None and os.path.exists(ref_stats_path):
+        states = torch.load(ref_stats_path, map_location=device)
+        for name in REAL_FEATURE_STATES:
+            setattr(fid, name, states[name])
+        print(f"Loaded ground truth statistics from {ref_stats_path}")
+        return int(fid.real_features_num_samples)
 
-        # Extract individual frames
-        video_images = [frame.unsqueeze(0) for frame in video]
-        all_images.extend(video_images)
+    total_gt_frames = update_fid(fid, gt_video_paths, True, num_frames, batch_size)
 
-        del video, vr
-        gc.collect()
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
+    if ref_stats_path is not None:
+        tmp_path = temporary_path(ref_stats_path)
+        torch.save(
+            {name: getattr(fid, name).cpu() for name in REAL_FEATURE_STATES}, tmp_path
+        )
+        os.replace(tmp_path, ref_stats_path)
+        print(f"Saved ground truth statistics to {ref_stats_path}")
 
-    return all_images
+    return total_gt_frames
+
+
+@torch.no_grad()
+def compute_fid(
+    pred_video_paths: List[str],
+    gt_video_paths: List[str],
+    num_frames: int = None,
+    batch_size: int = 512,
+    ref_stats_path: Optional[str] = None,
+) -> Tuple[float, int, int]:
+    """
+    Compute FID score between predicted and ground truth videos.
+
+    Frames are streamed into the metric, which only keeps running sums of the
+    Inception features, so memory does not grow with the number of videos.
+
+    Args:
+        pred_video_paths: List of paths to predicted videos
+        gt_video_paths: List of paths to ground truth videos
+        num_frames: Number of frames to use per video (None for all frames)
+        batch_size: Number of frames per Inception forward pass
+        ref_stats_path: Cache file of the ground truth statistics (None disables caching)
+
+    Returns:
+        FID score, number of predicted frames and number of ground truth frames
+    """
+    fid = FrechetInceptionDistance(feature=2048, normalize=True).to(device)
+    fid.reset()
+
+    print("\nProcessing ground truth videos...")
+    total_gt_frames = update_fid_reference(
+        fid, gt_video_paths, num_frames, batch_size, ref_stats_path
+    )
+    print(f"Processed {total_gt_frames} frames from GT videos")
+
+    print("\nProcessing predicted videos...")
+    total_pred_frames = update_fid(fid, pred_video_paths, False, num_frames, batch_size)
+    print(f"Processed {total_pred_frames} frames from predicted videos")
+
+    return fid.compute().item(), total_pred_frames, total_gt_frames
 
 
 def main():
@@ -110,8 +231,9 @@ def main():
     parser.add_argument(
         "--pred_video_paths",
         type=str,
-        required=True,
-        help="Path pattern for predicted videos (supports glob patterns, e.g., './path/*.mp4')",
+        default=None,
+        help="Path pattern for predicted videos (supports glob patterns, e.g., './path/*.mp4'). "
+        "Required unless --precompute_ref_stats is set",
     )
     parser.add_argument(
         "--gt_video_paths",
@@ -125,24 +247,57 @@ def main():
         default=None,
         help="Number of frames to use from each video (default: all frames)",
     )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=512,
+        help="Number of frames per Inception forward pass (default: 512)",
+    )
     parser.add_argument(
         "--output_file",
         type=str,
         default="fid_results.json",
         help="Output JSON file for results (default: fid_results.json)",
     )
+    add_reference_stats_args(parser)
 
     args = parser.parse_args()
 
-    # Get video paths
-    pred_video_paths = sorted(glob(args.pred_video_paths))
+    if args.precompute_ref_stats and args.no_ref_stats_cache:
+        parser.error("--precompute_ref_stats cannot be used with --no_ref_stats_cache")
+    if args.pred_video_paths is None and not args.precompute_ref_stats:
+        parser.error("--pred_video_paths is required")
+
+    # Get ground truth video paths
     gt_video_paths = sorted(glob(args.gt_video_paths))
+    if len(gt_video_paths) == 0:
+        raise ValueError(f"No ground truth videos found at: {args.gt_video_paths}")
 
-    # Validate paths
+    ref_stats_path = None
+    if not args.no_ref_stats_cache:
+        key = reference_stats_key(
+            gt_video_paths,
+            metric="fid",
+            feature=2048,
+            normalize=True,
+            num_frames=args.num_frames,
+            target_size=[224, 224],
+        )
+        ref_stats_path = reference_stats_path(args.ref_stats_dir, "fid", key, "pt")
+
+    if args.precompute_ref_stats:
+        print(f"Found {len(gt_video_paths)} ground truth videos")
+        fid = FrechetInceptionDistance(feature=2048, normalize=True).to(device)
+        total_gt_frames = update_fid_reference(
+            fid, gt_video_paths, args.num_frames, args.batch_size, ref_stats_path
+        )
+        print(f"Ground truth statistics of {total_gt_frames} frames are cached")
+        return
+
+    # Get predicted video paths
+    pred_video_paths = sorted(glob(args.pred_video_paths))
     if len(pred_video_paths) == 0:
         raise ValueError(f"No predicted videos found at: {args.pred_video_paths}")
-    if len(gt_video_paths) == 0:
-        raise ValueError(f"No ground truth videos found at: {args.gt_video_paths}")
 
     print(f"Found {len(pred_video_paths)} predicted videos")
     print(f"Found {len(gt_video_paths)} ground truth videos")
@@ -151,19 +306,15 @@ def main():
         pred_video_paths
     ), f"Number of videos mismatch: {len(gt_video_paths)} GT vs {len(pred_video_paths)} predicted"
 
-    # Load ground truth videos
-    print("\nLoading ground truth videos...")
-    gt_images = load_videos_for_fid(gt_video_paths, args.num_frames)
-    print(f"Loaded {len(gt_images)} frames from GT videos")
-
-    # Load predicted videos
-    print("\nLoading predicted videos...")
-    pred_images = load_videos_for_fid(pred_video_paths, args.num_frames)
-    print(f"Loaded {len(pred_images)} frames from predicted videos")
-
     # Compute FID score
     print("\nComputing FID score...")
-    fid_score = compute_fid(pred_images, gt_images)
+    fid_score, total_pred_frames, total_gt_frames = compute_fid(
+        pred_video_paths,
+        gt_video_paths,
+        args.num_frames,
+        args.batch_size,
+        ref_stats_path,
+    )
 
     # Print results
     print("\n" + "=" * 60)
@@ -177,8 +328,8 @@ def main():
         "num_pred_videos": len(pred_video_paths),
         "num_gt_videos": len(gt_video_paths),
         "num_frames_per_video": args.num_frames if args.num_frames else "all",
-        "total_pred_frames": len(pred_images),
-        "total_gt_frames": len(gt_images),
+        "total_pred_frames": total_pred_frames,
+        "total_gt_frames": total_gt_frames,
         "pred_video_pattern": args.pred_video_paths,
         "gt_video_pattern": args.gt_video_paths,
     }
@@ -18,7 +18,7 @@ import gc
 import json
 import os
 from glob import glob
-from typing import Any, List, Tuple
+from typing import Any, List, Optional, Tuple
 
 import decord
 import numpy as np
@@ -26,6 +26,12 @@ import scipy
 import torch
 from cdfvd import fvd
 from einops import rearrange
+from reference_stats import (
+    add_reference_stats_args,
+    reference_stats_key,
+    reference_stats_path,
+    temporary_path,
+)
 from torch.nn.functional import interpolate
 from tqdm import tqdm
 
@@ -35,39 +41,80 @@ decord.bridge.set_bridge("torch")
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
 
+def batch_videos(videos: List[torch.Tensor], batch_size: int) -> List[dict]:
+    """
+    Group video tensors into the batches expected by the FVD evaluator.
+
+    Args:
+        videos: List of video tensors in shape (c, t, h, w)
+        batch_size: Number of videos per batch
+
+    Returns:
+        List of batches of the form {"video": (b, c, t, h, w) tensor}
+    """
+    return [
+        {"video": torch.stack(videos[i : i + batch_size])}
+        for i in range(0, len(videos), batch_size)
+    ]
+
+
+@torch.no_grad()
+def compute_fvd_reference(
+    evaluator: fvd.cdfvd,
+    gt_video_paths: List[str],
+    num_frames: int = None,
+    target_size: Tuple[int, int] = (224, 224),
+    batch_size: int = 8,
+    ref_stats_path: Optional[str] = None,
+) -> None:
+    """
+    Compute the ground truth I3D statistics of an FVD evaluator.
+
+    The statistics are loaded from `ref_stats_path` if it exists. Otherwise they
+    are computed from the videos and saved there for later runs.
+
+    Args:
+        evaluator: FVD evaluator to fill the real statistics of
+        gt_video_paths: List of paths to ground truth videos
+        num_frames: Number of frames to extract (None for all frames)
+        target_size: Target size for resizing frames (height, width)
+        batch_size: Batch size for processing
+        ref_stats_path: Cache file of the statistics (None disables caching)
+    """
+    if ref_stats_path is not None and os.path.exists(ref_stats_path):
+        evaluator.load_real_stats(ref_stats_path)
+        print(f"Loaded ground truth statistics from {ref_stats_path}")
+        return
+
+    videos_real = load_videos_for_fvd(gt_video_paths, num_frames, target_size)
+    print(f"Loaded {len(videos_real)} GT videos")
+    evaluator.compute_real_stats(batch_videos(videos_real, batch_size))
+
+    if ref_stats_path is not None:
+        tmp_path = temporary_path(ref_stats_path)
+        evaluator.save_real_stats(tmp_path)
+        os.replace(tmp_path, ref_stats_path)
+        print(f"Saved ground truth statistics to {ref_stats_path}")
+
+
 @torch.no_grad()
 def compute_fvd(
+    evaluator: fvd.cdfvd,
     videos_fake: List[torch.Tensor],
-    videos_real: List[torch.Tensor],
     batch_size: int = 8,
 ) -> float:
     """
-    Compute FVD score between predicted and ground truth videos.
+    Compute FVD score between predicted videos and the ground truth statistics.
 
     Args:
+        evaluator: FVD evaluator whose real statistics are already computed
         videos_fake: List of predicted video tensors
-        videos_real: List of ground truth video tensors
         batch_size: Batch size for processing
 
     Returns:
         FVD score as float
     """
-    n_batches = (len(videos_fake) - 1) // batch_size + 1
-
-    videos_real_batched = [
-        {"video": torch.stack(videos_real[i * batch_size : (i + 1) * batch_size])}
-        for i in range(n_batches)
-        if i * batch_size < len(videos_real)
-    ]
-    videos_fake_batched = [
-        {"video": torch.stack(videos_fake[i * batch_size : (i + 1) * batch_size])}
-        for i in range(n_batches)
-        if i * batch_size < len(videos_fake)
-    ]
-
-    evaluator = fvd.cdfvd("i3d", n_real="full", n_fake="full", ckpt_path=None)
-    evaluator.compute_real_stats(videos_real_batched)
-    evaluator.compute_fake_stats(videos_fake_batched)
+    evaluator.compute_fake_stats(batch_videos(videos_fake, batch_size))
 
     return evaluator.compute_fvd_from_stats()
 
@@ -127,8 +174,9 @@ def main():
     parser.add_argument(
         "--pred_video_paths",
         type=str,
-        required=True,
-        help="Path pattern for predicted videos (supports glob patterns, e.g., './path/*.mp4')",
+        default=None,
+        help="Path pattern for predicted videos (supports glob patterns, e.g., './path/*.mp4'). "
+        "Required unless --precompute_ref_stats is set",
     )
     parser.add_argument(
         "--gt_video_paths",
@@ -161,18 +209,50 @@ def main():
         default="fvd_results.json",
         help="Output JSON file for results (default: fvd_results.json)",
     )
+    add_reference_stats_args(parser)
 
     args = parser.parse_args()
 
-    # Get video paths
-    pred_video_paths = sorted(glob(args.pred_video_paths))
+    if args.precompute_ref_stats and args.no_ref_stats_cache:
+        parser.error("--precompute_ref_stats cannot be used with --no_ref_stats_cache")
+    if args.pred_video_paths is None and not args.precompute_ref_stats:
+        parser.error("--pred_video_paths is required")
+
+    # Get ground truth video paths
     gt_video_paths = sorted(glob(args.gt_video_paths))
+    if len(gt_video_paths) == 0:
+        raise ValueError(f"No ground truth videos found at: {args.gt_video_paths}")
+
+    ref_stats_path = None
+    if not args.no_ref_stats_cache:
+        key = reference_stats_key(
+            gt_video_paths,
+            metric="fvd",
+            model="i3d",
+            num_frames=args.num_frames,
+            target_size=args.target_size,
+        )
+        ref_stats_path = reference_stats_path(args.ref_stats_dir, "fvd", key, "pkl")
 
-    # Validate paths
+    evaluator = fvd.cdfvd("i3d", n_real="full", n_fake="full", ckpt_path=None)
+
+    if args.precompute_ref_stats:
+        print(f"Found {len(gt_video_paths)} ground truth videos")
+        compute_fvd_reference(
+            evaluator,
+            gt_video_paths,
+            args.num_frames,
+            tuple(args.target_size),
+            args.batch_size,
+            ref_stats_path,
+        )
+        print("Ground truth statistics are cached")
+        return
+
+    # Get predicted video paths
+    pred_video_paths = sorted(glob(args.pred_video_paths))
     if len(pred_video_paths) == 0:
         raise ValueError(f"No predicted videos found at: {args.pred_video_paths}")
-    if len(gt_video_paths) == 0:
-        raise ValueError(f"No ground truth videos found at: {args.gt_video_paths}")
 
     print(f"Found {len(pred_video_paths)} predicted videos")
     print(f"Found {len(gt_video_paths)} ground truth videos")
@@ -181,12 +261,16 @@ def main():
         pred_video_paths
     ), f"Number of videos mismatch: {len(gt_video_paths)} GT vs {len(pred_video_paths)} predicted"
 
-    # Load ground truth videos
-    print("\nLoading ground truth videos...")
-    videos_real = load_videos_for_fvd(
-        gt_video_paths, args.num_frames, tuple(args.target_size)
+    # Ground truth statistics, from the cache if available
+    print("\nProcessing ground truth videos...")
+    compute_fvd_reference(
+        evaluator,
+        gt_video_paths,
+        args.num_frames,
+        tuple(args.target_size),
+        args.batch_size,
+        ref_stats_path,
     )
-    print(f"Loaded {len(videos_real)} GT videos")
 
     # Load predicted videos
     print("\nLoading predicted videos...")
@@ -197,7 +281,7 @@ def main():
 
     # Compute FVD score
     print("\nComputing FVD score...")
-    fvd_score = compute_fvd(videos_fake, videos_real, args.batch_size)
+    fvd_score = compute_fvd(evaluator, videos_fake, args.batch_size)
 
     # Print results
     print("\n" + "=" * 60)
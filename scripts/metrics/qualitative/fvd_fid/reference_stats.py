@@ -0,0 +1,111 @@
+# SPDX-FileCopyrightText: Copyright (c) 2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Content-addressed cache for ground truth (reference) statistics.
+
+The real-side statistics of FID and FVD only depend on the ground truth videos
+and on the preprocessing settings, so they are stored under a key derived from
+the video files (path, size and modification time) and those settings. Any
+change to the ground truth set or to the settings produces a new key.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from typing import Any, List, Optional
+
+DEFAULT_REF_STATS_DIR = os.path.join("~", ".cache", "fvd_fid", "reference_stats")
+
+
+def reference_stats_key(video_paths: List[str], **settings: Any) -> str:
+    """
+    Compute the cache key of the reference statistics of a set of videos.
+
+    Args:
+        video_paths: List of paths to ground truth video files
+        **settings: Metric and preprocessing settings the statistics depend on
+
+    Returns:
+        Hex digest identifying the statistics
+    """
+    files = []
+    for video_path in video_paths:
+        stat = os.stat(video_path)
+        files.append([os.path.abspath(video_path), stat.st_size, stat.st_mtime_ns])
+
+    payload = json.dumps({"files": files, "settings": settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def reference_stats_path(
+    ref_stats_dir: Optional[str], metric: str, key: str, ext: str
+) -> Optional[str]:
+    """
+    Get the file path of cached reference statistics.
+
+    Args:
+        ref_stats_dir: Cache directory (None disables caching)
+        metric: Metric name, used as file name prefix
+        key: Key returned by `reference_stats_key`
+        ext: File extension
+
+    Returns:
+        Path of the cache file, or None if caching is disabled
+    """
+    if ref_stats_dir is None:
+        return None
+    return os.path.join(os.path.expanduser(ref_stats_dir), f"{metric}_{key}.{ext}")
+
+
+def temporary_path(path: str) -> str:
+    """
+    Get a temporary path next to `path` to write to before an atomic rename.
+
+    Args:
+        path: Final path of the file
+
+    Returns:
+        Temporary path in the same directory
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.getpid()}.tmp{ext}"
+
+
+def add_reference_stats_args(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the reference statistics cache options to an argument parser.
+
+    Args:
+        parser: Parser of a metric script
+    """
+    parser.add_argument(
+        "--ref_stats_dir",
+        type=str,
+        default=DEFAULT_REF_STATS_DIR,
+        help=f"Directory for cached ground truth statistics (default: {DEFAULT_REF_STATS_DIR})",
+    )
+    parser.add_argument(
+        "--no_ref_stats_cache",
+        action="store_true",
+        help="Always recompute the ground truth statistics and do not cache them",
+    )
+    parser.add_argument(
+        "--precompute_ref_stats",
+        action="store_true",
+        help="Only compute and cache the ground truth statistics, then exit",
+    )